@@ -1,6 +1,37 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Scripts that run management commands rather than serve requests
+MANAGEMENT_SCRIPTS = ("manage.py", "django-admin", "django-admin.py", "__main__.py", "pytest", "py.test")
+
+
+def serves_requests(argv=None, environ=None):
+    """
+    Whether this process will serve requests: a WSGI/ASGI server, or the
+    runserver process that the autoreloader restarts on changes. Management
+    commands such as test and migrate, the test runners and the autoreloader's
+    watcher process do not.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if not argv or os.path.basename(argv[0]) not in MANAGEMENT_SCRIPTS:
+        return True
+    if len(argv) < 2 or argv[1] != "runserver":
+        return False
+    return "--noreload" in argv or environ.get("RUN_MAIN") == "true"
+
 
 class FmulabConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "fmulab"
+
+    def ready(self):
+        # Register signal receivers
+        from . import signals  # noqa: F401
+
+        from .config import PIPELINE_WARM_START
+        if PIPELINE_WARM_START and serves_requests():
+            from .pipeline import warm_start
+            warm_start()
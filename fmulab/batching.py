@@ -0,0 +1,84 @@
+"""
+Dynamic micro-batching for local model inference
+"""
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from .config import MICRO_BATCH_TIMEOUT
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from concurrent threads and processes them in
+    batches. A background worker takes the first waiting item, then keeps
+    collecting for up to ``max_wait_ms`` or until ``max_batch_size`` items are
+    queued, and passes the batch to ``process_batch``, which must return one
+    result per item in the same order. A batch that yields a different number
+    of results fails every item in it rather than leaving callers waiting.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5.0, name="micro-batcher",
+                 timeout=MICRO_BATCH_TIMEOUT):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(batch):
+                    raise ValueError(f"expected {len(batch)} results, got {len(results)}")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logging.error(f"{self.name} failed to process a batch of {len(items)}: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def submit_async(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit(self, item, timeout=None):
+        """Queue an item and wait for its result, at most ``timeout`` seconds (default: the batcher's)"""
+        return self.submit_async(item).result(self.timeout if timeout is None else timeout)
+
+    def submit_many(self, items, timeout=None):
+        """Queue several items and wait for all results, in order, within one shared ``timeout``"""
+        futures = [self.submit_async(item) for item in items]
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        return [future.result(max(deadline - time.monotonic(), 0)) for future in futures]
@@ -0,0 +1,125 @@
+"""
+Load-test harness for the chat path: drives views through the Django test
+client at a given concurrency and reports latency percentiles and throughput
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import Client
+from django.urls import reverse
+
+from .fakes import AsyncFakeNeo4jConnection, FakeEmbedder, FakeNeo4jConnection, seed_graph
+from .llm_integration import OpenAIProvider, build_http_session
+from .qa_integration import AsyncQAIntegration, QAIntegration
+
+BENCHMARK_QUESTIONS = (
+    "How does water temperature affect salmon growth?",
+    "What does the biofilter do in a recirculating system?",
+    "How is dissolved oxygen related to stocking density?",
+    "Which factors drive mortality in net pens?",
+    "How is the hydrodynamic model coupled in the FMU co-simulation?",
+    "What is the effect of the feeding regime on feed conversion?",
+)
+
+
+def percentile(values, pct):
+    """Percentile of a list of numbers with linear interpolation between ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles in milliseconds and requests per second of one run"""
+    milliseconds = [latency * 1000.0 for latency in latencies]
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(milliseconds, 50),
+        "p95_ms": percentile(milliseconds, 95),
+        "p99_ms": percentile(milliseconds, 99),
+        "max_ms": max(milliseconds) if milliseconds else None,
+    }
+
+
+def run_load(send, requests, concurrency):
+    """
+    Call ``send(i)`` for i in range(requests) from ``concurrency`` threads.
+    ``send`` returns an HTTP status; exceptions and statuses of 400 and above
+    count as errors and are left out of the latency figures.
+    """
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def timed(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = send(i) < 400
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="benchmark") as executor:
+        list(executor.map(timed, range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def build_fake_pipeline(llm_server, documents=10, chunks_per_document=50, query_latency=0.0, pool_size=10):
+    """A QAIntegration on the in-memory graph and the fake LLM server"""
+    embedder = FakeEmbedder()
+    graph = seed_graph(documents=documents, chunks_per_document=chunks_per_document, embedder=embedder)
+    llm = OpenAIProvider(api_key="fake", session=build_http_session(pool_size=pool_size),
+                         base_url=llm_server.base_url)
+    return QAIntegration(FakeNeo4jConnection(graph, query_latency=query_latency), llm, embedder=embedder)
+
+
+def build_fake_async_pipeline(llm_server, documents=10, chunks_per_document=50, query_latency=0.0):
+    """An AsyncQAIntegration on the in-memory graph and the fake LLM server"""
+    embedder = FakeEmbedder()
+    graph = seed_graph(documents=documents, chunks_per_document=chunks_per_document, embedder=embedder)
+    llm = OpenAIProvider(api_key="fake", base_url=llm_server.base_url)
+    return AsyncQAIntegration(AsyncFakeNeo4jConnection(graph, query_latency=query_latency), llm, embedder=embedder)
+
+
+class ViewDriver:
+    """Sends benchmark requests to the views, with one test client (and session) per thread"""
+
+    def __init__(self, host="localhost"):
+        self.host = host
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = Client(HTTP_HOST=self.host)
+        return self._local.client
+
+    def question(self, i):
+        # A request number keeps each question distinct, so exact response cache hits are avoided
+        return f"{BENCHMARK_QUESTIONS[i % len(BENCHMARK_QUESTIONS)]} (#{i})"
+
+    def chat(self, i):
+        response = self.client.post(reverse("fmulab:chat_api"), data=json.dumps({"message": self.question(i)}),
+                                    content_type="application/json")
+        return response.status_code
+
+    def index(self, i):
+        return self.client.get(reverse("fmulab:index")).status_code
+
+    def dashboard(self, i):
+        return self.client.post(reverse("fmulab:dashboard"), data={"exp_desc": self.question(i)}).status_code
+
@@ -0,0 +1,284 @@
+"""
+Resident BERT sequence classifier with dynamic batching
+"""
+import logging
+import os
+import threading
+
+from .batching import MicroBatcher
+from .config import (
+    BERT_MODEL_PATH,
+    BERT_TOKENIZER,
+    BERT_NUM_LABELS,
+    BERT_MAX_LENGTH,
+    BERT_DEVICE,
+    BERT_NUM_THREADS,
+    BERT_MAX_BATCH_SIZE,
+    BERT_BATCH_WAIT_MS,
+    BERT_BUCKET_WIDTH,
+    BERT_BACKEND,
+    BERT_ONNX_DIR,
+    BERT_ONNX_OPSET,
+)
+
+try:
+    import numpy as np
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+except ImportError:  # the classifier is optional; nothing else in the pipeline needs transformers
+    np = None
+    BertConfig = None
+    BertForSequenceClassification = None
+    BertTokenizerFast = None
+
+try:
+    import torch
+except ImportError:  # the onnx backends only need torch to export a checkpoint
+    torch = None
+
+try:
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:  # only needed for the onnx backends
+    onnxruntime = None
+
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def length_buckets(lengths, max_batch_size, width=BERT_BUCKET_WIDTH):
+    """
+    Group sequence positions by length: positions are sorted by length and a
+    new bucket starts when the current one holds ``max_batch_size`` items or
+    the next sequence is more than ``width`` tokens longer than its first one.
+
+    Returns:
+    list: lists of positions into ``lengths``, shortest sequences first
+    """
+    buckets = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        bucket = buckets[-1] if buckets else None
+        if bucket is None or len(bucket) >= max_batch_size or lengths[i] - lengths[bucket[0]] > width:
+            buckets.append([i])
+        else:
+            bucket.append(i)
+    return buckets
+
+
+def pad_bucket(encodings, bucket, pad_token_id):
+    """
+    Int64 arrays of the tokenizer output for the sequences in ``bucket``,
+    padded only to the longest of them.
+    """
+    input_ids = encodings["input_ids"]
+    width = max(len(input_ids[i]) for i in bucket)
+    arrays = {name: np.zeros((len(bucket), width), dtype=np.int64) for name in ONNX_INPUTS}
+    arrays["input_ids"].fill(pad_token_id)
+    for row, i in enumerate(bucket):
+        length = len(input_ids[i])
+        arrays["input_ids"][row, :length] = input_ids[i]
+        arrays["attention_mask"][row, :length] = 1
+        if "token_type_ids" in encodings:
+            arrays["token_type_ids"][row, :length] = encodings["token_type_ids"][i]
+    return arrays
+
+
+def onnx_model_path(model_path, quantized=False, onnx_dir=BERT_ONNX_DIR):
+    """Where the ONNX export of a checkpoint is stored"""
+    name = "model.int8.onnx" if quantized else "model.onnx"
+    if onnx_dir:
+        checkpoint = os.path.basename(os.path.normpath(model_path))
+        return os.path.join(onnx_dir, checkpoint, name)
+    return os.path.join(model_path, name)
+
+
+def export_onnx(model, path, opset=BERT_ONNX_OPSET, quantized=False):
+    """
+    Export a BertForSequenceClassification model to ONNX with dynamic batch
+    and sequence axes, optionally with INT8 dynamically quantized weights.
+    The file is written atomically, so concurrent workers never load a partial export.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fp32_path = path.replace(".int8.onnx", ".onnx") if quantized else path
+    if not os.path.exists(fp32_path):
+        sample = {name: torch.ones((1, 8), dtype=torch.long) for name in ONNX_INPUTS}
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUTS}
+        dynamic_axes["logits"] = {0: "batch"}
+        tmp_path = f"{fp32_path}.{os.getpid()}.tmp"
+        with torch.inference_mode():
+            torch.onnx.export(model, (sample,), tmp_path, input_names=list(ONNX_INPUTS), output_names=["logits"],
+                              dynamic_axes=dynamic_axes, opset_version=opset)
+        os.replace(tmp_path, fp32_path)
+    if quantized and not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+    return path
+
+
+class BertClassifier:
+    """
+    A fine-tuned BertForSequenceClassification checkpoint loaded once and
+    kept in memory. Sentences submitted from concurrent threads are
+    tokenized and classified together under ``torch.inference_mode()``,
+    sorted into length buckets that are each padded only to their longest
+    sentence rather than to the longest in the batch.
+
+    ``backend`` selects the runtime: the FP32 PyTorch model, the same model
+    with INT8 dynamically quantized Linear layers, or an ONNX export of the
+    checkpoint (FP32 or INT8) run by onnxruntime on the CPU. The export is
+    created next to the checkpoint on first use; once it exists the onnx
+    backends never load the PyTorch model and do not need torch at all.
+    """
+
+    def __init__(self, model_path=BERT_MODEL_PATH, tokenizer_name=BERT_TOKENIZER, num_labels=BERT_NUM_LABELS,
+                 max_length=BERT_MAX_LENGTH, device=BERT_DEVICE, max_batch_size=BERT_MAX_BATCH_SIZE,
+                 batch_wait_ms=BERT_BATCH_WAIT_MS, backend=BERT_BACKEND, onnx_dir=BERT_ONNX_DIR):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown BERT backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        if BertTokenizerFast is None:
+            raise ImportError("transformers is required for the BERT classifier. "
+                              "Install it with 'pip install transformers'.")
+        if backend.startswith("onnx"):
+            if onnxruntime is None:
+                raise ImportError("onnxruntime is required for the onnx backends. "
+                                  "Install it with 'pip install onnx onnxruntime'.")
+        elif torch is None:
+            raise ImportError("torch is required for the torch backends. Install it with 'pip install torch'.")
+        if not device:
+            device = "cuda" if backend == "torch" and torch.cuda.is_available() else "cpu"
+        if backend != "torch" and device != "cpu":
+            raise ValueError(f"The {backend} backend runs on the CPU only")
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.model_path = model_path
+        self.tokenizer_name = tokenizer_name
+        self.num_labels = num_labels
+        self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self.device = torch.device(device) if backend.startswith("torch") else device
+        self._tokenizer = None
+        self._runtime = None
+        self._load_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._logits_batch, max_batch_size, batch_wait_ms, name="bert-batcher")
+
+    def _load(self):
+        with self._load_lock:
+            if self._runtime is not None:
+                return
+            logging.info(f"Loading BERT classifier {self.model_path} ({self.backend}) on {self.device}")
+            self._tokenizer = BertTokenizerFast.from_pretrained(self.tokenizer_name)
+            if self.backend.startswith("onnx"):
+                self._runtime = self._load_onnx_session()
+                return
+
+            if BERT_NUM_THREADS:
+                torch.set_num_threads(BERT_NUM_THREADS)
+            model = self._load_torch_model()
+            if self.backend == "torch_int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._runtime = model
+
+    def _load_torch_model(self):
+        model = BertForSequenceClassification.from_pretrained(self.model_path, num_labels=self.num_labels)
+        return model.to(self.device).eval()
+
+    def _load_onnx_session(self):
+        quantized = self.backend == "onnx_int8"
+        path = onnx_model_path(self.model_path, quantized, self.onnx_dir)
+        if not os.path.exists(path):
+            if torch is None:
+                raise ImportError(f"{path} does not exist and torch is required to export it. "
+                                  f"Run the export_bert_onnx command where torch is installed.")
+            logging.info(f"Exporting {self.model_path} to {path}")
+            # The PyTorch model is only needed for the export and is released afterwards
+            export_onnx(self._load_torch_model(), path, quantized=quantized)
+        options = onnxruntime.SessionOptions()
+        if BERT_NUM_THREADS:
+            options.intra_op_num_threads = BERT_NUM_THREADS
+        return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load()
+        return self._tokenizer
+
+    @property
+    def runtime(self):
+        """The PyTorch model or onnxruntime session, loaded on first use"""
+        if self._runtime is None:
+            self._load()
+        return self._runtime
+
+    def _forward(self, arrays):
+        if self.backend.startswith("onnx"):
+            return self.runtime.run(["logits"], arrays)[0].astype(np.float32).tolist()
+
+        tensors = {name: torch.from_numpy(array).to(self.device) for name, array in arrays.items()}
+        with torch.inference_mode():
+            logits = self.runtime(**tensors).logits
+        return logits.float().cpu().tolist()
+
+    def _logits_batch(self, sentences, max_batch_size=None):
+        # Unpadded token ids straight from the fast tokenizer, padded per bucket below
+        encodings = self.tokenizer(list(sentences), truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        results = [None] * len(sentences)
+        for bucket in length_buckets(lengths, max_batch_size or len(sentences)):
+            logits = self._forward(pad_bucket(encodings, bucket, self.tokenizer.pad_token_id))
+            for i, row in zip(bucket, logits):
+                results[i] = row
+        return results
+
+    def logits(self, sentences):
+        """Raw classification logits of each sentence, one list per sentence"""
+        return self.batcher.submit_many(list(sentences))
+
+    def logits_bulk(self, sentences, batch_size=None):
+        """
+        Logits of a large list of sentences, e.g. for offline evaluation. The
+        whole list is sorted into length buckets of up to ``batch_size``
+        sentences and run in the calling thread, bypassing the request batcher.
+        """
+        sentences = list(sentences)
+        if not sentences:
+            return []
+        return self._logits_batch(sentences, batch_size or self.max_batch_size)
+
+    @staticmethod
+    def _labels(logits):
+        return [max(range(len(row)), key=row.__getitem__) for row in logits]
+
+    def predict_many(self, sentences):
+        """Predicted label index of each sentence"""
+        return self._labels(self.logits(sentences))
+
+    def predict_bulk(self, sentences, batch_size=None):
+        """Predicted label index of each sentence of a large list"""
+        return self._labels(self.logits_bulk(sentences, batch_size))
+
+    def predict(self, sentence):
+        """Predicted label index of a single sentence"""
+        return self.predict_many([sentence])[0]
+
+    def warm_up(self):
+        """Load the model ahead of the first request"""
+        self.predict("warm up")
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_bert_classifier(model_path=BERT_MODEL_PATH, num_labels=BERT_NUM_LABELS, max_length=BERT_MAX_LENGTH,
+                        backend=BERT_BACKEND):
+    """Return the process-wide classifier for a checkpoint and backend, creating it on first use"""
+    key = (model_path, num_labels, max_length, backend)
+    classifier = _classifiers.get(key)
+    if classifier is None:
+        with _classifiers_lock:
+            classifier = _classifiers.get(key)
+            if classifier is None:
+                classifier = _classifiers[key] = BertClassifier(model_path, num_labels=num_labels,
+                                                                max_length=max_length, backend=backend)
+    return classifier
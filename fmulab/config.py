@@ -11,15 +11,129 @@ NEO4J_DATABASE = os.environ.get("NEO4J_DATABASE", "neo4j")
 ENABLE_USER_AGENT = os.environ.get("ENABLE_USER_AGENT", "False").lower() in ("true", "1", "yes")
 NEO4J_USER_AGENT = os.environ.get("NEO4J_USER_AGENT", "neo4j-python/4.4.0")
 
+# Neo4j driver connection pool; size it to the number of threads issuing queries
+# (web server threads plus RETRIEVAL_MAX_WORKERS). Django settings of the same
+# name take precedence.
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.environ.get("NEO4J_MAX_CONNECTION_POOL_SIZE", "100"))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.environ.get("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))  # seconds
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.environ.get("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))  # seconds
+# Idle time after which a pooled connection is checked before reuse; unset disables the check
+NEO4J_LIVENESS_CHECK_TIMEOUT = (float(os.environ["NEO4J_LIVENESS_CHECK_TIMEOUT"])
+                                if os.environ.get("NEO4J_LIVENESS_CHECK_TIMEOUT") else None)
+
+# QA pipeline lifecycle
+# Build the pipeline and start the health checks when the app loads in a process that
+# serves requests. Management commands (test, migrate, ...) and the autoreloader's
+# watcher process skip it; see fmulab.apps.serves_requests.
+PIPELINE_WARM_START = os.environ.get("PIPELINE_WARM_START", "True").lower() in ("true", "1", "yes")
+PIPELINE_HEALTH_CHECK_INTERVAL = int(os.environ.get("PIPELINE_HEALTH_CHECK_INTERVAL", "60"))  # seconds
+# EXPLAIN every registered query during the warm start so their plans are cached
+QUERY_PLAN_WARM_UP = os.environ.get("QUERY_PLAN_WARM_UP", "True").lower() in ("true", "1", "yes")
+
+# Instrumentation: per-stage timings in a Server-Timing response header and the
+# Prometheus metrics view. Both expose internal timings and the metrics view is
+# unauthenticated, so both are off by default; only enable the metrics view where
+# /metrics/ is reachable from the internal network alone.
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "False").lower() in ("true", "1", "yes")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "False").lower() in ("true", "1", "yes")
+
 # LLM settings
 DEFAULT_LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "openai")  # openai or azure
 DEFAULT_LLM_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
 DEFAULT_MAX_TOKENS = int(os.environ.get("MAX_TOKENS", "1000"))
 DEFAULT_TEMPERATURE = float(os.environ.get("TEMPERATURE", "0.0"))
 
+# Token budget for the graph context in LLM prompts, per model. The rest of the
+# model window is left for the system prompt, question and answer.
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 2500,
+    "gpt-3.5-turbo-16k": 10000,
+    "gpt-4": 5000,
+    "gpt-4-32k": 24000,
+    "gpt-4-turbo": 24000,
+    "gpt-4o": 24000,
+    "gpt-4o-mini": 24000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2500"))
+
+# LLM HTTP connection settings
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "10"))  # keep-alive connections per host
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_FACTOR = float(os.environ.get("LLM_BACKOFF_FACTOR", "0.5"))  # seconds, doubled per retry
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "30"))
+LLM_RETRY_STATUSES = (429, 500, 502, 503, 504)
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "30"))
+
+# Local query embedding model (sentence-transformers, runs on CPU)
+EMBEDDING_ENABLED = os.environ.get("EMBEDDING_ENABLED", "True").lower() in ("true", "1", "yes")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "384"))
+EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "cpu")
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))  # cached query embeddings
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "5"))
+# Longest a caller waits for a micro-batched result before giving up
+MICRO_BATCH_TIMEOUT = float(os.environ.get("MICRO_BATCH_TIMEOUT", "30"))  # seconds
+
+# Fine-tuned BERT sequence classifier (predict_bert), kept resident per process
+BERT_MODEL_PATH = os.environ.get("BERT_MODEL_PATH", "./checkpoint-3000")
+BERT_TOKENIZER = os.environ.get("BERT_TOKENIZER", "bert-base-uncased")
+BERT_NUM_LABELS = int(os.environ.get("BERT_NUM_LABELS", "5"))
+BERT_MAX_LENGTH = int(os.environ.get("BERT_MAX_LENGTH", "512"))
+BERT_DEVICE = os.environ.get("BERT_DEVICE", "")  # empty: cuda when available for the torch backend, else cpu
+BERT_NUM_THREADS = int(os.environ.get("BERT_NUM_THREADS", "0"))  # torch intra-op threads, 0 keeps the default
+BERT_MAX_BATCH_SIZE = int(os.environ.get("BERT_MAX_BATCH_SIZE", "32"))
+BERT_BATCH_WAIT_MS = float(os.environ.get("BERT_BATCH_WAIT_MS", "5"))
+# Sentences are sorted by token length and padded per bucket; a bucket spans at most
+# this many tokens between its shortest and longest sentence
+BERT_BUCKET_WIDTH = int(os.environ.get("BERT_BUCKET_WIDTH", "16"))
+# Runtime for the classifier: "torch" (FP32), "torch_int8" (dynamically quantized
+# Linear layers), "onnx" or "onnx_int8" (onnxruntime, CPU only)
+BERT_BACKEND = os.environ.get("BERT_BACKEND", "torch")
+# Exported ONNX models are written here, default: next to the checkpoint
+BERT_ONNX_DIR = os.environ.get("BERT_ONNX_DIR", "")
+BERT_ONNX_OPSET = int(os.environ.get("BERT_ONNX_OPSET", "14"))
+
+# Response cache settings (backed by Django's cache framework)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "True").lower() in ("true", "1", "yes")
+RESPONSE_CACHE_ALIAS = os.environ.get("RESPONSE_CACHE_ALIAS", "default")
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "3600"))  # seconds
+# Cosine similarity above which a differently worded query reuses a cached answer
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+# Most recently used queries kept per document set/model for similarity lookups
+RESPONSE_CACHE_MAX_SIMILAR_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_SIMILAR_ENTRIES", "200"))
+
+# Conversation memory (backed by Django's cache, shared across workers)
+CHAT_MEMORY_CACHE_ALIAS = os.environ.get("CHAT_MEMORY_CACHE_ALIAS", "default")
+CHAT_MEMORY_TTL = int(os.environ.get("CHAT_MEMORY_TTL", "86400"))  # idle seconds before a session is forgotten
+CHAT_MEMORY_MAX_MESSAGES = int(os.environ.get("CHAT_MEMORY_MAX_MESSAGES", "10"))  # recent messages kept verbatim
+CHAT_MEMORY_SUMMARIZE = os.environ.get("CHAT_MEMORY_SUMMARIZE", "True").lower() in ("true", "1", "yes")
+CHAT_MEMORY_SUMMARY_MAX_CHARS = int(os.environ.get("CHAT_MEMORY_SUMMARY_MAX_CHARS", "1500"))
+CHAT_MEMORY_MESSAGE_MAX_CHARS = int(os.environ.get("CHAT_MEMORY_MESSAGE_MAX_CHARS", "1000"))  # per message in prompts
+
+# Completed-document catalogue cache
+DOCUMENT_CATALOGUE_CACHE_ALIAS = os.environ.get("DOCUMENT_CATALOGUE_CACHE_ALIAS", "default")
+DOCUMENT_CATALOGUE_TTL = int(os.environ.get("DOCUMENT_CATALOGUE_TTL", "300"))  # seconds
+
 # Graph chunk limit for queries
 GRAPH_CHUNK_LIMIT = int(os.environ.get("GRAPH_CHUNK_LIMIT", "50"))
 
+# Graph API pagination and response compression
+GRAPH_PAGE_SIZE = int(os.environ.get("GRAPH_PAGE_SIZE", "50"))  # chunks per page
+GRAPH_MAX_PAGE_SIZE = int(os.environ.get("GRAPH_MAX_PAGE_SIZE", "500"))
+GRAPH_NEIGHBOR_LIMIT = int(os.environ.get("GRAPH_NEIGHBOR_LIMIT", "100"))  # relationships per expansion
+GRAPH_MAX_NEIGHBOR_LIMIT = int(os.environ.get("GRAPH_MAX_NEIGHBOR_LIMIT", "1000"))
+GRAPH_COMPRESS_MIN_BYTES = int(os.environ.get("GRAPH_COMPRESS_MIN_BYTES", "1024"))  # smaller bodies sent as-is
+
+# Precomputed per-document graph snapshots, stored as zlib-compressed JSON
+GRAPH_SNAPSHOTS_ENABLED = os.environ.get("GRAPH_SNAPSHOTS_ENABLED", "True").lower() in ("true", "1", "yes")
+GRAPH_SNAPSHOT_DIR = os.environ.get(
+    "GRAPH_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "graph_snapshots")
+)
+GRAPH_SNAPSHOT_COMPRESSION_LEVEL = int(os.environ.get("GRAPH_SNAPSHOT_COMPRESSION_LEVEL", "6"))
+
 # Chat modes - based on the original constants.py
 CHAT_DEFAULT_MODE = "graph_vector_fulltext"  # Default from original code
 CHAT_VECTOR_MODE = "vector"
@@ -31,8 +145,26 @@ CHAT_GLOBAL_VECTOR_FULLTEXT_MODE = "global_vector"
 CHAT_GRAPH_MODE = "graph"
 CHAT_SIMULATION_MODE = "simulation_science"
 
+# Intent routing in front of retrieval: trivial intents get canned answers, the
+# rest are sent to the chat mode that suits them
+INTENT_ROUTING_ENABLED = os.environ.get("INTENT_ROUTING_ENABLED", "False").lower() in ("true", "1", "yes")
+# Optional fine-tuned BERT intent classifier; without it intents come from rules only
+INTENT_CLASSIFIER_PATH = os.environ.get("INTENT_CLASSIFIER_PATH", "")
+# Intent of each classifier label index, in label order
+INTENT_CLASSIFIER_LABELS = os.environ.get(
+    "INTENT_CLASSIFIER_LABELS", "greeting,thanks,farewell,help,off_topic,factual,relational,overview"
+).split(",")
+# Softmax probability below which the classifier's intent is ignored in favour of the rules
+INTENT_MIN_CONFIDENCE = float(os.environ.get("INTENT_MIN_CONFIDENCE", "0.7"))
+INTENT_MODES = {
+    "factual": CHAT_VECTOR_GRAPH_FULLTEXT_MODE,
+    "keyword": CHAT_FULLTEXT_MODE,
+    "relational": CHAT_ENTITY_VECTOR_MODE,
+    "overview": CHAT_GLOBAL_VECTOR_FULLTEXT_MODE,
+}
+
 # This is the main GRAPH_QUERY used by get_graph_for_documents
-# Directly from original constants.py
+# Directly from original constants.py, with the chunk limit as a parameter
 GRAPH_QUERY = """
 MATCH docs = (d:Document) 
 WHERE d.fileName IN $document_names
@@ -40,11 +172,11 @@ WITH docs, d
 ORDER BY d.createdAt DESC
 
 // Fetch chunks for documents, currently with limit
-CALL {{
+CALL {
   WITH d
   OPTIONAL MATCH chunks = (d)<-[:PART_OF|FIRST_CHUNK]-(c:Chunk)
-  RETURN c, chunks LIMIT {graph_chunk_limit}
-}}
+  RETURN c, chunks LIMIT $graph_chunk_limit
+}
 
 WITH collect(distinct docs) AS docs, 
      collect(distinct chunks) AS chunks, 
@@ -57,16 +189,16 @@ WITH *,
        WHERE other IN selectedChunks | p]] AS chunkRels
 
 // Fetch entities and relationships between entities
-CALL {{
+CALL {
   WITH selectedChunks
   UNWIND selectedChunks AS c
   OPTIONAL MATCH entities = (c:Chunk)-[:HAS_ENTITY]->(e)
   OPTIONAL MATCH entityRels = (e)--(e2:!Chunk) 
-  WHERE exists {{
+  WHERE exists {
     (e2)<-[:HAS_ENTITY]-(other) WHERE other IN selectedChunks
-  }}
+  }
   RETURN entities, entityRels, collect(DISTINCT e) AS entity
-}}
+}
 
 WITH docs, chunks, chunkRels, 
      collect(entities) AS entities, 
@@ -75,36 +207,71 @@ WITH docs, chunks, chunkRels,
 
 WITH *
 
-CALL {{
+CALL {
   WITH entity
   UNWIND entity AS n
   OPTIONAL MATCH community = (n:__Entity__)-[:IN_COMMUNITY]->(p:__Community__)
   OPTIONAL MATCH parentcommunity = (p)-[:PARENT_COMMUNITY*]->(p2:__Community__) 
   RETURN collect(community) AS communities, 
          collect(parentcommunity) AS parentCommunities
-}}
+}
 
 WITH apoc.coll.flatten(docs + chunks + chunkRels + entities + entityRels + communities + parentCommunities, true) AS paths
 
 // Distinct nodes and relationships
-CALL {{
+CALL {
   WITH paths 
   UNWIND paths AS path 
   UNWIND nodes(path) AS node 
   WITH distinct node 
-  RETURN collect(node /* {{.*, labels:labels(node), elementId:elementId(node), embedding:null, text:null}} */) AS nodes 
-}}
+  RETURN collect(node /* {.*, labels:labels(node), elementId:elementId(node), embedding:null, text:null} */) AS nodes 
+}
 
-CALL {{
+CALL {
   WITH paths 
   UNWIND paths AS path 
   UNWIND relationships(path) AS rel 
   RETURN collect(distinct rel) AS rels 
-}}  
+}  
 
 RETURN nodes, rels
 """
 
+# One page of a document graph: chunks in keyset order of their id, each
+# with its document, its entities and the relationships among those entities
+GRAPH_CHUNK_PAGE_QUERY = """
+MATCH part = (c:Chunk)-[:PART_OF]->(d:Document)
+WHERE d.fileName IN $document_names AND ($cursor IS NULL OR c.id > $cursor)
+WITH c, part
+ORDER BY c.id
+LIMIT $page_size
+CALL {
+  WITH c
+  OPTIONAL MATCH mention = (c)-[:HAS_ENTITY]->(e)
+  RETURN collect(mention) AS mentions
+}
+CALL {
+  WITH c
+  OPTIONAL MATCH (c)-[:HAS_ENTITY]->(e)-[r]->(e2)<-[:HAS_ENTITY]-(c)
+  RETURN collect(DISTINCT r) AS entityRels
+}
+RETURN c.id AS chunk_id,
+       nodes(part) + [m IN mentions | last(nodes(m))] AS nodes,
+       relationships(part) + [m IN mentions | relationships(m)[0]] + entityRels AS rels
+"""
+
+# Incremental expansion of one node: its relationships in keyset order
+GRAPH_NEIGHBORS_QUERY = """
+MATCH (n)
+WHERE elementId(n) = $element_id
+OPTIONAL MATCH (n)-[r]-(m)
+WHERE $cursor IS NULL OR elementId(r) > $cursor
+WITH n, r, m
+ORDER BY elementId(r)
+LIMIT $limit
+RETURN elementId(r) AS rel_id, [n, m] AS nodes, [r] AS rels
+"""
+
 # Search query templates
 VECTOR_SEARCH_QUERY = """
 WITH node AS chunk, score
@@ -146,28 +313,158 @@ VECTOR_GRAPH_SEARCH_ENTITY_QUERY = """
     OPTIONAL MATCH (chunk)-[:HAS_ENTITY]->(e)
     WITH e, count(*) AS numChunks 
     ORDER BY numChunks DESC 
-    LIMIT {no_of_entites}
+    LIMIT $no_of_entities
 
     WITH 
     CASE 
-        WHEN e.embedding IS NULL OR ({embedding_match_min} <= vector.similarity.cosine($embedding, e.embedding) AND vector.similarity.cosine($embedding, e.embedding) <= {embedding_match_max}) THEN 
-            collect {{
-                OPTIONAL MATCH path=(e)(()-[rels:!HAS_ENTITY&!PART_OF]-()){{0,1}}(:!Chunk&!Document&!__Community__) 
-                RETURN path LIMIT {entity_limit_minmax_case}
-            }}
-        WHEN e.embedding IS NOT NULL AND vector.similarity.cosine($embedding, e.embedding) >  {embedding_match_max} THEN
-            collect {{
-                OPTIONAL MATCH path=(e)(()-[rels:!HAS_ENTITY&!PART_OF]-()){{0,2}}(:!Chunk&!Document&!__Community__) 
-                RETURN path LIMIT {entity_limit_max_case} 
-            }} 
+        WHEN e.embedding IS NULL OR ($embedding_match_min <= vector.similarity.cosine($embedding, e.embedding) AND vector.similarity.cosine($embedding, e.embedding) <= $embedding_match_max) THEN 
+            collect {
+                OPTIONAL MATCH path=(e)(()-[rels:!HAS_ENTITY&!PART_OF]-()){0,1}(:!Chunk&!Document&!__Community__) 
+                RETURN path LIMIT $entity_limit_minmax_case
+            }
+        WHEN e.embedding IS NOT NULL AND vector.similarity.cosine($embedding, e.embedding) >  $embedding_match_max THEN
+            collect {
+                OPTIONAL MATCH path=(e)(()-[rels:!HAS_ENTITY&!PART_OF]-()){0,2}(:!Chunk&!Document&!__Community__) 
+                RETURN path LIMIT $entity_limit_max_case 
+            } 
         ELSE 
-            collect {{ 
+            collect { 
                 MATCH path=(e) 
                 RETURN path 
-            }}
+            }
     END AS paths, e
 """
 
+# Substring search used by QAIntegration.retrieve_chunks
+CHUNK_TEXT_SEARCH_QUERY = """
+MATCH (d:Document)<-[:PART_OF]-(c:Chunk)
+WHERE toLower(c.text) CONTAINS toLower($query_text)
+RETURN c, d.fileName AS fileName
+LIMIT $limit
+"""
+
+CHUNK_TEXT_DOCUMENT_SEARCH_QUERY = """
+MATCH (d:Document)
+WHERE d.fileName IN $document_names
+MATCH (d)<-[:PART_OF]-(c:Chunk)
+WHERE c.text CONTAINS $query_text
+RETURN c, d.fileName AS fileName
+LIMIT $limit
+"""
+
+# Index lookups used by QAIntegration.retrieve_graph_context. Each returns the
+# element ids and scores of the top matches; the context queries below then
+# expand only those nodes.
+VECTOR_INDEX_SEARCH_QUERY = """
+CALL db.index.vector.queryNodes($index_name, $candidates, $embedding)
+YIELD node, score
+RETURN elementId(node) AS element_id, score
+"""
+
+VECTOR_INDEX_DOCUMENT_SEARCH_QUERY = """
+CALL db.index.vector.queryNodes($index_name, $candidates, $embedding)
+YIELD node, score
+MATCH (node)-[:PART_OF]->(d:Document)
+WHERE d.fileName IN $document_names
+RETURN elementId(node) AS element_id, score
+ORDER BY score DESC
+LIMIT $top_k
+"""
+
+# Exact vector search over the chunks of a few selected documents. A document
+# shard uses it when the vector index would need too many candidates to hold
+# top_k of its chunks, so a narrow selection never comes back empty.
+VECTOR_DOCUMENT_EXACT_SEARCH_QUERY = """
+MATCH (d:Document)<-[:PART_OF]-(node:Chunk)
+WHERE d.fileName IN $document_names AND node.embedding IS NOT NULL
+WITH node, vector.similarity.cosine(node.embedding, $embedding) AS score
+ORDER BY score DESC
+LIMIT $top_k
+RETURN elementId(node) AS element_id, score
+"""
+
+FULLTEXT_INDEX_SEARCH_QUERY = """
+CALL db.index.fulltext.queryNodes($keyword_index, $query_text, {limit: $candidates})
+YIELD node, score
+RETURN elementId(node) AS element_id, score
+"""
+
+FULLTEXT_INDEX_DOCUMENT_SEARCH_QUERY = """
+CALL db.index.fulltext.queryNodes($keyword_index, $query_text, {limit: $candidates})
+YIELD node, score
+MATCH (node)-[:PART_OF]->(d:Document)
+WHERE d.fileName IN $document_names
+RETURN elementId(node) AS element_id, score
+ORDER BY score DESC
+LIMIT $top_k
+"""
+
+# Context expansion for the matched nodes, per node label of the searched index
+CHUNK_CONTEXT_QUERY = """
+UNWIND $hits AS hit
+MATCH (c:Chunk) WHERE elementId(c) = hit.element_id
+MATCH (c)-[:PART_OF]->(d:Document)
+OPTIONAL MATCH (c)-[:HAS_ENTITY]->(e)
+OPTIONAL MATCH (e)-[r]-(other:__Entity__)
+WITH c, d, hit,
+     collect(DISTINCT e.id) AS entities,
+     collect(DISTINCT type(r) + ': ' + other.id) AS relationships
+RETURN c.text AS chunk_text,
+       d.fileName AS source,
+       hit.score AS score,
+       entities[0..$entity_limit] AS entities,
+       relationships[0..$entity_limit] AS relationships
+ORDER BY score DESC
+"""
+
+ENTITY_CONTEXT_QUERY = """
+UNWIND $hits AS hit
+MATCH (e:__Entity__) WHERE elementId(e) = hit.element_id
+OPTIONAL MATCH (e)<-[:HAS_ENTITY]-(:Chunk)-[:PART_OF]->(d:Document)
+OPTIONAL MATCH (e)-[r]-(other:__Entity__)
+WITH e, hit,
+     collect(DISTINCT d.fileName) AS sources,
+     collect(DISTINCT type(r) + ': ' + other.id) AS relationships
+RETURN coalesce(e.description, e.id) AS chunk_text,
+       coalesce(head(sources), 'Knowledge graph') AS source,
+       hit.score AS score,
+       [e.id] AS entities,
+       relationships[0..$entity_limit] AS relationships
+ORDER BY score DESC
+"""
+
+COMMUNITY_CONTEXT_QUERY = """
+UNWIND $hits AS hit
+MATCH (p:__Community__) WHERE elementId(p) = hit.element_id
+OPTIONAL MATCH (e:__Entity__)-[:IN_COMMUNITY]->(p)
+WITH p, hit, collect(DISTINCT e.id) AS entities
+RETURN p.summary AS chunk_text,
+       coalesce(p.title, 'Community ' + p.id) AS source,
+       hit.score AS score,
+       entities[0..$entity_limit] AS entities,
+       [] AS relationships
+ORDER BY score DESC
+"""
+
+# Node label of the searched index -> context expansion query
+CONTEXT_QUERY_BY_LABEL = {
+    "Chunk": CHUNK_CONTEXT_QUERY,
+    "__Entity__": ENTITY_CONTEXT_QUERY,
+    "__Community__": COMMUNITY_CONTEXT_QUERY,
+}
+
+# Candidates fetched per top_k result when index hits are filtered by document
+RETRIEVAL_DOCUMENT_FILTER_OVERSAMPLE = int(os.environ.get("RETRIEVAL_DOCUMENT_FILTER_OVERSAMPLE", "4"))
+
+# Hybrid (vector + fulltext) retrieval
+RRF_K = int(os.environ.get("RRF_K", "60"))  # reciprocal-rank fusion damping constant
+RETRIEVAL_MAX_WORKERS = int(os.environ.get("RETRIEVAL_MAX_WORKERS", "8"))  # concurrent Neo4j lookups
+
+# Document-filtered vector search fans out over shards of this many documents
+RETRIEVAL_SHARD_SIZE = int(os.environ.get("RETRIEVAL_SHARD_SIZE", "25"))
+# A shard whose filtered index lookup would need more candidates than this searches its documents exactly
+RETRIEVAL_MAX_CANDIDATES = int(os.environ.get("RETRIEVAL_MAX_CANDIDATES", "1000"))
+
 # Constants for vector graph search
 VECTOR_GRAPH_SEARCH_ENTITY_LIMIT = 40
 VECTOR_GRAPH_SEARCH_EMBEDDING_MIN_MATCH = 0.3
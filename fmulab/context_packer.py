@@ -0,0 +1,158 @@
+"""
+Token-budgeted assembly of graph context for LLM prompts
+"""
+import logging
+
+from .config import CONTEXT_TOKEN_BUDGETS, DEFAULT_CONTEXT_TOKEN_BUDGET
+
+try:
+    import tiktoken
+except ImportError:  # fall back to an approximate count
+    tiktoken = None
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Below this many free tokens a chunk is skipped rather than truncated
+MIN_TRUNCATED_CHUNK_TOKENS = 64
+
+
+def format_context_part(source, text, entities=None, relationships=None):
+    """Format one retrieved chunk with its entities and relationships for the prompt"""
+    context_part = f"Source: {source}\n\nContent: {text}\n"
+
+    if entities:
+        context_part += "\nEntities: " + ", ".join(entities)
+
+    if relationships:
+        context_part += "\nRelationships: " + ", ".join(relationships)
+
+    return context_part
+
+
+def context_budget_for_model(model_name):
+    """Context token budget for a model, matching the longest configured name prefix"""
+    for name in sorted(CONTEXT_TOKEN_BUDGETS, key=len, reverse=True):
+        if model_name and model_name.startswith(name):
+            return CONTEXT_TOKEN_BUDGETS[name]
+    return DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+class TokenCounter:
+    """
+    Counts tokens with the model's tiktoken encoding. Without tiktoken the
+    count is approximated as one token per four characters.
+    """
+
+    def __init__(self, model_name=None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except Exception:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def truncate(self, text, max_tokens):
+        """Cut text down to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+
+
+class PackedContext:
+    """Result of packing retrieved records into a token budget"""
+
+    def __init__(self, parts, sources, tokens_used, token_budget, records_used, records_total):
+        self.parts = parts
+        self.sources = sources
+        self.tokens_used = tokens_used
+        self.token_budget = token_budget
+        self.records_used = records_used
+        self.records_total = records_total
+
+    @property
+    def text(self):
+        return CONTEXT_SEPARATOR.join(self.parts)
+
+    def metadata(self):
+        return {
+            "context_tokens": self.tokens_used,
+            "context_token_budget": self.token_budget,
+            "context_records": self.records_used,
+            "context_records_retrieved": self.records_total,
+        }
+
+
+class ContextPacker:
+    """
+    Packs retrieved graph records into a token budget. Records are ranked by
+    retrieval score; chunk text is admitted first, best record first,
+    truncating the last chunk that only partly fits. The remaining budget is
+    then spent on entities and finally relationships, in the same order.
+    """
+
+    def __init__(self, model_name=None, token_budget=None):
+        self.counter = TokenCounter(model_name)
+        self.token_budget = token_budget or context_budget_for_model(model_name)
+
+    def pack(self, records):
+        """
+        Pack records (dicts with chunk_text, source, score, entities and
+        relationships) into a PackedContext.
+        """
+        ranked = sorted(records, key=lambda record: record.get("score") or 0.0, reverse=True)
+        separator_tokens = self.counter.count(CONTEXT_SEPARATOR)
+        remaining = self.token_budget
+        selected = []
+
+        for record in ranked:
+            source = record.get("source") or "Unknown"
+            text = record.get("chunk_text") or ""
+            cost = self.counter.count(format_context_part(source, text)) + (separator_tokens if selected else 0)
+
+            if cost > remaining:
+                overhead = cost - self.counter.count(text)
+                if remaining - overhead < MIN_TRUNCATED_CHUNK_TOKENS:
+                    break
+                text = self.counter.truncate(text, remaining - overhead)
+                cost = remaining
+
+            selected.append({"source": source, "text": text, "entities": [], "relationships": []})
+            remaining -= cost
+            if remaining <= 0:
+                break
+
+        for field in ("entities", "relationships"):
+            for item, record in zip(selected, ranked):
+                for value in record.get(field) or []:
+                    if value is None:
+                        continue
+                    # The label ("Entities: ") is charged with the first value
+                    cost = self.counter.count(", " + value) + (4 if not item[field] else 0)
+                    if cost > remaining:
+                        break
+                    item[field].append(value)
+                    remaining -= cost
+
+        parts = [format_context_part(item["source"], item["text"], item["entities"], item["relationships"])
+                 for item in selected]
+        sources = []
+        for item in selected:
+            if item["source"] not in sources:
+                sources.append(item["source"])
+
+        tokens_used = self.counter.count(CONTEXT_SEPARATOR.join(parts))
+        if len(selected) < len(ranked):
+            logging.info(f"Context packed {len(selected)} of {len(ranked)} records into "
+                         f"{tokens_used}/{self.token_budget} tokens")
+
+        return PackedContext(parts, sources, tokens_used, self.token_budget, len(selected), len(ranked))
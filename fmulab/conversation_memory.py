@@ -0,0 +1,119 @@
+"""
+Bounded per-session conversation memory for multi-turn prompts
+"""
+import re
+import logging
+from django.core.cache import caches
+
+from .config import (
+    CHAT_MEMORY_CACHE_ALIAS,
+    CHAT_MEMORY_TTL,
+    CHAT_MEMORY_MAX_MESSAGES,
+    CHAT_MEMORY_SUMMARIZE,
+    CHAT_MEMORY_SUMMARY_MAX_CHARS,
+    CHAT_MEMORY_MESSAGE_MAX_CHARS,
+)
+
+
+def summarize_turns(summary, messages, max_chars=CHAT_MEMORY_SUMMARY_MAX_CHARS):
+    """
+    Cheap extractive summary of turns dropped from the memory window: the
+    first sentence of each message is appended to the running summary, which
+    keeps only its most recent ``max_chars`` characters.
+    """
+    lines = [summary] if summary else []
+    for message in messages:
+        first_sentence = re.split(r"(?<=[.!?])\s", message["content"].strip(), maxsplit=1)[0]
+        lines.append(f"{message['role'].capitalize()}: {first_sentence[:200]}")
+    return "\n".join(lines)[-max_chars:]
+
+
+# Words that point back at earlier turns, e.g. "what about its oxygen demand?"
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(and|but|so|also|then)\b|"
+    r"\b(it|its|it's|they|them|their|this|these|those|he|she|his|her|above|previous|earlier|same|else|"
+    r"again|that one|what about|how about)\b"
+)
+# Messages this short ("why?", "in RAS?") only make sense in context
+FOLLOW_UP_MAX_WORDS = 3
+
+
+def is_follow_up(query):
+    """
+    Whether the query depends on the conversation so far. Self-contained
+    questions can be answered, and cached, as if asked in a new session.
+    """
+    text = query.lower()
+    return len(text.split()) <= FOLLOW_UP_MAX_WORDS or bool(FOLLOW_UP_PATTERN.search(text))
+
+
+class ConversationMemory:
+    """
+    Recent messages per chat session, kept in Django's cache so every worker
+    sees the same conversation. Each session keeps at most ``max_messages``
+    messages verbatim; older turns are folded into a short summary (or
+    dropped when ``summarizer`` is None). Sessions expire after ``timeout``
+    idle seconds, and the cache backend evicts least recently used sessions
+    once it is full (locmem's MAX_ENTRIES, Redis maxmemory-policy).
+    """
+
+    def __init__(self, cache_alias=CHAT_MEMORY_CACHE_ALIAS, max_messages=CHAT_MEMORY_MAX_MESSAGES,
+                 timeout=CHAT_MEMORY_TTL, summarizer=summarize_turns if CHAT_MEMORY_SUMMARIZE else None):
+        self.cache = caches[cache_alias]
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.summarizer = summarizer
+
+    @staticmethod
+    def _key(session_id):
+        return f"fmulab:chat-memory:{session_id}"
+
+    def get(self, session_id):
+        """The session's memory as {"summary": str, "messages": [{"role", "content"}]}"""
+        return self.cache.get(self._key(session_id)) or {"summary": "", "messages": []}
+
+    def history(self, session_id):
+        """Recent messages of the session"""
+        return self.get(session_id)["messages"]
+
+    def has_history(self, session_id):
+        memory = self.get(session_id)
+        return bool(memory["messages"] or memory["summary"])
+
+    def append(self, session_id, role, content):
+        """Add a message, folding the oldest turns into the summary beyond max_messages"""
+        try:
+            memory = self.get(session_id)
+            memory["messages"].append({"role": role, "content": content})
+
+            overflow = len(memory["messages"]) - self.max_messages
+            if overflow > 0:
+                dropped = memory["messages"][:overflow]
+                memory["messages"] = memory["messages"][overflow:]
+                if self.summarizer is not None:
+                    memory["summary"] = self.summarizer(memory["summary"], dropped)
+
+            self.cache.set(self._key(session_id), memory, self.timeout)
+
+        except Exception as e:
+            logging.error(f"Error updating conversation memory: {str(e)}")
+
+    def clear(self, session_id):
+        """Forget a session"""
+        self.cache.delete(self._key(session_id))
+
+    def format_for_prompt(self, session_id, max_message_chars=CHAT_MEMORY_MESSAGE_MAX_CHARS):
+        """The conversation so far as a prompt section, or an empty string for a new session"""
+        memory = self.get(session_id)
+        if not memory["messages"] and not memory["summary"]:
+            return ""
+
+        lines = ["### Conversation so far:"]
+        if memory["summary"]:
+            lines.append(f"Summary of earlier turns:\n{memory['summary']}\n")
+        for message in memory["messages"]:
+            content = message["content"]
+            if len(content) > max_message_chars:
+                content = content[:max_message_chars] + "..."
+            lines.append(f"{message['role'].capitalize()}: {content}")
+        return "\n".join(lines) + "\n"
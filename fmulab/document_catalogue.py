@@ -0,0 +1,56 @@
+"""
+Cached catalogue of the completed documents in the graph database
+"""
+import logging
+from django.core.cache import caches
+
+from .config import DOCUMENT_CATALOGUE_CACHE_ALIAS, DOCUMENT_CATALOGUE_TTL
+
+CATALOGUE_CACHE_KEY = "fmulab:documents:completed"
+
+
+def invalidate_document_catalogue(cache_alias=DOCUMENT_CATALOGUE_CACHE_ALIAS):
+    """Drop the cached catalogue so the next request reloads it from Neo4j"""
+    caches[cache_alias].delete(CATALOGUE_CACHE_KEY)
+    logging.info("Document catalogue invalidated")
+
+
+class DocumentCatalogue:
+    """
+    Completed-document catalogue kept in Django's cache for ``timeout``
+    seconds, so page loads and chats do not query Neo4j every time. Send the
+    ``fmulab.signals.documents_changed`` signal after ingesting or deleting
+    documents to refresh it immediately.
+    """
+
+    def __init__(self, neo4j_connection, cache_alias=DOCUMENT_CATALOGUE_CACHE_ALIAS,
+                 timeout=DOCUMENT_CATALOGUE_TTL):
+        self.neo4j = neo4j_connection
+        self.cache_alias = cache_alias
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+
+    def get_cached(self):
+        """Cached document metadata, or None when the catalogue must be reloaded"""
+        return self.cache.get(CATALOGUE_CACHE_KEY)
+
+    def store(self, documents):
+        """Cache document metadata; empty results are not cached as they usually mean an error"""
+        if documents:
+            self.cache.set(CATALOGUE_CACHE_KEY, documents, self.timeout)
+
+    def get_document_metadata(self):
+        """List of {"fileName", "updatedAt"} dicts for all completed documents"""
+        documents = self.get_cached()
+        if documents is None:
+            documents = self.neo4j.get_completed_document_metadata()
+            self.store(documents)
+        return documents
+
+    def get_documents(self):
+        """Names of all completed documents"""
+        return [document["fileName"] for document in self.get_document_metadata()]
+
+    def invalidate(self):
+        """Drop the cached catalogue"""
+        invalidate_document_catalogue(self.cache_alias)
@@ -0,0 +1,126 @@
+"""
+Local query embeddings for vector index retrieval
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from .batching import MicroBatcher
+from .config import (
+    EMBEDDING_ENABLED,
+    EMBEDDING_MODEL,
+    EMBEDDING_DEVICE,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_MAX_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+)
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # embeddings are optional; retrieval falls back to fulltext indexes
+    SentenceTransformer = None
+
+
+class EmbeddingService:
+    """
+    Sentence embeddings from a local CPU model. Concurrent requests are
+    encoded together in one forward pass, and embeddings of repeated texts
+    are served from an LRU cache keyed by the text hash.
+
+    Instances are callable, so they can be passed wherever an ``embedder``
+    (text -> vector) is expected.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, device=EMBEDDING_DEVICE, cache_size=EMBEDDING_CACHE_SIZE,
+                 max_batch_size=EMBEDDING_MAX_BATCH_SIZE, batch_wait_ms=EMBEDDING_BATCH_WAIT_MS):
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is required for embeddings. "
+                              "Install it with 'pip install sentence-transformers'.")
+        self.model_name = model_name
+        self.device = device
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.batcher = MicroBatcher(self._encode_batch, max_batch_size, batch_wait_ms, name="embedding-batcher")
+
+    @property
+    def model(self):
+        """The sentence-transformers model, loaded on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    logging.info(f"Loading embedding model {self.model_name} on {self.device}")
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def _encode_batch(self, texts):
+        vectors = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return [vector.tolist() for vector in vectors]
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _cached(self, key):
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _remember(self, key, vector):
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed(self, text):
+        """Embedding of a single text"""
+        key = self._key(text)
+        vector = self._cached(key)
+        if vector is None:
+            vector = self.batcher.submit(text)
+            self._remember(key, vector)
+        return vector
+
+    def embed_many(self, texts):
+        """Embeddings of several texts, encoding only those not already cached"""
+        keys = [self._key(text) for text in texts]
+        vectors = [self._cached(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = self.batcher.submit_many([texts[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                self._remember(keys[i], vector)
+        return vectors
+
+    __call__ = embed
+
+    def warm_up(self):
+        """Load the model ahead of the first request"""
+        self.embed("warm up")
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """
+    Return the process-wide embedding service, or None when embeddings are
+    disabled or sentence-transformers is not installed.
+    """
+    global _embedding_service
+    if not EMBEDDING_ENABLED or SentenceTransformer is None:
+        return None
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
+    return _embedding_service
@@ -0,0 +1,585 @@
+"""
+Offline stand-ins for the LLM API and Neo4j, for tests and benchmarks.
+
+FakeLLMServer is a local HTTP server speaking the OpenAI chat completion
+protocol, with configurable latency and streaming. FakeNeo4jConnection answers
+the pipeline's registered Cypher statements from an in-memory graph of
+documents, chunks and entities built by seed_graph(), and
+AsyncFakeNeo4jConnection does the same for the async pipeline.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from neo4j.exceptions import ServiceUnavailable
+
+from . import config
+from .graph_db import AsyncNeo4jConnection, Neo4jConnection, COMPLETED_DOCUMENTS_QUERY
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Vocabulary of the seeded graph; each term becomes an entity
+SEED_TERMS = (
+    "salmon", "trout", "growth model", "feed conversion", "water temperature", "dissolved oxygen",
+    "ammonia", "biofilter", "recirculating system", "hydrodynamic model", "net pen", "sea lice",
+    "stocking density", "fish welfare", "FMU", "co-simulation", "water treatment", "nitrification",
+    "CO2 stripping", "feeding regime", "mortality", "biomass", "current velocity", "sensor data",
+)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class FakeEmbedder:
+    """
+    Deterministic bag-of-words embeddings (feature hashing), so texts that
+    share words are similar without loading a model.
+    """
+
+    def __init__(self, dimensions=config.EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def __call__(self, text):
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+def cosine_score(a, b):
+    """Cosine similarity on the [0, 1] scale of Neo4j vector indexes"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)) or 1.0
+    return (1.0 + dot / norm) / 2.0
+
+
+class FakeGraph:
+    """In-memory documents, chunks and entities with element ids like Neo4j's"""
+
+    def __init__(self):
+        self.documents = {}
+        self.chunks = {}
+        self.entities = {}
+        self._next_id = 0
+
+    def new_element_id(self):
+        self._next_id += 1
+        return f"4:fake:{self._next_id}"
+
+
+def seed_graph(documents=5, chunks_per_document=20, entities_per_chunk=4, sentences_per_chunk=6,
+               embedder=None, seed=0):
+    """
+    Build a graph shaped like an ingested report collection: documents split
+    into chunks, chunks mentioning entities, and entities related to the
+    entities they co-occur with.
+    """
+    rng = random.Random(seed)
+    embedder = embedder or FakeEmbedder()
+    graph = FakeGraph()
+
+    for term in SEED_TERMS:
+        graph.entities[term] = {
+            "element_id": graph.new_element_id(),
+            "id": term,
+            "description": f"{term} as discussed in the FMU simulation reports",
+            "embedding": embedder(term),
+            "related": set(),
+        }
+
+    for d in range(documents):
+        file_name = f"report_{d:02d}.pdf"
+        graph.documents[file_name] = {
+            "element_id": graph.new_element_id(),
+            "fileName": file_name,
+            "status": "Completed",
+            "updatedAt": f"2024-01-{d % 28 + 1:02d}T00:00:00Z",
+        }
+        for c in range(chunks_per_document):
+            terms = rng.sample(SEED_TERMS, entities_per_chunk)
+            sentences = []
+            for _ in range(sentences_per_chunk):
+                first, second = rng.sample(terms, 2)
+                sentences.append(f"The {first} affects the {second} in simulation run {rng.randint(1, 500)}.")
+            text = " ".join(sentences)
+            element_id = graph.new_element_id()
+            graph.chunks[element_id] = {
+                "element_id": element_id,
+                "id": hashlib.sha1(f"{file_name}:{c}".encode("utf-8")).hexdigest(),
+                "position": c,
+                "text": text,
+                "tokens": set(tokenize(text)),
+                "document": file_name,
+                "entities": terms,
+                "embedding": embedder(text),
+            }
+            for term in terms:
+                graph.entities[term]["related"].update(t for t in terms if t != term)
+    return graph
+
+
+class FakeRecord(dict):
+    """Dict with the parts of the neo4j.Record interface the pipeline uses"""
+
+    def data(self):
+        return dict(self)
+
+
+class FakeNode:
+    """Node with the parts of the neo4j.graph.Node interface the graph extraction uses"""
+
+    def __init__(self, element_id, labels, properties):
+        self.element_id = element_id
+        self.labels = frozenset(labels)
+        self._properties = properties
+
+    def items(self):
+        return self._properties.items()
+
+
+class FakeRelationship:
+    """Relationship with the parts of the neo4j.graph.Relationship interface the graph extraction uses"""
+
+    def __init__(self, type, start_node, end_node):
+        self.element_id = f"5:fake:{start_node.element_id}:{type}:{end_node.element_id}"
+        self.type = type
+        self.start_node = start_node
+        self.end_node = end_node
+
+
+class FakeSummary:
+    def __init__(self, query):
+        self.query = query
+        self.plan = None
+
+
+class FakeGraphQueries:
+    """
+    Answers the statements of the query registry from a FakeGraph, for the
+    sync and async fake connections. Statements without a handler raise, so a
+    test notices when the pipeline starts running a query the fake does not
+    know. Setting ``disconnects`` makes that many upcoming queries fail with
+    ServiceUnavailable, as when the database connection drops.
+    """
+
+    def _setup_fake(self, graph, query_latency):
+        self.graph = graph or seed_graph()
+        self.query_latency = query_latency
+        self.query_counts = Counter()
+        self.disconnects = 0
+        self._handlers = {
+            COMPLETED_DOCUMENTS_QUERY: self._completed_documents,
+            config.FULLTEXT_INDEX_SEARCH_QUERY: self._fulltext_search,
+            config.FULLTEXT_INDEX_DOCUMENT_SEARCH_QUERY: self._fulltext_search,
+            config.VECTOR_INDEX_SEARCH_QUERY: self._vector_search,
+            config.VECTOR_INDEX_DOCUMENT_SEARCH_QUERY: self._vector_search,
+            config.VECTOR_DOCUMENT_EXACT_SEARCH_QUERY: self._vector_exact_search,
+            config.CHUNK_CONTEXT_QUERY: self._chunk_context,
+            config.ENTITY_CONTEXT_QUERY: self._entity_context,
+            config.COMMUNITY_CONTEXT_QUERY: lambda params: [],
+            config.CHUNK_TEXT_SEARCH_QUERY: self._chunk_text_search,
+            config.CHUNK_TEXT_DOCUMENT_SEARCH_QUERY: self._chunk_text_search,
+            config.GRAPH_QUERY: self._document_graph,
+            config.GRAPH_CHUNK_PAGE_QUERY: self._chunk_page,
+            config.GRAPH_NEIGHBORS_QUERY: self._neighbors,
+        }
+
+    def _answer(self, query, params=None):
+        params = params or {}
+        self.query_counts[query] += 1
+        if self.disconnects:
+            self.disconnects -= 1
+            raise ServiceUnavailable("fake connection dropped")
+
+        if query.startswith("EXPLAIN "):
+            return [], FakeSummary(query), []
+        handler = self._handlers.get(query)
+        if handler is None:
+            raise Exception(f"{type(self).__name__} has no handler for query: {query.strip()[:80]}")
+        records = [FakeRecord(record) for record in handler(params)]
+        return records, FakeSummary(query), list(records[0].keys()) if records else []
+
+    # Handlers, one per registered statement
+
+    def _completed_documents(self, params):
+        return [{"fileName": document["fileName"], "updatedAt": document["updatedAt"]}
+                for document in self.graph.documents.values() if document["status"] == "Completed"]
+
+    def _ranked(self, scored, limit):
+        scored.sort(key=lambda item: item["score"], reverse=True)
+        return scored[:limit]
+
+    def _fulltext_search(self, params):
+        if params["keyword_index"] != "keyword":
+            return []
+        terms = set(tokenize(params["query_text"]))
+        documents = set(params.get("document_names") or self.graph.documents)
+        scored = [
+            {"element_id": chunk["element_id"], "score": float(len(terms & chunk["tokens"]))}
+            for chunk in self.graph.chunks.values()
+            if chunk["document"] in documents and terms & chunk["tokens"]
+        ]
+        # The document-filtered statement cuts to top_k after filtering the candidates
+        return self._ranked(scored, params["top_k"] if "document_names" in params else params["candidates"])
+
+    def _vector_search(self, params):
+        if params["index_name"] == "entity_vector":
+            nodes = self.graph.entities.values()
+        elif params["index_name"] == "vector":
+            nodes = self.graph.chunks.values()
+        else:
+            return []
+        scored = self._ranked([{"element_id": node["element_id"], "document": node.get("document"),
+                                "score": cosine_score(params["embedding"], node["embedding"])}
+                               for node in nodes], params["candidates"])
+        if "document_names" in params:
+            # The document-filtered statement filters the index candidates, then cuts to top_k
+            documents = set(params["document_names"])
+            scored = [hit for hit in scored if hit["document"] in documents][:params["top_k"]]
+        return [{"element_id": hit["element_id"], "score": hit["score"]} for hit in scored]
+
+    def _vector_exact_search(self, params):
+        documents = set(params["document_names"])
+        scored = [{"element_id": chunk["element_id"], "score": cosine_score(params["embedding"], chunk["embedding"])}
+                  for chunk in self.graph.chunks.values() if chunk["document"] in documents]
+        return self._ranked(scored, params["top_k"])
+
+    def _relationships(self, terms, limit):
+        relationships = sorted({f"RELATED_TO: {other}" for term in terms
+                                for other in self.graph.entities[term]["related"]})
+        return relationships[:limit]
+
+    def _chunk_context(self, params):
+        records = []
+        for hit in params["hits"]:
+            chunk = self.graph.chunks.get(hit["element_id"])
+            if chunk is None:
+                continue
+            records.append({
+                "chunk_text": chunk["text"],
+                "source": chunk["document"],
+                "score": hit["score"],
+                "entities": chunk["entities"][:params["entity_limit"]],
+                "relationships": self._relationships(chunk["entities"], params["entity_limit"]),
+            })
+        return self._ranked(records, len(records))
+
+    def _entity_context(self, params):
+        by_id = {entity["element_id"]: entity for entity in self.graph.entities.values()}
+        records = []
+        for hit in params["hits"]:
+            entity = by_id.get(hit["element_id"])
+            if entity is None:
+                continue
+            sources = sorted({chunk["document"] for chunk in self.graph.chunks.values()
+                              if entity["id"] in chunk["entities"]})
+            records.append({
+                "chunk_text": entity["description"],
+                "source": sources[0] if sources else "Knowledge graph",
+                "score": hit["score"],
+                "entities": [entity["id"]],
+                "relationships": self._relationships([entity["id"]], params["entity_limit"]),
+            })
+        return self._ranked(records, len(records))
+
+    def _chunk_text_search(self, params):
+        documents = set(params.get("document_names") or self.graph.documents)
+        needle = params["query_text"].lower()
+        matches = [chunk for chunk in self.graph.chunks.values()
+                   if chunk["document"] in documents and needle in chunk["text"].lower()]
+        return [{"c": {"id": chunk["id"], "text": chunk["text"]}, "fileName": chunk["document"]}
+                for chunk in matches[:params["limit"]]]
+
+
+    # Graph elements, built the same way for every query that returns them
+
+    def _document_node(self, file_name):
+        document = self.graph.documents[file_name]
+        return FakeNode(document["element_id"], ["Document"],
+                        {key: document[key] for key in ("fileName", "status", "updatedAt")})
+
+    def _chunk_node(self, chunk):
+        return FakeNode(chunk["element_id"], ["Chunk"],
+                        {"id": chunk["id"], "position": chunk["position"], "text": chunk["text"]})
+
+    def _entity_node(self, term):
+        entity = self.graph.entities[term]
+        return FakeNode(entity["element_id"], ["__Entity__", "Concept"],
+                        {"id": entity["id"], "description": entity["description"]})
+
+    def _entity_relationship(self, term, other):
+        # One relationship per related pair, pointing from the lower element id
+        first, second = sorted((term, other), key=lambda t: self.graph.entities[t]["element_id"])
+        return FakeRelationship("RELATED_TO", self._entity_node(first), self._entity_node(second))
+
+    def _document_chunks(self, file_name):
+        return sorted((chunk for chunk in self.graph.chunks.values() if chunk["document"] == file_name),
+                      key=lambda chunk: chunk["position"])
+
+    def _document_graph(self, params):
+        nodes, relationships = [], []
+        selected_terms = set()
+        for file_name in params["document_names"]:
+            if file_name not in self.graph.documents:
+                continue
+            document = self._document_node(file_name)
+            nodes.append(document)
+            previous = None
+            for chunk in self._document_chunks(file_name)[:params["graph_chunk_limit"]]:
+                chunk_node = self._chunk_node(chunk)
+                nodes.append(chunk_node)
+                relationships.append(FakeRelationship("PART_OF", chunk_node, document))
+                if previous is not None:
+                    relationships.append(FakeRelationship("NEXT_CHUNK", previous, chunk_node))
+                previous = chunk_node
+                for term in chunk["entities"]:
+                    nodes.append(self._entity_node(term))
+                    relationships.append(FakeRelationship("HAS_ENTITY", chunk_node, self._entity_node(term)))
+                    selected_terms.add(term)
+
+        # Entities are related across documents whenever both ends are in the selection
+        for term in selected_terms:
+            for other in self.graph.entities[term]["related"] & selected_terms:
+                relationships.append(self._entity_relationship(term, other))
+        return [{"nodes": nodes, "rels": relationships}]
+
+    def _chunk_page(self, params):
+        documents = set(params["document_names"])
+        chunks = sorted((chunk for chunk in self.graph.chunks.values()
+                         if chunk["document"] in documents
+                         and (params["cursor"] is None or chunk["id"] > params["cursor"])),
+                        key=lambda chunk: chunk["id"])
+        records = []
+        for chunk in chunks[:params["page_size"]]:
+            chunk_node = self._chunk_node(chunk)
+            document = self._document_node(chunk["document"])
+            mentions = [FakeRelationship("HAS_ENTITY", chunk_node, self._entity_node(term))
+                        for term in chunk["entities"]]
+            entity_relationships = {self._entity_relationship(term, other).element_id:
+                                    self._entity_relationship(term, other)
+                                    for term in chunk["entities"]
+                                    for other in self.graph.entities[term]["related"] & set(chunk["entities"])}
+            records.append({
+                "chunk_id": chunk["id"],
+                "nodes": [chunk_node, document] + [mention.end_node for mention in mentions],
+                "rels": [FakeRelationship("PART_OF", chunk_node, document)] + mentions
+                        + list(entity_relationships.values()),
+            })
+        return records
+
+    def _relationships_of(self, element_id):
+        """Every relationship of the fake graph that starts or ends at a node"""
+        relationships = []
+        for file_name in self.graph.documents:
+            document = self._document_node(file_name)
+            previous = None
+            for chunk in self._document_chunks(file_name):
+                chunk_node = self._chunk_node(chunk)
+                relationships.append(FakeRelationship("PART_OF", chunk_node, document))
+                if previous is not None:
+                    relationships.append(FakeRelationship("NEXT_CHUNK", previous, chunk_node))
+                previous = chunk_node
+                relationships.extend(FakeRelationship("HAS_ENTITY", chunk_node, self._entity_node(term))
+                                     for term in chunk["entities"])
+        for term, entity in self.graph.entities.items():
+            relationships.extend(self._entity_relationship(term, other) for other in entity["related"]
+                                 if entity["element_id"] < self.graph.entities[other]["element_id"])
+        return [relationship for relationship in relationships
+                if element_id in (relationship.start_node.element_id, relationship.end_node.element_id)]
+
+    def _neighbors(self, params):
+        nodes = [self._document_node(name) for name in self.graph.documents]
+        nodes += [self._chunk_node(chunk) for chunk in self.graph.chunks.values()]
+        nodes += [self._entity_node(term) for term in self.graph.entities]
+        node = next((node for node in nodes if node.element_id == params["element_id"]), None)
+        if node is None:
+            return []
+
+        relationships = sorted((relationship for relationship in self._relationships_of(node.element_id)
+                                if params["cursor"] is None or relationship.element_id > params["cursor"]),
+                               key=lambda relationship: relationship.element_id)
+        if not relationships:
+            # OPTIONAL MATCH keeps the node's row with nulls
+            return [{"rel_id": None, "nodes": [node, None], "rels": [None]}]
+        return [{
+            "rel_id": relationship.element_id,
+            "nodes": [node, relationship.end_node
+                      if relationship.start_node.element_id == node.element_id else relationship.start_node],
+            "rels": [relationship],
+        } for relationship in relationships[:params["limit"]]]
+
+
+class FakeNeo4jConnection(FakeGraphQueries, Neo4jConnection):
+    """
+    Neo4jConnection answering the statements of the query registry from a
+    FakeGraph. Each query sleeps ``query_latency`` seconds to stand in for the
+    network round trip.
+    """
+
+    def __init__(self, graph=None, query_latency=0.0):
+        super().__init__(uri="fake://memory", username="neo4j", password="", database="neo4j")
+        self._setup_fake(graph, query_latency)
+
+    def connect(self):
+        self.driver = object()
+        return self.driver
+
+    def close(self):
+        pass
+
+    def verify_connectivity(self):
+        return True
+
+    def _run_query(self, query, params=None, read_only=False):
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        return self._answer(query, params)
+
+    def stream_read_query(self, query, params, consume, fetch_size=1000):
+        records, _, _ = self.execute_read_query(query, params)
+        return consume(iter(records))
+
+
+class AsyncFakeNeo4jConnection(FakeGraphQueries, AsyncNeo4jConnection):
+    """AsyncNeo4jConnection answering the registered statements from a FakeGraph"""
+
+    def __init__(self, graph=None, query_latency=0.0):
+        super().__init__(uri="fake://memory", username="neo4j", password="", database="neo4j")
+        self._setup_fake(graph, query_latency)
+
+    def connect(self):
+        self.driver = object()
+        return self.driver
+
+    async def close(self):
+        pass
+
+    async def verify_connectivity(self):
+        return True
+
+    async def _run_query(self, query, params=None, read_only=False):
+        if self.query_latency:
+            await asyncio.sleep(self.query_latency)
+        return self._answer(query, params)
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            body = {}
+        fake._request_started(body)
+
+        if fake.status != 200:
+            self._send_json(fake.status, {"error": {"message": "fake LLM error"}})
+            return
+
+        time.sleep(fake.latency)
+        words = fake.reply_words(body)
+        if body.get("stream"):
+            self._send_stream(words, fake.token_delay)
+        else:
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": {"completion_tokens": len(words)},
+            })
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, words, token_delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if token_delay:
+                time.sleep(token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeLLMServer:
+    """
+    Local OpenAI-compatible chat completion server. ``latency`` is the delay
+    before the first token, ``token_delay`` the delay between streamed tokens
+    and ``status`` an HTTP status to fail every request with. Use it as a
+    context manager, and point an OpenAIProvider at ``base_url``.
+    """
+
+    def __init__(self, reply=None, completion_tokens=60, latency=0.0, token_delay=0.0, status=200):
+        self.reply = reply
+        self.completion_tokens = completion_tokens
+        self.latency = latency
+        self.token_delay = token_delay
+        self.status = status
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply_words(self, body):
+        if self.reply is not None:
+            return self.reply.split()
+        return [f"word{i}" for i in range(min(self.completion_tokens, body.get("max_tokens") or self.completion_tokens))]
+
+    def _request_started(self, body):
+        with self._lock:
+            self.requests.append(body)
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeLLMHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
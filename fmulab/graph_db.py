@@ -2,13 +2,75 @@
 Neo4j database connection and query execution for FMU simulation
 Based on original graph_query.py get_graphDB_driver function
 """
+import asyncio
 import logging
 import os
 import json
-from neo4j import GraphDatabase, time
+import threading
+import time as clock
+from neo4j import AsyncGraphDatabase, GraphDatabase, RoutingControl, time
+from neo4j.exceptions import ServiceUnavailable, SessionExpired
 
+from . import config
+from .graph_extraction import StreamingGraphExtractor, GraphNode
+
+
+# Only the properties the catalogue needs are projected, not whole nodes
+COMPLETED_DOCUMENTS_QUERY = """
+MATCH (node:Document {status:'Completed'})
+RETURN node.fileName AS fileName, node.updatedAt AS updatedAt
+"""
+
+
+def document_record_to_dict(record):
+    """Convert a completed-documents record into a cacheable dict"""
+    updated_at = record["updatedAt"]
+    if isinstance(updated_at, time.DateTime):
+        updated_at = updated_at.isoformat()
+    return {"fileName": record["fileName"], "updatedAt": updated_at}
+
+
+def normalize_document_names(document_names):
+    """Accept a list of names, a JSON list or a single name and return a list of stripped names"""
+    if isinstance(document_names, str):
+        # Handle case where it might be a JSON string
+        try:
+            document_names = json.loads(document_names)
+        except json.JSONDecodeError:
+            document_names = [document_names]
+        if isinstance(document_names, str):
+            document_names = [document_names]
+
+    # Make sure document_names is a list of strings
+    return list(map(str.strip, document_names))
+
+
+def read_graph_page(records, key, page_size):
+    """
+    Extract a page of graph records from a result cursor. ``key`` names the
+    column holding each row's keyset position; the position of the last row
+    becomes the cursor for the next page when the page is full.
+    """
+    extractor = StreamingGraphExtractor()
+    rows = 0
+    last_key = None
+    for record in records:
+        rows += 1
+        if record[key] is not None:
+            last_key = record[key]
+        extractor.add_record(record)
+
+    page = extractor.to_dict()
+    page["next_cursor"] = last_key if rows >= page_size and last_key is not None else None
+    return page
+
+
+class BaseNeo4jConnection:
+    """
+    Credentials, connection pool options and query metrics shared by the sync
+    and async connections. Subclasses provide the driver and the queries.
+    """
 
-class Neo4jConnection:
     def __init__(self, uri=None, username=None, password=None, database="neo4j"):
         """
         Initialize the Neo4j connection with credentials
@@ -22,12 +84,70 @@ class Neo4jConnection:
         self.enable_user_agent = getattr(settings, "ENABLE_USER_AGENT", False)
         self.user_agent = getattr(settings, "NEO4J_USER_AGENT", None)
 
+        # Connection pool settings, overridable from Django settings
+        self.pool_options = {}
+        for option in ("NEO4J_MAX_CONNECTION_POOL_SIZE", "NEO4J_CONNECTION_ACQUISITION_TIMEOUT",
+                       "NEO4J_MAX_CONNECTION_LIFETIME", "NEO4J_LIVENESS_CHECK_TIMEOUT"):
+            value = getattr(settings, option, getattr(config, option))
+            if value is not None:
+                self.pool_options[option[len("NEO4J_"):].lower()] = value
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "queries_total": 0,
+            "read_queries_total": 0,
+            "query_errors_total": 0,
+            "query_seconds_total": 0.0,
+            "reconnects_total": 0,
+        }
+
         # For debugging
         logging.info(f"Neo4jConnection initialized with URI: {self.uri}")
         logging.info(f"Using username: {self.username}")
         logging.info(f"Using database: {self.database}")
         self.driver = None
 
+    def _query_started(self, read_only):
+        with self._metrics_lock:
+            metrics = self._metrics
+            metrics["in_flight"] += 1
+            metrics["peak_in_flight"] = max(metrics["peak_in_flight"], metrics["in_flight"])
+            metrics["queries_total"] += 1
+            if read_only:
+                metrics["read_queries_total"] += 1
+
+    def _query_finished(self, seconds, failed):
+        with self._metrics_lock:
+            self._metrics["in_flight"] -= 1
+            self._metrics["query_seconds_total"] += seconds
+            if failed:
+                self._metrics["query_errors_total"] += 1
+
+    def pool_metrics(self):
+        """
+        Connection pool utilization as seen by this connection: queries in
+        flight (each holds one pooled connection), the peak since start, and
+        query totals. Utilization near 1.0 means requests wait for connections.
+        """
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        pool_size = self.pool_options.get("max_connection_pool_size")
+        metrics["max_connection_pool_size"] = pool_size
+        metrics["utilization"] = metrics["in_flight"] / pool_size if pool_size else None
+        metrics["peak_utilization"] = metrics["peak_in_flight"] / pool_size if pool_size else None
+        return metrics
+
+    def _count_reconnect(self):
+        with self._metrics_lock:
+            self._metrics["reconnects_total"] += 1
+
+
+class Neo4jConnection(BaseNeo4jConnection):
+    def __init__(self, uri=None, username=None, password=None, database="neo4j"):
+        super().__init__(uri, username, password, database)
+        self._reconnect_lock = threading.Lock()
+
     def connect(self):
         """
         Creates and returns a Neo4j database driver instance configured for Aura if needed
@@ -45,13 +165,15 @@ class Neo4jConnection:
                     uri,
                     auth=(self.username, self.password),
                     database=self.database,
-                    user_agent=self.user_agent
+                    user_agent=self.user_agent,
+                    **self.pool_options
                 )
             else:
                 self.driver = GraphDatabase.driver(
                     uri,
                     auth=(self.username, self.password),
-                    database=self.database
+                    database=self.database,
+                    **self.pool_options
                 )
 
             logging.info("Connection to Neo4j successful")
@@ -67,9 +189,39 @@ class Neo4jConnection:
         if self.driver:
             self.driver.close()
 
-    def execute_query(self, query, params=None):
+    def verify_connectivity(self):
+        """Check that the database is reachable, connecting first if needed"""
+        if not self.driver:
+            self.connect()
+        if self.driver is None:
+            raise ServiceUnavailable("No Neo4j driver available")
+        self.driver.verify_connectivity()
+        return True
+
+    def reconnect(self, failed_driver=None):
+        """
+        Replace a failed driver with a new one. Threads that hit the same
+        failure concurrently reconnect only once.
+        """
+        with self._reconnect_lock:
+            if failed_driver is not None and self.driver is not failed_driver:
+                return self.driver
+
+            logging.warning("Reconnecting to Neo4j")
+            self._count_reconnect()
+            try:
+                self.close()
+            except Exception as e:
+                logging.warning(f"Error closing the failed Neo4j driver: {str(e)}")
+            self.driver = None
+            return self.connect()
+
+    def execute_query(self, query, params=None, read_only=False):
         """
         Executes a specified query using the Neo4j driver with proper error handling.
+        Read-only queries are routed to read replicas in a cluster. A query that
+        fails because the database connection was lost is retried once on a
+        fresh driver.
 
         Returns:
         tuple: Contains records, summary of the execution, and keys of the records.
@@ -80,126 +232,194 @@ class Neo4jConnection:
         if self.driver is None:
             raise Exception("Failed to establish Neo4j connection. Check credentials and connection.")
 
+        driver = self.driver
+        self._query_started(read_only)
+        started = clock.perf_counter()
+        failed = False
+        try:
+            try:
+                return self._run_query(query, params, read_only)
+            except (ServiceUnavailable, SessionExpired) as e:
+                logging.warning(f"Neo4j connection lost ({str(e)}), retrying on a new driver")
+                if self.reconnect(driver) is None:
+                    raise Exception("Failed to re-establish Neo4j connection.")
+                try:
+                    return self._run_query(query, params, read_only)
+                except Exception as e:
+                    error_message = f"Failed to execute query: {str(e)}"
+                    logging.error(error_message, exc_info=True)
+                    raise Exception(error_message)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._query_finished(clock.perf_counter() - started, failed)
+
+    def execute_read_query(self, query, params=None):
+        """Executes a read-only query, routed to read replicas when available"""
+        return self.execute_query(query, params, read_only=True)
+
+    def stream_read_query(self, query, params, consume, fetch_size=1000):
+        """
+        Runs a read-only query and passes the live result cursor to ``consume``,
+        so records are processed as they arrive instead of being collected
+        into a list first. Returns whatever ``consume`` returns.
+        """
+        if not self.driver:
+            self.connect()
+
+        if self.driver is None:
+            raise Exception("Failed to establish Neo4j connection. Check credentials and connection.")
+
+        def work(tx):
+            return consume(tx.run(query, params or {}))
+
+        self._query_started(True)
+        started = clock.perf_counter()
+        failed = False
+        try:
+            with self.driver.session(database=self.database, fetch_size=fetch_size) as session:
+                return session.execute_read(work)
+        except Exception as e:
+            failed = True
+            error_message = f"Failed to execute query: {str(e)}"
+            logging.error(error_message, exc_info=True)
+            raise Exception(error_message)
+        finally:
+            self._query_finished(clock.perf_counter() - started, failed)
+
+    def _run_query(self, query, params=None, read_only=False):
+        """Run a query on the current driver, letting connection errors propagate"""
         try:
-            # For newer Neo4j versions (4.0+) use execute_query method
+            # For newer Neo4j versions (5.0+) use execute_query method
             if hasattr(self.driver, 'execute_query'):
                 # This returns a tuple of (records, summary, keys)
-                return self.driver.execute_query(query, **(params or {}))
+                return self.driver.execute_query(
+                    query,
+                    parameters_=params or {},
+                    routing_=RoutingControl.READ if read_only else RoutingControl.WRITE,
+                    database_=self.database
+                )
             else:
-                # Fallback to session.run for older Neo4j versions
-                with self.driver.session(database=self.database) as session:
-                    result = session.run(query, params or {})
+                # Fallback to session transactions for older Neo4j versions
+                def work(tx):
+                    result = tx.run(query, params or {})
                     records = list(result)
-                    summary = result.consume()
-                    keys = result.keys() if records else []
-                    return records, summary, keys
+                    return records, result.consume(), result.keys() if records else []
+
+                with self.driver.session(database=self.database) as session:
+                    if read_only:
+                        return session.execute_read(work)
+                    return session.execute_write(work)
 
+        except (ServiceUnavailable, SessionExpired):
+            raise
         except Exception as e:
             error_message = f"Failed to execute query: {str(e)}"
             logging.error(error_message, exc_info=True)
             raise Exception(error_message)
 
-    def get_completed_documents(self):
+    def get_completed_document_metadata(self):
         """
-        Retrieves the names of all documents with the status 'Completed' from the database.
-        Based on the original get_completed_documents function.
+        Retrieves the file name and last update time of all documents with
+        the status 'Completed' from the database.
         """
-        docs_query = "MATCH(node:Document {status:'Completed'}) RETURN node"
-
         try:
             logging.info("Executing query to retrieve completed documents.")
-            records, summary, keys = self.execute_query(docs_query)
+            records, summary, keys = self.execute_read_query(COMPLETED_DOCUMENTS_QUERY)
             logging.info(f"Query executed successfully, retrieved {len(records)} records.")
-
-            # Extract document names based on Neo4j driver version and response format
-            if hasattr(records[0], "get") and "node" in records[0]:
-                # New Neo4j driver format
-                documents = [record["node"]["fileName"] for record in records]
-            else:
-                # Handle different format or older Neo4j driver
-                documents = [record[0]["fileName"] for record in records]
-
-            logging.info("Document names extracted successfully.")
-            return documents
+            return [document_record_to_dict(record) for record in records]
 
         except Exception as e:
             logging.error(f"An error occurred retrieving documents: {e}")
             return []
 
-    def get_graph_for_documents(self, document_names, chunk_limit=50):
+    def get_completed_documents(self):
         """
-        Get a graph representation for specified documents.
-        Based on the original get_graph_results function.
+        Retrieves the names of all documents with the status 'Completed' from the database.
+        Based on the original get_completed_documents function.
         """
-        try:
-            logging.info(f"Starting graph query process for documents: {document_names}")
+        return [document["fileName"] for document in self.get_completed_document_metadata()]
 
-            # Convert document_names to the expected format
-            if isinstance(document_names, str):
-                # Handle case where it might be a JSON string
-                try:
-                    document_names = json.loads(document_names)
-                except json.JSONDecodeError:
-                    document_names = [document_names]
+    def fetch_graph_for_documents(self, document_names, chunk_limit=50):
+        """
+        Run GRAPH_QUERY for the given documents, raising on failure.
 
-            # Make sure document_names is a list of strings
-            document_names = list(map(str.strip, document_names))
+        Returns:
+        dict: Lists of node and relationship dicts.
+        """
+        logging.info(f"Starting graph query process for documents: {document_names}")
 
-            # Use the original GRAPH_QUERY from constants.py with formatting
-            from .config import GRAPH_QUERY
-            query = GRAPH_QUERY.format(graph_chunk_limit=chunk_limit)
+        document_names = normalize_document_names(document_names)
 
-            # Execute the query
-            records, summary, keys = self.execute_query(query, {
-                "document_names": document_names
-            })
+        # The chunk limit is a parameter, so every call shares one cached plan
+        params = {"document_names": document_names, "graph_chunk_limit": chunk_limit}
 
-            # Process results using helper functions
-            document_nodes = self.extract_node_elements(records)
-            document_relationships = self.extract_relationships(records)
+        # Execute the query, extracting nodes and relationships while reading the cursor
+        extractor = StreamingGraphExtractor()
+        self.stream_read_query(config.GRAPH_QUERY, params, extractor.consume)
 
-            logging.info(f"Number of nodes: {len(document_nodes)}")
-            logging.info(f"Number of relations: {len(document_relationships)}")
+        logging.info(f"Number of nodes: {len(extractor.nodes)}")
+        logging.info(f"Number of relations: {len(extractor.relationships)}")
 
-            result = {
-                "nodes": document_nodes,
-                "relationships": document_relationships
-            }
+        result = extractor.to_dict()
 
-            logging.info(f"Query process completed successfully")
-            return result
+        logging.info(f"Query process completed successfully")
+        return result
 
+    def get_graph_for_documents(self, document_names, chunk_limit=50):
+        """
+        Get a graph representation for specified documents.
+        Based on the original get_graph_results function.
+        """
+        try:
+            return self.fetch_graph_for_documents(document_names, chunk_limit)
         except Exception as e:
             logging.error(f"Error retrieving graph: {str(e)}")
             return {"nodes": [], "relationships": []}
 
+    def get_graph_page(self, document_names, cursor=None, page_size=None):
+        """
+        Get one page of the graph for the given documents. Pages are cut on
+        chunks, ordered by chunk id, so each page costs the same however large
+        the documents are.
+
+        Returns:
+        dict: nodes, relationships and next_cursor (None on the last page).
+        """
+        page_size = page_size or config.GRAPH_PAGE_SIZE
+        params = {
+            "document_names": normalize_document_names(document_names),
+            "cursor": cursor,
+            "page_size": page_size,
+        }
+        return self.stream_read_query(
+            config.GRAPH_CHUNK_PAGE_QUERY, params,
+            lambda records: read_graph_page(records, "chunk_id", page_size)
+        )
+
+    def get_node_neighbors(self, element_id, cursor=None, limit=None):
+        """
+        Expand a single node on demand, returning its neighbors a page of
+        relationships at a time.
+
+        Returns:
+        dict: nodes, relationships and next_cursor (None when fully expanded).
+        """
+        limit = limit or config.GRAPH_NEIGHBOR_LIMIT
+        params = {"element_id": element_id, "cursor": cursor, "limit": limit}
+        return self.stream_read_query(
+            config.GRAPH_NEIGHBORS_QUERY, params,
+            lambda records: read_graph_page(records, "rel_id", limit)
+        )
+
     def process_node(self, node):
         """
         Processes a node from a Neo4j database, extracting its ID, labels, and properties,
         while omitting certain properties like 'embedding' and 'text'.
         """
         try:
-            labels = set(node.labels)
-            labels.discard("__Entity__")
-            if not labels:
-                labels.add('*')
-
-            node_element = {
-                "element_id": node.element_id,
-                "labels": list(labels),
-                "properties": {}
-            }
-
-            for key in node:
-                if key in ["embedding", "text", "summary"]:
-                    continue
-                value = node.get(key)
-                if isinstance(value, time.DateTime):
-                    node_element["properties"][key] = value.isoformat()
-                else:
-                    node_element["properties"][key] = value
-
-            return node_element
+            return GraphNode.from_neo4j(node).to_dict()
         except Exception as e:
             logging.error(f"An unexpected error occurred while processing the node: {str(e)}")
             return {"element_id": "unknown", "labels": [], "properties": {}}
@@ -259,8 +479,8 @@ class Neo4jConnection:
                         relationship = {
                             "element_id": relation.element_id,
                             "type": relation.type,
-                            "start_node_element_id": self.process_node(nodes[0])["element_id"],
-                            "end_node_element_id": self.process_node(nodes[1])["element_id"],
+                            "start_node_element_id": nodes[0].element_id,
+                            "end_node_element_id": nodes[1].element_id,
                         }
                         relationships.append(relationship)
 
@@ -272,4 +492,149 @@ class Neo4jConnection:
             return all_relationships
         except Exception as e:
             logging.error(f"An error occurred while extracting relationships: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+
+class AsyncNeo4jConnection(BaseNeo4jConnection):
+    """
+    Neo4j connection backed by the driver's AsyncGraphDatabase, for use from
+    async views. The driver is bound to the event loop it is first used on,
+    so every method that talks to the database is a coroutine.
+    """
+
+    def __init__(self, uri=None, username=None, password=None, database="neo4j"):
+        super().__init__(uri, username, password, database)
+        self._reconnect_lock = asyncio.Lock()
+
+    def connect(self):
+        """
+        Creates and returns an async Neo4j database driver instance
+        """
+        try:
+            uri = self.uri.strip()
+            logging.info(f"Attempting to connect (async) to the Neo4j database at {uri}")
+
+            # The database is selected per query in execute_query
+            options = dict(self.pool_options, auth=(self.username, self.password))
+            if self.enable_user_agent and self.user_agent:
+                options["user_agent"] = self.user_agent
+
+            self.driver = AsyncGraphDatabase.driver(uri, **options)
+
+            logging.info("Async connection to Neo4j successful")
+            return self.driver
+
+        except Exception as e:
+            error_message = f"Failed to connect to Neo4j at {self.uri}. Error: {str(e)}"
+            logging.error(error_message, exc_info=True)
+            return None
+
+    async def close(self):
+        """Close the Neo4j connection"""
+        if self.driver:
+            await self.driver.close()
+
+    async def verify_connectivity(self):
+        """Check that the database is reachable, connecting first if needed"""
+        if not self.driver:
+            self.connect()
+        if self.driver is None:
+            raise ServiceUnavailable("No Neo4j driver available")
+        await self.driver.verify_connectivity()
+        return True
+
+    async def reconnect(self, failed_driver=None):
+        """
+        Replace a failed driver with a new one. Tasks that hit the same
+        failure concurrently reconnect only once.
+        """
+        async with self._reconnect_lock:
+            if failed_driver is not None and self.driver is not failed_driver:
+                return self.driver
+
+            logging.warning("Reconnecting to Neo4j")
+            self._count_reconnect()
+            try:
+                await self.close()
+            except Exception as e:
+                logging.warning(f"Error closing the failed Neo4j driver: {str(e)}")
+            self.driver = None
+            return self.connect()
+
+    async def execute_query(self, query, params=None, read_only=False):
+        """
+        Executes a specified query using the async Neo4j driver. A query that
+        fails because the database connection was lost is retried once on a
+        fresh driver.
+
+        Returns:
+        tuple: Contains records, summary of the execution, and keys of the records.
+        """
+        if not self.driver:
+            self.connect()
+
+        if self.driver is None:
+            raise Exception("Failed to establish Neo4j connection. Check credentials and connection.")
+
+        driver = self.driver
+        self._query_started(read_only)
+        started = clock.perf_counter()
+        failed = False
+        try:
+            try:
+                return await self._run_query(query, params, read_only)
+            except (ServiceUnavailable, SessionExpired) as e:
+                logging.warning(f"Neo4j connection lost ({str(e)}), retrying on a new driver")
+                if await self.reconnect(driver) is None:
+                    raise Exception("Failed to re-establish Neo4j connection.")
+                try:
+                    return await self._run_query(query, params, read_only)
+                except Exception as e:
+                    error_message = f"Failed to execute query: {str(e)}"
+                    logging.error(error_message, exc_info=True)
+                    raise Exception(error_message)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._query_finished(clock.perf_counter() - started, failed)
+
+    async def execute_read_query(self, query, params=None):
+        """Executes a read-only query, routed to read replicas when available"""
+        return await self.execute_query(query, params, read_only=True)
+
+    async def _run_query(self, query, params=None, read_only=False):
+        """Run a query on the current driver, letting connection errors propagate"""
+        try:
+            return await self.driver.execute_query(
+                query,
+                parameters_=params or {},
+                routing_=RoutingControl.READ if read_only else RoutingControl.WRITE,
+                database_=self.database
+            )
+        except (ServiceUnavailable, SessionExpired):
+            raise
+        except Exception as e:
+            error_message = f"Failed to execute query: {str(e)}"
+            logging.error(error_message, exc_info=True)
+            raise Exception(error_message)
+
+    async def get_completed_document_metadata(self):
+        """
+        Retrieves the file name and last update time of all documents with
+        the status 'Completed' from the database.
+        """
+        try:
+            records, summary, keys = await self.execute_read_query(COMPLETED_DOCUMENTS_QUERY)
+            logging.info(f"Query executed successfully, retrieved {len(records)} records.")
+            return [document_record_to_dict(record) for record in records]
+
+        except Exception as e:
+            logging.error(f"An error occurred retrieving documents: {e}")
+            return []
+
+    async def get_completed_documents(self):
+        """
+        Retrieves the names of all documents with the status 'Completed' from the database.
+        """
+        return [document["fileName"] for document in await self.get_completed_document_metadata()]
@@ -0,0 +1,108 @@
+"""
+Compact extraction of nodes and relationships from graph query results
+"""
+import logging
+from neo4j import time
+
+# Large properties left out of graph payloads
+OMITTED_NODE_PROPERTIES = frozenset(("embedding", "text", "summary"))
+
+
+class GraphNode:
+    """A node reduced to the fields the graph views need"""
+    __slots__ = ("element_id", "labels", "properties")
+
+    def __init__(self, element_id, labels, properties):
+        self.element_id = element_id
+        self.labels = labels
+        self.properties = properties
+
+    @classmethod
+    def from_neo4j(cls, node):
+        labels = [label for label in node.labels if label != "__Entity__"] or ["*"]
+        properties = {}
+        for key, value in node.items():
+            if key in OMITTED_NODE_PROPERTIES:
+                continue
+            properties[key] = value.isoformat() if isinstance(value, time.DateTime) else value
+        return cls(node.element_id, labels, properties)
+
+    def to_dict(self):
+        return {"element_id": self.element_id, "labels": self.labels, "properties": self.properties}
+
+
+class GraphRelationship:
+    """A relationship reduced to its type and endpoint element ids"""
+    __slots__ = ("element_id", "type", "start_node_element_id", "end_node_element_id")
+
+    def __init__(self, element_id, type, start_node_element_id, end_node_element_id):
+        self.element_id = element_id
+        self.type = type
+        self.start_node_element_id = start_node_element_id
+        self.end_node_element_id = end_node_element_id
+
+    @classmethod
+    def from_neo4j(cls, relation):
+        # Only the endpoint ids are needed, so the endpoint nodes are never processed
+        return cls(relation.element_id, relation.type,
+                   relation.start_node.element_id, relation.end_node.element_id)
+
+    def to_dict(self):
+        return {
+            "element_id": self.element_id,
+            "type": self.type,
+            "start_node_element_id": self.start_node_element_id,
+            "end_node_element_id": self.end_node_element_id,
+        }
+
+
+class StreamingGraphExtractor:
+    """
+    Builds deduplicated GraphNode and GraphRelationship lists from records
+    as they are read from the result cursor, so the raw records never need
+    to be held in memory together.
+    """
+
+    def __init__(self, nodes_key="nodes", relationships_key="rels"):
+        self.nodes_key = nodes_key
+        self.relationships_key = relationships_key
+        self.nodes = []
+        self.relationships = []
+        self._seen_nodes = set()
+        self._seen_relationships = set()
+
+    def add_node(self, node):
+        if node is None or node.element_id in self._seen_nodes:
+            return
+        self._seen_nodes.add(node.element_id)
+        try:
+            self.nodes.append(GraphNode.from_neo4j(node))
+        except Exception as e:
+            logging.error(f"An unexpected error occurred while processing the node: {str(e)}")
+
+    def add_relationship(self, relation):
+        if relation is None or relation.element_id in self._seen_relationships:
+            return
+        self._seen_relationships.add(relation.element_id)
+        if relation.start_node is None or relation.end_node is None:
+            logging.warning(f"Relationship with ID {relation.element_id} does not have two nodes.")
+            return
+        self.relationships.append(GraphRelationship.from_neo4j(relation))
+
+    def add_record(self, record):
+        for node in record.get(self.nodes_key) or []:
+            self.add_node(node)
+        for relation in record.get(self.relationships_key) or []:
+            self.add_relationship(relation)
+
+    def consume(self, records):
+        """Extract every record of an iterable (typically a live result cursor)"""
+        for record in records:
+            self.add_record(record)
+        return self
+
+    def to_dict(self):
+        return {
+            "nodes": [node.to_dict() for node in self.nodes],
+            "relationships": [relationship.to_dict() for relationship in self.relationships],
+        }
@@ -0,0 +1,206 @@
+"""
+On-disk snapshots of document graphs, so graphs of unchanged documents are
+read from a file instead of recomputed with GRAPH_QUERY
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+
+from .compression import compact_json
+from .config import (
+    GRAPH_QUERY, GRAPH_CHUNK_LIMIT,
+    GRAPH_SNAPSHOT_DIR, GRAPH_SNAPSHOT_COMPRESSION_LEVEL,
+)
+from .graph_db import normalize_document_names
+
+SNAPSHOT_SUFFIX = ".json.z"
+SELECTION_SUFFIX = ".names.json"
+
+# Changing the query changes what a snapshot contains, so it is part of every key
+GRAPH_QUERY_DIGEST = hashlib.sha1(GRAPH_QUERY.encode("utf-8")).hexdigest()[:12]
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path, data):
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as target:
+            target.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class GraphSnapshotStore:
+    """
+    Graph snapshots of document selections stored as zlib-compressed compact JSON.
+
+    A snapshot holds exactly what GRAPH_QUERY returns for one set of documents,
+    including relationships between chunks and entities of different
+    documents. It is keyed by the selected names together with the status and
+    ``updatedAt`` of each of them, the chunk limit and the graph query, so
+    re-ingesting any selected document makes the snapshot unreachable. The
+    versions are read from Neo4j on every lookup rather than from the cached
+    document catalogue, which may lag behind an ingest. Selections containing
+    a document that is not completed are always queried live and never stored.
+    """
+
+    def __init__(self, neo4j_connection, directory=GRAPH_SNAPSHOT_DIR,
+                 chunk_limit=GRAPH_CHUNK_LIMIT, compression_level=GRAPH_SNAPSHOT_COMPRESSION_LEVEL):
+        self.neo4j = neo4j_connection
+        self.directory = directory
+        self.chunk_limit = chunk_limit
+        self.compression_level = compression_level
+
+    def _versions(self):
+        """Snapshot version of every completed document, by file name"""
+        return {
+            document["fileName"]: f"Completed|{document['updatedAt']}|{self.chunk_limit}|{GRAPH_QUERY_DIGEST}"
+            for document in self.neo4j.get_completed_document_metadata()
+        }
+
+    @staticmethod
+    def selection(document_names):
+        """Sorted, de-duplicated names of a document selection"""
+        return sorted(set(normalize_document_names(document_names)))
+
+    def selection_version(self, document_names, versions=None):
+        """Snapshot version of a selection, or None when one of its documents is not completed"""
+        versions = self._versions() if versions is None else versions
+        names = self.selection(document_names)
+        if not names or any(name not in versions for name in names):
+            return None
+        return "\n".join(f"{name}|{versions[name]}" for name in names)
+
+    def _selection_digest(self, document_names):
+        return _digest("\n".join(self.selection(document_names)))
+
+    def path_for(self, document_names, version):
+        """File holding the snapshot of one version of a selection"""
+        return os.path.join(
+            self.directory,
+            f"{self._selection_digest(document_names)}.{_digest(version)[:16]}{SNAPSHOT_SUFFIX}"
+        )
+
+    def load_raw(self, document_names, version=None):
+        """
+        The compressed snapshot bytes of a selection, or None when there is no
+        current snapshot. The bytes are a zlib stream, which is what HTTP calls
+        the ``deflate`` content coding.
+        """
+        if version is None:
+            version = self.selection_version(document_names)
+            if version is None:
+                return None
+        try:
+            with open(self.path_for(document_names, version), "rb") as snapshot:
+                return snapshot.read()
+        except FileNotFoundError:
+            return None
+
+    def load(self, document_names, version=None):
+        """The snapshot graph of a selection, or None when there is no current snapshot"""
+        data = self.load_raw(document_names, version)
+        if data is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(data))
+        except (zlib.error, ValueError) as e:
+            logging.warning(f"Discarding unreadable graph snapshot for {document_names}: {str(e)}")
+            return None
+
+    def save(self, document_names, version, graph):
+        """
+        Write a snapshot atomically, next to the list of its document names,
+        and remove older versions of the same selection
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        names = self.selection(document_names)
+        prefix = self._selection_digest(names)
+        path = self.path_for(names, version)
+        data = zlib.compress(compact_json(graph), self.compression_level)
+
+        # The names let rebuild() tell whether the snapshot is still current
+        _write_atomic(os.path.join(self.directory, f"{prefix}{SELECTION_SUFFIX}"), compact_json(names))
+        _write_atomic(path, data)
+
+        for stale in glob.glob(os.path.join(self.directory, f"{prefix}.*{SNAPSHOT_SUFFIX}")):
+            if stale != path:
+                os.remove(stale)
+        return data
+
+    def build(self, document_names, version):
+        """Compute a selection's graph with GRAPH_QUERY and store it"""
+        names = self.selection(document_names)
+        graph = self.neo4j.fetch_graph_for_documents(names, self.chunk_limit)
+        self.save(names, version, graph)
+        logging.info(f"Stored graph snapshot for {names} "
+                     f"({len(graph['nodes'])} nodes, {len(graph['relationships'])} relationships)")
+        return graph
+
+    def get_graph(self, document_names):
+        """Graph of the selected documents, from its snapshot when current, building it otherwise"""
+        names = self.selection(document_names)
+        version = self.selection_version(names)
+        if version is None:
+            return self.neo4j.fetch_graph_for_documents(names, self.chunk_limit)
+
+        graph = self.load(names, version)
+        if graph is None:
+            graph = self.build(names, version)
+        return graph
+
+    def rebuild(self, document_names=None, force=False):
+        """
+        Build missing or outdated single-document snapshots, or all of them
+        with ``force``, and prune snapshots of selections that are outdated or
+        contain a document that is no longer completed.
+
+        Returns:
+        tuple: Numbers of snapshots built, kept and pruned.
+        """
+        versions = self._versions()
+        built = kept = 0
+        for name in document_names or sorted(versions):
+            if name not in versions:
+                logging.warning(f"Skipping {name}: not a completed document")
+                continue
+            version = self.selection_version([name], versions)
+            if not force and os.path.exists(self.path_for([name], version)):
+                kept += 1
+                continue
+            self.build([name], version)
+            built += 1
+
+        # An empty catalogue usually means Neo4j could not be reached; keep the files
+        if not versions:
+            return built, kept, 0
+
+        current = set()
+        for names_path in glob.glob(os.path.join(self.directory, f"*{SELECTION_SUFFIX}")):
+            try:
+                with open(names_path, "rb") as names_file:
+                    names = json.loads(names_file.read())
+            except (OSError, ValueError):
+                names = []
+            version = self.selection_version(names, versions)
+            if version is None:
+                os.remove(names_path)
+            else:
+                current.add(os.path.basename(self.path_for(names, version)))
+
+        pruned = 0
+        for path in glob.glob(os.path.join(self.directory, f"*{SNAPSHOT_SUFFIX}")):
+            if os.path.basename(path) not in current:
+                os.remove(path)
+                pruned += 1
+        return built, kept, pruned
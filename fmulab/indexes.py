@@ -0,0 +1,156 @@
+"""
+Indexes and constraints the retrieval and graph queries depend on, and checks
+that the registered queries actually use them
+"""
+import logging
+
+from .config import CHAT_MODE_CONFIG_MAP, EMBEDDING_DIMENSIONS
+from .queries import QUERIES
+
+# Plan operators that read every node (of a label) instead of using an index
+SCAN_OPERATORS = ("NodeByLabelScan", "AllNodesScan")
+
+
+class IndexDefinition:
+    """A named index or constraint and the statement that creates it"""
+    __slots__ = ("name", "kind", "label", "properties", "statement")
+
+    def __init__(self, name, kind, label, properties, statement):
+        self.name = name
+        self.kind = kind
+        self.label = label
+        self.properties = properties
+        self.statement = statement
+
+
+def _vector_index(name, label, prop, dimensions):
+    return IndexDefinition(name, "VECTOR", label, [prop], (
+        f"CREATE VECTOR INDEX `{name}` IF NOT EXISTS FOR (n:`{label}`) ON (n.`{prop}`) "
+        f"OPTIONS {{indexConfig: {{`vector.dimensions`: {int(dimensions)}, "
+        f"`vector.similarity_function`: 'cosine'}}}}"
+    ))
+
+
+def _fulltext_index(name, label, props):
+    fields = ", ".join(f"n.`{prop}`" for prop in props)
+    return IndexDefinition(name, "FULLTEXT", label, list(props),
+                           f"CREATE FULLTEXT INDEX `{name}` IF NOT EXISTS FOR (n:`{label}`) ON EACH [{fields}]")
+
+
+def _range_index(name, label, prop):
+    return IndexDefinition(name, "RANGE", label, [prop],
+                           f"CREATE INDEX `{name}` IF NOT EXISTS FOR (n:`{label}`) ON (n.`{prop}`)")
+
+
+def _unique_constraint(name, label, prop):
+    return IndexDefinition(name, "UNIQUENESS", label, [prop],
+                           f"CREATE CONSTRAINT `{name}` IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.`{prop}` IS UNIQUE")
+
+
+def required_indexes(dimensions=EMBEDDING_DIMENSIONS):
+    """
+    Indexes named by the chat modes in CHAT_MODE_CONFIG_MAP, plus the lookups
+    on Document.fileName, Document.status and Chunk.id used by the document
+    filters, the catalogue and graph pagination.
+    """
+    definitions = {}
+    for mode_config in CHAT_MODE_CONFIG_MAP.values():
+        label = mode_config.get("node_label")
+        if not label:
+            continue
+        index_name = mode_config.get("index_name")
+        if index_name and index_name not in definitions:
+            definitions[index_name] = _vector_index(
+                index_name, label, mode_config.get("embedding_node_property", "embedding"), dimensions
+            )
+        keyword_index = mode_config.get("keyword_index")
+        if keyword_index and keyword_index not in definitions:
+            definitions[keyword_index] = _fulltext_index(
+                keyword_index, label, mode_config.get("text_node_properties", ["text"])
+            )
+
+    for definition in (
+        _range_index("document_file_name", "Document", "fileName"),
+        _range_index("document_status", "Document", "status"),
+        _unique_constraint("chunk_id", "Chunk", "id"),
+    ):
+        definitions[definition.name] = definition
+    return list(definitions.values())
+
+
+def existing_indexes(connection):
+    """Indexes in the database by name, with their type, schema and state"""
+    records, _, _ = connection.execute_query(
+        "SHOW INDEXES YIELD name, type, labelsOrTypes, properties, state, owningConstraint "
+        "RETURN name, type, labelsOrTypes, properties, state, owningConstraint"
+    )
+    return {record["name"]: record.data() for record in records}
+
+
+def _covering_index(definition, existing):
+    """The existing index serving a definition: by name, or any index on the same schema"""
+    if definition.name in existing:
+        return existing[definition.name]
+    for index in existing.values():
+        if index["labelsOrTypes"] == [definition.label] and index["properties"] == definition.properties:
+            # Constraints are backed by an index named after neither of them
+            if definition.kind != "UNIQUENESS" or index["owningConstraint"]:
+                return index
+    return None
+
+
+def ensure_indexes(connection, create=True, timeout=300):
+    """
+    Create missing indexes and constraints, wait for them to come online and
+    report their state.
+
+    Returns:
+    list: (definition, state) pairs, where state is the index state such as
+    ONLINE, POPULATING or FAILED, or MISSING.
+    """
+    definitions = required_indexes()
+    if create:
+        existing = existing_indexes(connection)
+        for definition in definitions:
+            if _covering_index(definition, existing) is None:
+                logging.info(f"Creating {definition.kind.lower()} index {definition.name}")
+                connection.execute_query(definition.statement)
+        connection.execute_query("CALL db.awaitIndexes($timeout)", {"timeout": timeout})
+
+    existing = existing_indexes(connection)
+    report = []
+    for definition in definitions:
+        index = _covering_index(definition, existing)
+        report.append((definition, index["state"] if index else "MISSING"))
+    return report
+
+
+def plan_operators(plan):
+    """Names of all operators in an EXPLAIN plan tree, without the runtime suffix"""
+    if not plan:
+        return []
+    operators = [plan.get("operatorType", "").split("@")[0]]
+    for child in plan.get("children", []):
+        operators.extend(plan_operators(child))
+    return operators
+
+
+def find_label_scans(connection):
+    """
+    EXPLAIN every registered query and collect those whose plan scans nodes
+    instead of seeking through an index.
+
+    Returns:
+    dict: Query name -> list of scanning operators.
+    """
+    scans = {}
+    for query in QUERIES:
+        try:
+            _, summary, _ = connection.execute_read_query(f"EXPLAIN {query.text}", query.example_params)
+        except Exception as e:
+            logging.warning(f"Could not explain query '{query.name}': {str(e)}")
+            continue
+        operators = [operator for operator in plan_operators(summary.plan) if operator in SCAN_OPERATORS]
+        if operators:
+            scans[query.name] = operators
+    return scans
@@ -0,0 +1,228 @@
+"""
+Per-stage timing, token and cache metrics for the QA pipeline.
+
+Stages are timed with ``span(name)``. Every span feeds the process-wide
+metrics exposed in Prometheus text format by the ``metrics`` view; inside a
+view wrapped with ``server_timing`` the spans of the request are also
+collected and returned in a ``Server-Timing`` header.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import SERVER_TIMING_ENABLED
+
+# Upper bounds in seconds of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar("fmulab_request_trace", default=None)
+
+
+class RequestTrace:
+    """Stage durations and token counts collected while serving one request"""
+
+    def __init__(self):
+        self.spans = []
+        self.tokens = {}
+        self.cache = None
+
+    def add_span(self, name, seconds):
+        self.spans.append((name, seconds))
+
+    def durations(self):
+        """Total seconds per stage, in the order the stages first ran"""
+        totals = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        """The trace as a Server-Timing header value"""
+        return ", ".join(f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in self.durations().items())
+
+
+def escape_label_value(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def increment(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (f'{key}="{escape_label_value(value)}"' for key, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets))
+                                for key, h in self._histograms.items())
+
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for (name, labels), (counts, count, total, buckets) in histograms:
+            header(name)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("fmulab_stage_seconds", "histogram", "Time spent in each stage of a chat request")
+METRICS.describe("fmulab_llm_tokens_total", "counter", "Tokens sent to and received from the LLM")
+METRICS.describe("fmulab_response_cache_total", "counter", "Response cache lookups by outcome")
+METRICS.describe("fmulab_requests_total", "counter", "Requests served by instrumented views")
+
+
+def current_trace():
+    """The trace of the request being served, or None outside server_timing views"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    """Time a pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        METRICS.observe("fmulab_stage_seconds", seconds, {"stage": name})
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, seconds)
+
+
+def record_tokens(kind, count):
+    """Count LLM prompt or completion tokens"""
+    METRICS.increment("fmulab_llm_tokens_total", {"kind": kind}, count)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+
+def record_cache(status):
+    """Count a response cache lookup by its CACHE_* status"""
+    METRICS.increment("fmulab_response_cache_total", {"status": status})
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache = status
+
+
+def _finish(view_name, trace, token, started, response):
+    _current_trace.reset(token)
+    seconds = time.perf_counter() - started
+    trace.add_span("total", seconds)
+    METRICS.increment("fmulab_requests_total", {"view": view_name, "status": response.status_code})
+    if SERVER_TIMING_ENABLED:
+        response["Server-Timing"] = trace.server_timing()
+    logging.info(f"{view_name} served in {seconds * 1000.0:.1f} ms: {trace.durations()} "
+                 f"tokens={trace.tokens} cache={trace.cache}")
+    return response
+
+
+def server_timing(view):
+    """
+    Collect the spans of each request to ``view``, log them and, when
+    SERVER_TIMING_ENABLED is set, return them in a Server-Timing header.
+    Streaming responses only report the stages that ran before streaming began.
+    Works for both sync and async views.
+    """
+    view_name = view.__name__
+
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            trace = RequestTrace()
+            token = _current_trace.set(trace)
+            started = time.perf_counter()
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception:
+                _current_trace.reset(token)
+                raise
+            return _finish(view_name, trace, token, started, response)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            _current_trace.reset(token)
+            raise
+        return _finish(view_name, trace, token, started, response)
+    return wrapper
@@ -0,0 +1,178 @@
+"""
+Intent routing in front of the graph QA pipeline
+"""
+import logging
+import math
+import re
+import threading
+
+from .instrumentation import METRICS
+from .config import (
+    CHAT_MODE_CONFIG_MAP,
+    INTENT_ROUTING_ENABLED,
+    INTENT_CLASSIFIER_PATH,
+    INTENT_CLASSIFIER_LABELS,
+    INTENT_MIN_CONFIDENCE,
+    INTENT_MODES,
+)
+
+# Trivial intents only match when nothing but the greeting, thanks or
+# request for help (plus filler) is left, so no question is ever dropped
+INTENT_RULES = (
+    ("greeting", re.compile(r"^(hi|hello|hey|hiya|greetings|good (morning|afternoon|evening))"
+                            r"( there| all| everyone| again)?$")),
+    ("thanks", re.compile(r"^((ok|okay|great|perfect|awesome|cool) )?(thanks|thank you|thx|ty|cheers)"
+                          r"( (so|very) much| a lot| again| for (the|your) (help|answer|answers))?$")),
+    ("farewell", re.compile(r"^(bye|goodbye|good bye|see you( later)?|see ya|have a (nice|good) day)$")),
+    ("help", re.compile(r"^(help|what can you do|who are you|what are you|how do i use (this|you))$")),
+)
+OVERVIEW_PATTERN = re.compile(
+    r"\b(summar(y|ise|ize)|overview|main (topics|themes|findings|ideas)|"
+    r"what (are|is) (the|these|this) (documents?|papers?|reports?) about)\b"
+)
+# Only explicit questions about how concepts relate; "how does X affect Y" is an
+# ordinary factual question best answered from the chunks
+RELATIONAL_PATTERN = re.compile(
+    r"\b((relationships?|relations?|connections?|links?|interactions?|differences?) between|"
+    r"how (is|are) .{1,60} (related|connected|linked)|"
+    r"(relate|connect|interact) (to|with) each other)\b"
+)
+QUESTION_WORDS = re.compile(r"\b(what|how|why|when|where|which|who|does|do|is|are|can)\b")
+
+CANNED_ANSWERS = {
+    "greeting": "Hello! Ask me anything about the FMU simulations and aquaculture research in the knowledge graph.",
+    "thanks": "You're welcome! Let me know if you have more questions.",
+    "farewell": "Goodbye! Your conversation is kept here if you want to continue later.",
+    "help": ("I answer questions about fish growth models, water treatment, hydrodynamic models and the "
+             "other FMU simulation documents in the knowledge graph. Ask about a specific model, how two "
+             "concepts relate, or for a summary of the documents."),
+    "off_topic": ("I can only help with questions about the FMU simulations and aquaculture research in the "
+                  "knowledge graph. Could you rephrase your question in that context?"),
+}
+
+METRICS.describe("fmulab_intent_total", "counter", "Chat messages by routed intent")
+
+
+def normalize_message(text):
+    """Lowercase the message and collapse punctuation and whitespace"""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+def softmax(logits):
+    peak = max(logits)
+    exps = [math.exp(value - peak) for value in logits]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+class Route:
+    """Outcome of routing one message"""
+    __slots__ = ("intent", "mode", "answer", "confidence", "source")
+
+    def __init__(self, intent, mode=None, answer=None, confidence=1.0, source="rules"):
+        self.intent = intent
+        self.mode = mode
+        self.answer = answer
+        self.confidence = confidence
+        self.source = source
+
+    def metadata(self):
+        metadata = {"intent": self.intent, "intent_source": self.source}
+        if self.mode:
+            metadata["routed_mode"] = self.mode
+        return metadata
+
+
+class IntentRouter:
+    """
+    Classifies chat messages before retrieval. Greetings, thanks, farewells,
+    help requests and off-topic messages get a canned answer without touching
+    Neo4j or the LLM; questions are sent to the chat mode of their intent.
+
+    ``classifier`` is optional: anything with a ``logits(sentences)`` method,
+    normally a resident BertClassifier whose label indices map to ``labels``.
+    Low-confidence or missing classifications fall back to the rules.
+    """
+
+    def __init__(self, classifier=None, labels=INTENT_CLASSIFIER_LABELS, min_confidence=INTENT_MIN_CONFIDENCE,
+                 modes=INTENT_MODES, answers=CANNED_ANSWERS):
+        self.classifier = classifier
+        self.labels = list(labels)
+        self.min_confidence = min_confidence
+        self.answers = answers
+        self.modes = {}
+        for intent, mode in modes.items():
+            if mode in CHAT_MODE_CONFIG_MAP:
+                self.modes[intent] = mode
+            else:
+                logging.warning(f"Ignoring unknown chat mode {mode} for intent {intent}")
+
+    def _classify(self, query):
+        """(intent, confidence) from the classifier, or None when unavailable"""
+        if self.classifier is None:
+            return None
+        try:
+            probabilities = softmax(self.classifier.logits([query])[0])
+        except Exception as e:
+            logging.error(f"Intent classification failed: {str(e)}")
+            return None
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        if best >= len(self.labels):
+            return None
+        return self.labels[best], probabilities[best]
+
+    def _rule_intent(self, text):
+        for intent, pattern in INTENT_RULES:
+            if pattern.search(text):
+                return intent
+        if OVERVIEW_PATTERN.search(text):
+            return "overview"
+        if RELATIONAL_PATTERN.search(text):
+            return "relational"
+        if len(text.split()) <= 3 and not QUESTION_WORDS.search(text):
+            return "keyword"
+        return "factual"
+
+    def route(self, query):
+        """Route a chat message"""
+        text = normalize_message(query)
+        if not text:
+            route = Route("help", answer=self.answers.get("help"))
+        else:
+            classified = self._classify(query)
+            if classified is not None and classified[1] >= self.min_confidence:
+                intent, confidence = classified
+                route = Route(intent, self.modes.get(intent), self.answers.get(intent), confidence, "classifier")
+            else:
+                intent = self._rule_intent(text)
+                route = Route(intent, self.modes.get(intent), self.answers.get(intent))
+        METRICS.increment("fmulab_intent_total", {"intent": route.intent, "source": route.source})
+        return route
+
+
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    """
+    Return the process-wide intent router, or None when routing is disabled.
+    The BERT classifier is used when INTENT_CLASSIFIER_PATH is set and its
+    runtime is installed; otherwise the router runs on its rules alone.
+    """
+    global _intent_router
+    if not INTENT_ROUTING_ENABLED:
+        return None
+    if _intent_router is None:
+        with _intent_router_lock:
+            if _intent_router is None:
+                classifier = None
+                if INTENT_CLASSIFIER_PATH:
+                    from .bert_classifier import get_bert_classifier
+                    try:
+                        classifier = get_bert_classifier(INTENT_CLASSIFIER_PATH,
+                                                         num_labels=len(INTENT_CLASSIFIER_LABELS))
+                    except ImportError as e:
+                        logging.warning(f"Intent routing uses rules only: {str(e)}")
+                _intent_router = IntentRouter(classifier)
+    return _intent_router
@@ -4,9 +4,32 @@ LLM integration module for connecting to various LLM providers
 import os
 import logging
 import json
+import random
+import weakref
+import asyncio
+import threading
+import email.utils
+from datetime import datetime, timezone
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 
+from .config import (
+    LLM_POOL_SIZE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_FACTOR,
+    LLM_BACKOFF_MAX,
+    LLM_RETRY_STATUSES,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+)
+
+try:
+    import httpx
+except ImportError:  # httpx is only required for the async chat path
+    httpx = None
+
 
 class LLMProvider:
     """Base class for LLM providers"""
@@ -19,103 +42,318 @@ class LLMProvider:
         """Generate text from the LLM"""
         raise NotImplementedError("Subclasses must implement this method")
 
+    def stream(self, prompt, max_tokens=1000, temperature=0.0):
+        """
+        Generate text from the LLM as a stream of text fragments.
+        Providers without native streaming yield the full completion at once.
+        """
+        yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+
+    async def agenerate(self, prompt, max_tokens=1000, temperature=0.0):
+        """
+        Async variant of generate. Providers without a native async client
+        run generate in a worker thread.
+        """
+        return await asyncio.to_thread(self.generate, prompt, max_tokens, temperature)
+
+    async def astream(self, prompt, max_tokens=1000, temperature=0.0):
+        """
+        Async variant of stream. Providers without native async streaming
+        yield the full completion of agenerate at once.
+        """
+        yield await self.agenerate(prompt, max_tokens=max_tokens, temperature=temperature)
+
+
+def stream_line_deltas(line):
+    """
+    Content fragments of one Server-Sent Events line of an OpenAI style
+    streaming completion, or None at the [DONE] marker.
+    """
+    if not line:
+        return []
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return []
+
+    payload = line[len("data:"):].strip()
+    if payload == "[DONE]":
+        return None
+
+    try:
+        chunk = json.loads(payload)
+    except json.JSONDecodeError:
+        logging.warning(f"Skipping malformed stream chunk: {payload[:200]}")
+        return []
+
+    deltas = []
+    for choice in chunk.get("choices", []):
+        content = (choice.get("delta") or {}).get("content")
+        if content:
+            deltas.append(content)
+    return deltas
+
+
+def iter_stream_deltas(lines):
+    """
+    Parse the Server-Sent Events lines of an OpenAI style streaming completion
+    and yield the content fragments of each chunk until the [DONE] marker.
+    """
+    for line in lines:
+        deltas = stream_line_deltas(line)
+        if deltas is None:
+            break
+        yield from deltas
+
+
+class LLMRetry(Retry):
+    """urllib3 retry policy with the exponential backoff and Retry-After capped at LLM_BACKOFF_MAX"""
+
+    def get_backoff_time(self):
+        return min(super().get_backoff_time(), LLM_BACKOFF_MAX)
+
+    def parse_retry_after(self, retry_after):
+        return min(super().parse_retry_after(retry_after), LLM_BACKOFF_MAX)
+
+
+def build_http_session(pool_size=LLM_POOL_SIZE, max_retries=LLM_MAX_RETRIES,
+                       backoff_factor=LLM_BACKOFF_FACTOR):
+    """
+    Build a keep-alive requests session for LLM APIs. Connections are pooled
+    per host and 429/5xx responses are retried with exponential backoff,
+    honouring the Retry-After header sent by the API.
+    """
+    retry = LLMRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,  # a completion may already have been billed once the request was sent
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=LLM_RETRY_STATUSES,
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Return the process-wide pooled session shared by all LLM providers"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = build_http_session()
+    return _http_session
+
+
+def retry_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number ``attempt`` (starting at 0). A
+    Retry-After header, in seconds or as an HTTP date, takes precedence over
+    the jittered exponential backoff; an unparseable header is ignored.
+    """
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            if retry_at is not None:
+                if retry_at.tzinfo is None:  # "-0000" dates carry no zone but are UTC
+                    retry_at = retry_at.replace(tzinfo=timezone.utc)
+                delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+                return min(max(delay, 0.0), LLM_BACKOFF_MAX)
+        except (TypeError, ValueError):
+            logging.warning(f"Ignoring invalid Retry-After header: {retry_after}")
+
+    delay = min(LLM_BACKOFF_FACTOR * (2 ** attempt), LLM_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+# One pooled async HTTP client per event loop; clients cannot be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """Return the pooled httpx.AsyncClient for the running event loop"""
+    if httpx is None:
+        raise ImportError("httpx is required for async LLM providers. Install it with 'pip install httpx'.")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=LLM_POOL_SIZE),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        _async_clients[loop] = client
+    return client
+
 
 class OpenAIProvider(LLMProvider):
     """OpenAI chat completion provider"""
 
-    def __init__(self, model_name="gpt-3.5-turbo", api_key=None):
+    def __init__(self, model_name="gpt-3.5-turbo", api_key=None, session=None, base_url=None):
         super().__init__(model_name, api_key)
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
-        self.api_base = "https://api.openai.com/v1/chat/completions"
+        base_url = base_url or os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
+        self.api_base = f"{base_url.rstrip('/')}/chat/completions"
+        self.session = session or get_http_session()
+        self.timeout = (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+
+    def _headers(self):
+        """Request headers for the chat completion endpoint"""
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    def _payload(self, prompt, max_tokens, temperature):
+        """Request body for the chat completion endpoint"""
+        messages = [
+            {"role": "system",
+             "content": "You are a helpful assistant that answers questions based on context provided."},
+            {"role": "user", "content": prompt}
+        ]
+
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+
+    def stream(self, prompt, max_tokens=1000, temperature=0.0):
+        """Stream text from the chat completion endpoint as it is generated"""
+        data = self._payload(prompt, max_tokens, temperature)
+        data["stream"] = True
 
-    def generate(self, prompt, max_tokens=1000, temperature=0.0):
-        """Generate text from OpenAI"""
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-
-            messages = [
-                {"role": "system",
-                 "content": "You are a helpful assistant that answers questions based on context provided."},
-                {"role": "user", "content": prompt}
-            ]
-
-            data = {
-                "model": self.model_name,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-
-            response = requests.post(
+            with self.session.post(
                 self.api_base,
-                headers=headers,
+                headers=self._headers(),
                 data=json.dumps(data),
-                timeout=30
-            )
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    logging.error(f"Error from {type(self).__name__} stream: {response.text}")
+                    yield f"Error: Unable to generate response. Status code: {response.status_code}"
+                    return
+
+                yield from iter_stream_deltas(response.iter_lines())
+
+        except Exception as e:
+            logging.error(f"Error streaming text with {type(self).__name__}: {str(e)}")
+            yield f"Error: {str(e)}"
+
+    async def astream(self, prompt, max_tokens=1000, temperature=0.0):
+        """Stream text from the chat completion endpoint without blocking the event loop"""
+        data = self._payload(prompt, max_tokens, temperature)
+        data["stream"] = True
+
+        try:
+            client = get_async_http_client()
+            async with client.stream("POST", self.api_base, headers=self._headers(),
+                                     content=json.dumps(data)) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    logging.error(f"Error from {type(self).__name__} stream: {body[:500]!r}")
+                    yield f"Error: Unable to generate response. Status code: {response.status_code}"
+                    return
+
+                async for line in response.aiter_lines():
+                    deltas = stream_line_deltas(line)
+                    if deltas is None:
+                        break
+                    for delta in deltas:
+                        yield delta
+
+        except Exception as e:
+            logging.error(f"Error streaming text with {type(self).__name__}: {str(e)}")
+            yield f"Error: {str(e)}"
+
+    async def agenerate(self, prompt, max_tokens=1000, temperature=0.0):
+        """Generate text without blocking the event loop"""
+        try:
+            client = get_async_http_client()
+            body = json.dumps(self._payload(prompt, max_tokens, temperature))
+
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                response = await client.post(self.api_base, headers=self._headers(), content=body)
+                if response.status_code not in LLM_RETRY_STATUSES or attempt == LLM_MAX_RETRIES:
+                    break
+                delay = retry_delay(attempt, response.headers.get("Retry-After"))
+                logging.warning(f"{type(self).__name__} returned {response.status_code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
 
             if response.status_code != 200:
-                logging.error(f"Error from OpenAI API: {response.text}")
+                logging.error(f"Error from {type(self).__name__} API: {response.text}")
                 return f"Error: Unable to generate response. Status code: {response.status_code}"
 
             result = response.json()
             return result["choices"][0]["message"]["content"]
 
         except Exception as e:
-            logging.error(f"Error generating text with OpenAI: {str(e)}")
+            logging.error(f"Error generating text with {type(self).__name__}: {str(e)}")
             return f"Error: {str(e)}"
 
-
-class AzureOpenAIProvider(OpenAIProvider):
-    """Azure OpenAI provider"""
-
-    def __init__(self, model_name="gpt-3.5-turbo", api_key=None, endpoint=None):
-        super().__init__(model_name, api_key)
-        self.endpoint = endpoint or os.environ.get("AZURE_OPENAI_ENDPOINT", "")
-        self.api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2023-07-01-preview")
-        self.api_base = f"{self.endpoint}/openai/deployments/{self.model_name}/chat/completions?api-version={self.api_version}"
-
     def generate(self, prompt, max_tokens=1000, temperature=0.0):
-        """Generate text from Azure OpenAI"""
+        """Generate text from OpenAI"""
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.api_key
-            }
-
-            messages = [
-                {"role": "system",
-                 "content": "You are a helpful assistant that answers questions based on context provided."},
-                {"role": "user", "content": prompt}
-            ]
-
-            data = {
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-
-            response = requests.post(
+            response = self.session.post(
                 self.api_base,
-                headers=headers,
-                data=json.dumps(data),
-                timeout=30
+                headers=self._headers(),
+                data=json.dumps(self._payload(prompt, max_tokens, temperature)),
+                timeout=self.timeout
             )
 
             if response.status_code != 200:
-                logging.error(f"Error from Azure OpenAI API: {response.text}")
+                logging.error(f"Error from {type(self).__name__} API: {response.text}")
                 return f"Error: Unable to generate response. Status code: {response.status_code}"
 
             result = response.json()
             return result["choices"][0]["message"]["content"]
 
         except Exception as e:
-            logging.error(f"Error generating text with Azure OpenAI: {str(e)}")
+            logging.error(f"Error generating text with {type(self).__name__}: {str(e)}")
             return f"Error: {str(e)}"
 
 
+class AzureOpenAIProvider(OpenAIProvider):
+    """Azure OpenAI provider"""
+
+    def __init__(self, model_name="gpt-3.5-turbo", api_key=None, endpoint=None, session=None):
+        super().__init__(model_name, api_key, session)
+        self.endpoint = endpoint or os.environ.get("AZURE_OPENAI_ENDPOINT", "")
+        self.api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2023-07-01-preview")
+        self.api_base = f"{self.endpoint}/openai/deployments/{self.model_name}/chat/completions?api-version={self.api_version}"
+
+    def _headers(self):
+        """Azure authenticates with an api-key header instead of a bearer token"""
+        return {
+            "Content-Type": "application/json",
+            "api-key": self.api_key
+        }
+
+    def _payload(self, prompt, max_tokens, temperature):
+        """Azure selects the model through the deployment in the URL"""
+        data = super()._payload(prompt, max_tokens, temperature)
+        data.pop("model")
+        return data
+
+
 def get_llm_provider(provider="openai", model=None):
     """Factory function to get LLM provider"""
 
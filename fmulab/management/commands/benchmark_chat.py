@@ -0,0 +1,74 @@
+"""
+Load-test the chat views and report latency percentiles and throughput
+"""
+from django.core.management.base import BaseCommand
+
+from fmulab.benchmark import ViewDriver, build_fake_pipeline, run_load
+from fmulab.fakes import FakeLLMServer
+from fmulab.pipeline import set_qa_pipeline
+
+ENDPOINTS = ("chat", "index", "dashboard")
+
+
+class Command(BaseCommand):
+    help = ("Drive chat_api, index and dashboard at a given concurrency and report p50/p95/p99 "
+            "latency and requests/sec. Uses the offline LLM and Neo4j fakes unless --live is given. "
+            "Chat messages are saved to the configured database, so run it against a scratch one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", action="append", choices=ENDPOINTS,
+                            help="Endpoint to drive; repeat for several (default: all)")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint (default: 200)")
+        parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients (default: 10)")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per endpoint (default: 10)")
+        parser.add_argument("--live", action="store_true",
+                            help="Use the configured Neo4j and LLM services instead of the fakes")
+        parser.add_argument("--llm-latency", type=float, default=0.2,
+                            help="Fake LLM delay before the first token, in seconds (default: 0.2)")
+        parser.add_argument("--token-delay", type=float, default=0.0,
+                            help="Fake LLM delay between streamed tokens, in seconds (default: 0)")
+        parser.add_argument("--query-latency", type=float, default=0.002,
+                            help="Fake Neo4j round trip per query, in seconds (default: 0.002)")
+        parser.add_argument("--documents", type=int, default=10, help="Documents in the fake graph (default: 10)")
+        parser.add_argument("--chunks", type=int, default=50, help="Chunks per fake document (default: 50)")
+        parser.add_argument("--response-cache", action="store_true",
+                            help="Keep the response cache enabled (off by default so every chat reaches the LLM)")
+        parser.add_argument("--host", default="localhost", help="Host header sent with each request")
+
+    def handle(self, *args, **options):
+        endpoints = options["endpoint"] or list(ENDPOINTS)
+        driver = ViewDriver(host=options["host"])
+
+        if options["live"]:
+            self._run(driver, endpoints, options)
+            return
+
+        with FakeLLMServer(latency=options["llm_latency"], token_delay=options["token_delay"]) as llm_server:
+            qa = build_fake_pipeline(llm_server, documents=options["documents"],
+                                     chunks_per_document=options["chunks"],
+                                     query_latency=options["query_latency"],
+                                     pool_size=options["concurrency"])
+            if not options["response_cache"]:
+                qa.response_cache = None
+            previous = set_qa_pipeline(qa)
+            try:
+                self._run(driver, endpoints, options)
+            finally:
+                set_qa_pipeline(previous)
+
+    def _run(self, driver, endpoints, options):
+        self.stdout.write(f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'req/s':>8} "
+                          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for endpoint in endpoints:
+            send = getattr(driver, endpoint)
+            if options["warmup"]:
+                run_load(send, options["warmup"], options["concurrency"])
+            result = run_load(send, options["requests"], options["concurrency"])
+            self.stdout.write(
+                f"{endpoint:<10} {result['requests']:>8} {result['errors']:>6} {result['rps']:>8.1f} "
+                f"{self._ms(result['p50_ms'])} {self._ms(result['p95_ms'])} "
+                f"{self._ms(result['p99_ms'])} {self._ms(result['max_ms'])}"
+            )
+
+    def _ms(self, value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
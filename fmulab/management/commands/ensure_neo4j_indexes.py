@@ -0,0 +1,47 @@
+"""
+Create and verify the Neo4j indexes the QA pipeline depends on
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from fmulab.graph_db import Neo4jConnection
+from fmulab.indexes import ensure_indexes, find_label_scans
+
+
+class Command(BaseCommand):
+    help = ("Create missing vector, fulltext and range indexes and constraints, wait for them "
+            "to come online, and report pipeline queries whose plans still scan by label")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report index states and query plans; create nothing")
+        parser.add_argument("--timeout", type=int, default=300,
+                            help="Seconds to wait for new indexes to come online (default: 300)")
+
+    def handle(self, *args, **options):
+        neo4j = Neo4jConnection()
+        if neo4j.connect() is None:
+            raise CommandError("Could not connect to Neo4j")
+
+        try:
+            report = ensure_indexes(neo4j, create=not options["check"], timeout=options["timeout"])
+            scans = find_label_scans(neo4j)
+        finally:
+            neo4j.close()
+
+        problems = 0
+        for definition, state in report:
+            line = f"{definition.kind.lower():<10} {definition.name:<20} :{definition.label}({', '.join(definition.properties)})  {state}"
+            if state == "ONLINE":
+                self.stdout.write(line)
+            else:
+                problems += 1
+                self.stdout.write(self.style.ERROR(line))
+
+        for name, operators in sorted(scans.items()):
+            self.stdout.write(self.style.WARNING(f"query {name} plan uses {', '.join(sorted(set(operators)))}"))
+
+        if problems:
+            raise CommandError(f"{problems} index(es) are not online")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(report)} indexes online; {len(scans)} registered queries still scan by label"
+        ))
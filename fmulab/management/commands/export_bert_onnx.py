@@ -0,0 +1,33 @@
+"""
+Export the BERT classifier checkpoint to ONNX ahead of deployment
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fmulab.bert_classifier import BertClassifier, onnx_model_path, onnxruntime
+from fmulab.config import BERT_MODEL_PATH, BERT_NUM_LABELS, BERT_ONNX_DIR
+
+
+class Command(BaseCommand):
+    help = ("Export the classifier checkpoint to ONNX (FP32 and INT8), so web workers load the "
+            "export instead of creating it on their first prediction")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-path", default=BERT_MODEL_PATH,
+                            help=f"Fine-tuned checkpoint directory (default: {BERT_MODEL_PATH})")
+        parser.add_argument("--num-labels", type=int, default=BERT_NUM_LABELS)
+        parser.add_argument("--fp32-only", action="store_true", help="Skip the INT8 quantized export")
+
+    def handle(self, *args, **options):
+        if onnxruntime is None:
+            raise CommandError("onnxruntime is not installed")
+
+        backends = ["onnx"] if options["fp32_only"] else ["onnx", "onnx_int8"]
+        for backend in backends:
+            classifier = BertClassifier(options["model_path"], num_labels=options["num_labels"], backend=backend)
+            # Loading exports the checkpoint when the file does not exist yet
+            classifier.warm_up()
+            path = onnx_model_path(options["model_path"], backend == "onnx_int8", BERT_ONNX_DIR)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            self.stdout.write(self.style.SUCCESS(f"{backend}: {path} ({size_mb:.1f} MB)"))
@@ -0,0 +1,32 @@
+"""
+Rebuild the on-disk graph snapshots of completed documents
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from fmulab.graph_db import Neo4jConnection
+from fmulab.graph_snapshots import GraphSnapshotStore
+
+
+class Command(BaseCommand):
+    help = "Build missing or outdated graph snapshots and prune those of removed documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("documents", nargs="*",
+                            help="Document file names to rebuild (default: all completed documents)")
+        parser.add_argument("--force", action="store_true",
+                            help="Rebuild snapshots even when they are current")
+
+    def handle(self, *args, **options):
+        neo4j = Neo4jConnection()
+        if neo4j.connect() is None:
+            raise CommandError("Could not connect to Neo4j")
+
+        try:
+            store = GraphSnapshotStore(neo4j)
+            built, kept, pruned = store.rebuild(options["documents"] or None, force=options["force"])
+        finally:
+            neo4j.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Graph snapshots in {store.directory}: {built} built, {kept} current, {pruned} pruned"
+        ))
@@ -0,0 +1,168 @@
+"""
+Process-wide registry for the QA pipelines used by the views
+"""
+import os
+import time
+import atexit
+import asyncio
+import logging
+import weakref
+import threading
+from django.conf import settings
+
+from .graph_db import AsyncNeo4jConnection, Neo4jConnection
+from .llm_integration import get_llm_provider
+from .embeddings import get_embedding_service
+from .intent_router import get_intent_router
+from .qa_integration import AsyncQAIntegration, QAIntegration
+from .queries import warm_query_plans
+from .config import PIPELINE_HEALTH_CHECK_INTERVAL, QUERY_PLAN_WARM_UP
+
+_qa_pipeline = None
+_qa_pipeline_lock = threading.Lock()
+_health_thread = None
+_shutdown = threading.Event()
+_health = {"status": "not_started", "checked_at": None, "error": None}
+
+# Async pipelines hold an async Neo4j driver, which is bound to one event loop
+_async_qa_pipelines = weakref.WeakKeyDictionary()
+
+
+def _llm_provider():
+    return get_llm_provider(
+        provider=os.environ.get("LLM_PROVIDER", "openai"),
+        model=os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
+    )
+
+
+def _build_qa_pipeline():
+    neo4j_conn = Neo4jConnection(
+        uri=settings.NEO4J_URI,
+        username=settings.NEO4J_USERNAME,
+        password=settings.NEO4J_PASSWORD,
+        database=settings.NEO4J_DATABASE
+    )
+    neo4j_conn.connect()
+    return QAIntegration(neo4j_conn, _llm_provider(), embedder=get_embedding_service(),
+                         intent_router=get_intent_router())
+
+
+def get_qa_pipeline():
+    """Get or initialize the QA pipeline; concurrent first calls build it only once"""
+    global _qa_pipeline
+    if _qa_pipeline is None:
+        with _qa_pipeline_lock:
+            if _qa_pipeline is None:
+                _qa_pipeline = _build_qa_pipeline()
+    return _qa_pipeline
+
+
+def set_qa_pipeline(pipeline):
+    """
+    Replace the shared pipeline, for example with one built on the offline
+    fakes in tests and benchmarks. Returns the previous pipeline.
+    """
+    global _qa_pipeline
+    with _qa_pipeline_lock:
+        previous, _qa_pipeline = _qa_pipeline, pipeline
+    return previous
+
+
+def get_async_qa_pipeline():
+    """Get or initialize the async QA pipeline for the running event loop"""
+    loop = asyncio.get_running_loop()
+    pipeline = _async_qa_pipelines.get(loop)
+    if pipeline is None:
+        neo4j_conn = AsyncNeo4jConnection(
+            uri=settings.NEO4J_URI,
+            username=settings.NEO4J_USERNAME,
+            password=settings.NEO4J_PASSWORD,
+            database=settings.NEO4J_DATABASE
+        )
+        pipeline = AsyncQAIntegration(neo4j_conn, _llm_provider(), embedder=get_embedding_service(),
+                                      intent_router=get_intent_router())
+        _async_qa_pipelines[loop] = pipeline
+    return pipeline
+
+
+def check_health():
+    """
+    Verify Neo4j connectivity of the shared pipeline, reconnecting its driver
+    when the check fails. Returns the updated health status.
+    """
+    pipeline = get_qa_pipeline()
+    driver = pipeline.neo4j.driver
+    try:
+        pipeline.neo4j.verify_connectivity()
+        _health.update(status="ok", error=None)
+    except Exception as e:
+        logging.warning(f"Neo4j health check failed: {str(e)}")
+        _health.update(status="error", error=str(e))
+        # Only replace the driver that failed the ping, not one another thread already swapped in
+        pipeline.neo4j.reconnect(failed_driver=driver)
+    _health["checked_at"] = time.time()
+    return dict(_health)
+
+
+def get_health():
+    """Last known health of the shared pipeline, with its Neo4j pool utilization"""
+    health = dict(_health, initialized=_qa_pipeline is not None)
+    if _qa_pipeline is not None:
+        health["neo4j_pool"] = _qa_pipeline.neo4j.pool_metrics()
+    return health
+
+
+def _health_loop():
+    while not _shutdown.is_set():
+        try:
+            check_health()
+        except Exception as e:
+            logging.error(f"QA pipeline health check crashed: {str(e)}")
+            _health.update(status="error", error=str(e), checked_at=time.time())
+        _shutdown.wait(PIPELINE_HEALTH_CHECK_INTERVAL)
+
+
+def warm_start():
+    """
+    Build the pipeline, load the embedding and intent models and warm the Cypher query
+    plans in a background thread, then keep checking Neo4j connectivity, so
+    neither the first request after a deploy nor a dropped connection is paid
+    for by a user.
+    """
+    global _health_thread
+    if _health_thread is not None:
+        return
+
+    def run():
+        try:
+            pipeline = get_qa_pipeline()
+            embedder = get_embedding_service()
+            if embedder is not None:
+                embedder.warm_up()
+            router = get_intent_router()
+            if router is not None and router.classifier is not None:
+                router.classifier.warm_up()
+            if QUERY_PLAN_WARM_UP:
+                warm_query_plans(pipeline.neo4j)
+        except Exception as e:
+            logging.error(f"QA pipeline warm start failed: {str(e)}")
+        _health_loop()
+
+    _health_thread = threading.Thread(target=run, name="qa-pipeline-warm-start", daemon=True)
+    _health_thread.start()
+
+
+def close_qa_pipeline():
+    """Stop the health checks and close the shared pipeline's Neo4j driver"""
+    global _qa_pipeline
+    _shutdown.set()
+    with _qa_pipeline_lock:
+        if _qa_pipeline is not None:
+            try:
+                _qa_pipeline.close()
+            except Exception as e:
+                logging.warning(f"Error closing the QA pipeline: {str(e)}")
+            _qa_pipeline = None
+
+
+atexit.register(close_qa_pipeline)
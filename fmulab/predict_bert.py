@@ -1,62 +1,26 @@
-import torch
-from transformers import TrainingArguments, Trainer
-from transformers import BertTokenizer, BertForSequenceClassification
-
-import numpy as np
-
+import logging
 import warnings
 
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-
-# Create torch dataset
-class Dataset(torch.utils.data.Dataset):
-    def __init__(self, encodings, labels=None):
-        self.encodings = encodings
-        self.labels = labels
-
-    def __getitem__(self, idx):
-        item = {key: torch.tensor(val[idx]) for key, val in self.encodings.items()}
-        if self.labels:
-            item["labels"] = torch.tensor(self.labels[idx])
-        return item
-
-    def __len__(self):
-        return len(self.encodings["input_ids"])
+from .bert_classifier import get_bert_classifier
 
 
 def predict_bert(sentence, model_path, num_labels=5, max_length=512):
+    """
+    Predicted label of a sentence. The checkpoint is loaded once per process
+    and kept resident; use get_bert_classifier(...).predict_many() to
+    classify several sentences in one call.
+    """
     warnings.filterwarnings("ignore", category=FutureWarning)
-    # Define pretrained tokenizer and model
-    model_name = "bert-base-uncased"
-    tokenizer = BertTokenizer.from_pretrained(model_name)
-    # ----- Predict -----#
-    X_test = list([sentence])
-    X_test_tokenized = tokenizer(X_test, padding=True, truncation=True, max_length=max_length)
-
-    # Create torch dataset
-    test_dataset = Dataset(X_test_tokenized)
-
-    # Load trained model
-    # model_path = "static/checkpoint-3000"
-    model = BertForSequenceClassification.from_pretrained(model_path, num_labels=num_labels)
-
-    # Define test trainer
-    test_trainer = Trainer(model)
-
-    # Make prediction
-    raw_pred, _, _ = test_trainer.predict(test_dataset)
-
-    # Preprocess raw predictions
-    y_pred = np.argmax(raw_pred, axis=1)
+    classifier = get_bert_classifier(model_path, num_labels=num_labels, max_length=max_length)
+    y_pred = classifier.predict(sentence)
 
-    print('Prediction for: ', sentence, ' is: ', y_pred)
-    print('Prediction list: ', sentence, ' is: ', raw_pred)
-    return y_pred[0]
+    logging.info(f"Prediction for: {sentence} is: {y_pred}")
+    return y_pred
 
 
-# Press the green button in the gutter to run the script.
+# Run as a module (python -m fmulab.predict_bert) so the package imports resolve.
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     new_sentence = 'Mocking kung fu pictures when they were a staple of exploitation theater programming was witty'  # 3
     # new_sentence = 'scattered over the course of 80 minutes'  # 1
     # new_sentence = 'introspective and entertaining'  # 3
@@ -2,12 +2,47 @@
 QA Integration module for connecting Neo4j with LLMs
 """
 import logging
+import math
 import re
 import json
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from .graph_db import Neo4jConnection
+from .graph_db import Neo4jConnection, normalize_document_names
+from .graph_snapshots import GraphSnapshotStore
 from .llm_integration import get_llm_provider
+from .response_cache import ResponseCache, CACHE_MISS, CACHE_BYPASS
+from .conversation_memory import ConversationMemory, is_follow_up
+from .document_catalogue import DocumentCatalogue
+from .context_packer import ContextPacker, format_context_part
+from .instrumentation import span, record_tokens, record_cache
+from .config import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TEMPERATURE,
+    RESPONSE_CACHE_ENABLED,
+    CHAT_MODE_CONFIG_MAP,
+    CHAT_DEFAULT_MODE,
+    CHAT_FULLTEXT_MODE,
+    VECTOR_SEARCH_TOP_K,
+    VECTOR_GRAPH_SEARCH_ENTITY_LIMIT,
+    CHUNK_TEXT_SEARCH_QUERY,
+    CHUNK_TEXT_DOCUMENT_SEARCH_QUERY,
+    VECTOR_INDEX_SEARCH_QUERY,
+    VECTOR_INDEX_DOCUMENT_SEARCH_QUERY,
+    VECTOR_DOCUMENT_EXACT_SEARCH_QUERY,
+    FULLTEXT_INDEX_SEARCH_QUERY,
+    FULLTEXT_INDEX_DOCUMENT_SEARCH_QUERY,
+    CHUNK_CONTEXT_QUERY,
+    CONTEXT_QUERY_BY_LABEL,
+    RETRIEVAL_DOCUMENT_FILTER_OVERSAMPLE,
+    RETRIEVAL_MAX_WORKERS,
+    RETRIEVAL_SHARD_SIZE,
+    RETRIEVAL_MAX_CANDIDATES,
+    RRF_K,
+    GRAPH_CHUNK_LIMIT,
+    GRAPH_SNAPSHOTS_ENABLED,
+)
 
 # Set up logging
 logging.basicConfig(
@@ -39,11 +74,134 @@ Remember: You have access to a rich knowledge graph about FMU simulations and aq
 
 
 
+# Characters with a special meaning in Lucene query syntax
+LUCENE_SPECIAL_CHARACTERS = re.compile(r'[+\-&|!(){}\[\]^"~*?:\\/]')
+
+
+def lucene_query(text):
+    """Turn free text into a safe fulltext index query by dropping Lucene operators"""
+    return " ".join(LUCENE_SPECIAL_CHARACTERS.sub(" ", text).split())
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """
+    Fuse ranked lists of (element_id, score) pairs. Each element scores
+    sum(1 / (k + rank)) over the lists it appears in; duplicates within a
+    list only count at their best rank.
+
+    Returns:
+    list: (element_id, fused_score) pairs, best first.
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        seen = set()
+        for rank, (element_id, _) in enumerate(ranked, start=1):
+            if element_id in seen:
+                continue
+            seen.add(element_id)
+            fused[element_id] = fused.get(element_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def shard_documents(document_names, shard_size=RETRIEVAL_SHARD_SIZE):
+    """Split a document selection into shards of at most ``shard_size`` names"""
+    return [document_names[i:i + shard_size] for i in range(0, len(document_names), shard_size)]
+
+
+def shard_candidates(top_k, shard_size, catalogue_size, oversample=RETRIEVAL_DOCUMENT_FILTER_OVERSAMPLE):
+    """
+    Vector index candidates to fetch for a shard of ``shard_size`` documents,
+    so that with chunks spread evenly over the catalogue about ``oversample``
+    times top_k of them belong to the shard.
+    """
+    return math.ceil(top_k * oversample * max(catalogue_size, shard_size) / shard_size)
+
+
+def exact_shard_search(search_query, params, records):
+    """
+    The exact search to re-run a document-filtered vector lookup with when
+    its index candidates held fewer than top_k chunks of the shard, or None.
+    """
+    if search_query != VECTOR_INDEX_DOCUMENT_SEARCH_QUERY or len(records) >= params["top_k"]:
+        return None
+    return VECTOR_DOCUMENT_EXACT_SEARCH_QUERY, {
+        "top_k": params["top_k"], "document_names": params["document_names"], "embedding": params["embedding"]
+    }
+
+
+def merge_shard_hits(shard_results, top_k):
+    """
+    Merge the records of one lookup run over several shards into a single
+    ranking. The shards share one score scale, so hits are ordered by score.
+
+    Returns:
+    list: dicts with element_id and score, best first.
+    """
+    best = {}
+    for records in shard_results:
+        for record in records:
+            element_id, score = record["element_id"], record["score"]
+            if element_id not in best or score > best[element_id]:
+                best[element_id] = score
+    ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{"element_id": element_id, "score": score} for element_id, score in ranked]
+
+
+def document_scope(document_names, catalogue_documents):
+    """
+    The documents retrieval must be restricted to, or None when the selection
+    covers every completed document and the filter would exclude nothing.
+    """
+    if not document_names:
+        return None
+    if catalogue_documents and set(document_names) >= set(catalogue_documents):
+        return None
+    return list(document_names)
+
+
+NO_INFORMATION_RESPONSE = "I couldn't find any relevant information to answer your question."
+
+
+class ChatTurn:
+    """
+    One chat message on its way through the pipeline. ``reply`` is set when
+    the message is answered without the LLM (canned intent answer, cached
+    response or nothing retrieved); otherwise ``prompt`` holds the LLM prompt.
+    ``embedding`` is the query embedding shared by the response cache and retrieval.
+    """
+    __slots__ = ("query", "document_names", "session_id", "conversation", "route", "mode", "metadata",
+                 "embedding", "reply", "sources", "prompt", "context_metadata")
+
+    def __init__(self, query, document_names, session_id, conversation, route, mode):
+        self.query = query
+        self.document_names = document_names
+        self.session_id = session_id
+        self.conversation = conversation
+        self.route = route
+        self.mode = mode
+        self.metadata = route.metadata() if route else {}
+        self.embedding = None
+        self.reply = None
+        self.sources = []
+        self.prompt = None
+        self.context_metadata = {}
+
+
+# Shared pool for concurrent Neo4j lookups; each task borrows a driver connection
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+
+
 class QAIntegration:
     """QA Pipeline integrating Neo4j and LLMs"""
 
-    def __init__(self, neo4j_connection=None, llm_provider=None):
-        """Initialize the QA pipeline"""
+    def __init__(self, neo4j_connection=None, llm_provider=None, response_cache=None, embedder=None,
+                 mode=CHAT_DEFAULT_MODE, intent_router=None):
+        """
+        Initialize the QA pipeline. ``embedder`` is a callable turning query
+        text into a vector for the vector index modes; without it retrieval
+        uses the fulltext indexes. ``intent_router`` answers trivial messages
+        without retrieval and picks the chat mode for the rest.
+        """
         from django.conf import settings
 
         if neo4j_connection is None:
@@ -60,12 +218,33 @@ class QAIntegration:
         if not self.neo4j.driver:
             self.neo4j.connect()
 
+        self.catalogue = DocumentCatalogue(self.neo4j)
+        self.snapshots = GraphSnapshotStore(self.neo4j) if GRAPH_SNAPSHOTS_ENABLED else None
+        self._setup_generation(llm_provider, response_cache, embedder, mode, intent_router)
+
+    def _setup_generation(self, llm_provider, response_cache, embedder, mode, intent_router=None):
+        """Configure retrieval, intent routing, the LLM, generation parameters and response cache"""
+        self.embedder = embedder
+        self.mode = mode
+        self.intent_router = intent_router
         self.llm = llm_provider or get_llm_provider()
-        self.chat_history = {}  # Session ID -> list of messages
+        self.packer = ContextPacker(self.llm.model_name)
+        self.max_tokens = DEFAULT_MAX_TOKENS
+        self.temperature = DEFAULT_TEMPERATURE
+        if response_cache is None and RESPONSE_CACHE_ENABLED:
+            response_cache = ResponseCache(embedder=embedder)
+        self.response_cache = response_cache
+        self.memory = ConversationMemory()
 
     def get_documents(self):
         """Get list of available documents"""
-        return self.neo4j.get_completed_documents()
+        return self.catalogue.get_documents()
+
+    def get_document_graph(self, document_names, chunk_limit=GRAPH_CHUNK_LIMIT):
+        """Graph of the given documents, served from snapshots when enabled"""
+        if self.snapshots is not None and chunk_limit == self.snapshots.chunk_limit:
+            return self.snapshots.get_graph(document_names)
+        return self.neo4j.fetch_graph_for_documents(document_names, chunk_limit)
 
     def _format_context_from_chunks(self, chunks):
         """Format chunks into context for LLM prompt"""
@@ -80,34 +259,20 @@ class QAIntegration:
     def retrieve_chunks(self, query, document_names=None, limit=5):
         """Retrieve relevant chunks from Neo4j based on query"""
         try:
-            # Basic semantic search query - in production, use vector similarity
-            search_query = """
-            MATCH (d:Document)
-            WHERE d.fileName IN $document_names
-            MATCH (d)<-[:PART_OF]-(c:Chunk)
-            WHERE c.text CONTAINS $query_text
-            RETURN c
-            LIMIT $limit
-            """
-
-            if not document_names:
-                # If no documents specified, search all documents
-                search_query = """
-                MATCH (d:Document)<-[:PART_OF]-(c:Chunk)
-                WHERE toLower(c.text) CONTAINS toLower($query_text)
-                RETURN c
-                LIMIT $limit
-                """
-
+            # Basic substring search - in production, use vector similarity
             params = {
                 "query_text": query,
                 "limit": limit
             }
 
             if document_names:
+                search_query = CHUNK_TEXT_DOCUMENT_SEARCH_QUERY
                 params["document_names"] = document_names
+            else:
+                # If no documents specified, search all documents
+                search_query = CHUNK_TEXT_SEARCH_QUERY
 
-            records, _ = self.neo4j.execute_query(search_query, params)
+            records, _, _ = self.neo4j.execute_read_query(search_query, params)
 
             chunks = []
             for record in records:
@@ -124,152 +289,573 @@ class QAIntegration:
             logging.error(f"Error retrieving chunks: {str(e)}")
             return []
 
-    def retrieve_graph_context(self, query, document_names=None, limit=10):
-        """Retrieve relevant graph context from Neo4j based on query"""
+    def _mode_config(self, mode=None):
+        """Retrieval settings for a chat mode from CHAT_MODE_CONFIG_MAP"""
+        mode = mode or self.mode
+        if mode not in CHAT_MODE_CONFIG_MAP:
+            logging.warning(f"Unknown chat mode '{mode}', using '{CHAT_DEFAULT_MODE}'")
+            mode = CHAT_DEFAULT_MODE
+        return CHAT_MODE_CONFIG_MAP[mode]
+
+    def _needs_embedding(self, mode_config):
+        """Whether retrieval in this mode can use a query embedding"""
+        return self.embedder is not None and bool(mode_config.get("index_name"))
+
+    def _shares_embedder(self):
+        """Whether the response cache compares embeddings from the pipeline's embedder"""
+        return self.response_cache is not None and self.embedder is not None \
+            and self.response_cache.embedder is self.embedder
+
+    def _query_embedding(self, query, mode=None):
+        """
+        Embed the query once for both the response cache's similarity lookup
+        and vector retrieval, or None when neither of them uses it.
+        """
+        if not self._shares_embedder() and not self._needs_embedding(self._mode_config(mode)):
+            return None
+        return self.embedder(query)
+
+    def _plan_searches(self, query, document_names, mode_config, embedding=None, limit=None, catalogue_size=0):
+        """
+        Choose the index lookups for a chat mode.
+
+        Modes with both a vector and a fulltext index run both lookups when a
+        query embedding is available (hybrid search); otherwise the vector
+        index is used if there is an embedding, else the fulltext index.
+        Modes without a usable index fall back to the chunk fulltext index of
+        CHAT_FULLTEXT_MODE, still restricted to the selected documents when the
+        mode filters by document.
+
+        A vector lookup restricted to some documents fans out over shards of
+        RETRIEVAL_SHARD_SIZE documents. Each shard fetches enough index
+        candidates for its share of the ``catalogue_size`` documents, or
+        searches its documents exactly when that would exceed
+        RETRIEVAL_MAX_CANDIDATES.
+
+        Returns:
+        tuple: (searches, node_label, top_k) where searches holds one list of
+        (search_query, params) shards per lookup.
+        """
+        top_k = limit or mode_config.get("top_k", VECTOR_SEARCH_TOP_K)
+        index_name = mode_config.get("index_name")
+        keyword_index = mode_config.get("keyword_index")
+        use_vector = bool(index_name) and embedding is not None
+
+        if not use_vector and not keyword_index:
+            # Borrow the chunk fulltext index, but keep the mode's own document filter
+            fallback = CHAT_MODE_CONFIG_MAP[CHAT_FULLTEXT_MODE]
+            keyword_index = fallback["keyword_index"]
+            mode_config = dict(mode_config, keyword_index=keyword_index, node_label=fallback["node_label"])
+
+        node_label = mode_config.get("node_label", "Chunk")
+        filter_documents = bool(document_names) and mode_config.get("document_filter") and node_label == "Chunk"
+        base_params = {
+            "top_k": top_k,
+            "candidates": top_k * RETRIEVAL_DOCUMENT_FILTER_OVERSAMPLE if filter_documents else top_k
+        }
+
+        searches = []
+        if use_vector and filter_documents:
+            shards = []
+            for shard in shard_documents(document_names):
+                params = {"top_k": top_k, "document_names": shard, "embedding": list(embedding)}
+                candidates = shard_candidates(top_k, len(shard), catalogue_size)
+                if candidates > RETRIEVAL_MAX_CANDIDATES:
+                    shards.append((VECTOR_DOCUMENT_EXACT_SEARCH_QUERY, params))
+                else:
+                    shards.append((VECTOR_INDEX_DOCUMENT_SEARCH_QUERY,
+                                   dict(params, index_name=index_name, candidates=candidates)))
+            searches.append(shards)
+        elif use_vector:
+            searches.append([(
+                VECTOR_INDEX_SEARCH_QUERY,
+                dict(base_params, index_name=index_name, embedding=list(embedding))
+            )])
+        if keyword_index:
+            params = dict(base_params, keyword_index=keyword_index, query_text=lucene_query(query))
+            if filter_documents:
+                params["document_names"] = document_names
+            searches.append([(
+                FULLTEXT_INDEX_DOCUMENT_SEARCH_QUERY if filter_documents else FULLTEXT_INDEX_SEARCH_QUERY,
+                params
+            )])
+
+        return searches, node_label, top_k
+
+    def _merge_hits(self, search_results, top_k):
+        """
+        Merge the records of one or more index lookups into deduplicated hits.
+        The shards of a lookup are merged by score; several lookups are then
+        combined with reciprocal-rank fusion, since vector and fulltext scores
+        are not on comparable scales.
+        """
+        search_results = [merge_shard_hits(shard_results, top_k) for shard_results in search_results]
+        ranked_lists = [[(record["element_id"], record["score"]) for record in records]
+                        for records in search_results]
+        if len(ranked_lists) == 1:
+            hits = ranked_lists[0]
+        else:
+            hits = reciprocal_rank_fusion(ranked_lists)
+        return [{"element_id": element_id, "score": score} for element_id, score in hits[:top_k]]
+
+    def _plan_context(self, hits, node_label):
+        """Build the context expansion query for the nodes returned by the index lookups"""
+        params = {"hits": hits, "entity_limit": VECTOR_GRAPH_SEARCH_ENTITY_LIMIT}
+        return CONTEXT_QUERY_BY_LABEL.get(node_label, CHUNK_CONTEXT_QUERY), params
+
+    def _search_shard(self, search_query, params):
+        """Run one shard of an index lookup, searching it exactly if the index candidates starved it"""
+        records, _, _ = self.neo4j.execute_read_query(search_query, params)
+        exact = exact_shard_search(search_query, params, records)
+        if exact is not None:
+            records, _, _ = self.neo4j.execute_read_query(*exact)
+        return records
+
+    def _run_searches(self, searches):
+        """
+        Run every shard of every index lookup concurrently, so retrieval costs
+        the slowest shard rather than the sum of them.
+
+        Returns:
+        list: For each lookup, the record lists of its shards.
+        """
+        shards = [shard for lookup in searches for shard in lookup]
+        if len(shards) == 1:
+            return [[self._search_shard(*shards[0])]]
+
+        futures = [[RETRIEVAL_EXECUTOR.submit(self._search_shard, search_query, params)
+                    for search_query, params in lookup]
+                   for lookup in searches]
+        return [[future.result() for future in lookup] for lookup in futures]
+
+    def _format_graph_records(self, records):
+        """Process graph context records into formatted context parts"""
+        context_parts = []
+
+        for record in records:
+            relationships = [r for r in record["relationships"] or [] if r is not None]
+            context_parts.append(format_context_part(
+                record["source"], record["chunk_text"], record["entities"], relationships
+            ))
+
+        return context_parts
+
+    def retrieve_context_records(self, query, document_names=None, limit=None, mode=None, embedding=None):
+        """
+        Retrieve relevant graph context records from Neo4j based on query.
+
+        The chat mode selects the vector and/or fulltext index to search, so
+        only the top_k matching nodes are expanded into chunk text, entities
+        and relationships. ``embedding`` is the query embedding when the
+        caller already has it.
+
+        Returns:
+        list: dicts with chunk_text, source, score, entities and relationships.
+        """
         try:
-            # Use a more sophisticated query that leverages the graph structure
-            # This query finds relevant chunks, then expands to include connected entities and their relationships
-            graph_query = """
-            // First find relevant chunks using vector similarity or text matching
-            MATCH (c:Chunk)
-            WHERE c.text CONTAINS $query_text OR EXISTS(c.embedding)
-            WITH c, CASE 
-                WHEN EXISTS(c.embedding) THEN 1.0 
-                ELSE apoc.text.similarity(c.text, $query_text) 
-            END AS relevance
-            ORDER BY relevance DESC
-            LIMIT $limit
-
-            // Get the documents these chunks belong to
-            MATCH (c)-[:PART_OF]->(d:Document)
-
-            // Expand to related entities
-            OPTIONAL MATCH path = (c)-[:HAS_ENTITY]->(e)
-
-            // Also get relationships between entities
-            OPTIONAL MATCH entity_rels = (e)-[r]-(other:__Entity__)
-
-            // Collect all the results
-            RETURN c.text AS chunk_text, 
-                   d.fileName AS source,
-                   collect(DISTINCT e.id) AS entities,
-                   collect(DISTINCT type(r) + ': ' + other.id) AS relationships
-            """
+            mode_config = self._mode_config(mode)
+            if embedding is None and self._needs_embedding(mode_config):
+                embedding = self.embedder(query)
+
+            catalogue = self.get_documents() if document_names else None
+            document_names = document_scope(document_names, catalogue)
+            searches, node_label, top_k = self._plan_searches(query, document_names, mode_config, embedding, limit,
+                                                              len(catalogue or []))
+            hits = self._merge_hits(self._run_searches(searches), top_k)
+            if not hits:
+                return []
+
+            context_query, context_params = self._plan_context(hits, node_label)
+            records, _, _ = self.neo4j.execute_read_query(context_query, context_params)
+            return [record.data() for record in records]
 
-            params = {
-                "query_text": query,
-                "limit": limit
-            }
+        except Exception as e:
+            logging.error(f"Error retrieving graph context: {str(e)}")
+            return []
 
-            if document_names:
-                graph_query = graph_query.replace(
-                    "MATCH (c:Chunk)",
-                    "MATCH (c:Chunk)-[:PART_OF]->(d:Document) WHERE d.fileName IN $document_names"
+    def retrieve_graph_context(self, query, document_names=None, limit=None, mode=None):
+        """Retrieve relevant graph context from Neo4j as formatted context parts"""
+        return self._format_graph_records(self.retrieve_context_records(query, document_names, limit, mode))
+
+    def _open_session(self, query, session_id=None):
+        """
+        Record the query in the session's conversation memory.
+
+        Returns:
+        tuple: (session_id, conversation) where conversation is the prompt
+        section for the earlier turns, empty for a new session.
+        """
+        if not session_id:
+            session_id = f"session_{datetime.now().timestamp()}"
+
+        conversation = self.memory.format_for_prompt(session_id)
+        self.memory.append(session_id, "user", query)
+        return session_id, conversation
+
+    def _remember(self, session_id, response):
+        """Record an assistant message in the session's conversation memory"""
+        self.memory.append(session_id, "assistant", response)
+
+    def _build_prompt(self, query, records, conversation=""):
+        """
+        Build the LLM prompt from the retrieved context records, packed into
+        the model's context token budget, and the earlier conversation.
+
+        Returns:
+        tuple: (prompt, sources, context_metadata). The prompt is None when no
+        context was found.
+        """
+        #if not chunks:
+        if not records:
+            return None, [], {}
+
+        # Format chunks into context
+        #context = self._format_context_from_chunks(chunks)
+        with span("context"):
+            # Rank, format and truncate the context to the token budget
+            packed = self.packer.pack(records)
+
+            # Generate the prompt with context
+            prompt = SYSTEM_PROMPT.format(packed.text) + conversation + f"\nQuestion: {query}"
+
+        return prompt, packed.sources, packed.metadata()
+
+    def _cache_lookup(self, query, document_names, mode=None, conversation="", embedding=None):
+        """
+        Look up a cached response for the query, returning (cached, cache_status).
+        Follow-up questions depend on the conversation, so they bypass the cache;
+        self-contained questions in an ongoing conversation still use it.
+        ``embedding`` is reused for similarity lookups instead of embedding the
+        query again.
+        """
+        if conversation and is_follow_up(query):
+            cached, cache_status = None, CACHE_BYPASS
+        elif self.response_cache is None:
+            cached, cache_status = None, CACHE_MISS
+        else:
+            with span("cache_lookup"):
+                cached, cache_status = self.response_cache.get(
+                    query, document_names, self.llm.model_name, self.temperature, mode=mode or self.mode,
+                    embedding=embedding if self._shares_embedder() else None
                 )
-                params["document_names"] = document_names
+        record_cache(cache_status)
+        return cached, cache_status
+
+    def _cache_store(self, query, document_names, response, sources, mode=None, conversation="", embedding=None):
+        """Cache a generated response; provider errors and follow-up answers are never cached"""
+        if self.response_cache is None or not response or response.startswith("Error"):
+            return
+        if conversation and is_follow_up(query):
+            return
+        self.response_cache.set(query, document_names, self.llm.model_name, self.temperature, {
+            "message": response,
+            "sources": sources
+        }, mode=mode or self.mode, embedding=embedding if self._shares_embedder() else None)
+
+    def _response(self, session_id, message, sources, **metadata):
+        """Build the response dict returned to the views"""
+        return {
+            "message": message,
+            "sources": sources,
+            "session_id": session_id,
+            "metadata": metadata
+        }
+
+    def _route(self, query, mode=None):
+        """
+        Route the message through the intent router. An explicitly requested
+        mode is kept, and trivial intents are still answered from the canned replies.
+
+        Returns:
+        tuple: (route, mode) where route is None without an intent router.
+        """
+        if self.intent_router is None:
+            return None, mode
+        with span("intent"):
+            route = self.intent_router.route(query)
+        return route, mode or route.mode
+
+    def _fallback_mode(self, route, mode):
+        """
+        The mode to retry retrieval in when the mode chosen by the intent router
+        finds nothing, e.g. community search on a graph without communities.
+        """
+        if route is not None and route.mode and route.mode == mode and mode != CHAT_DEFAULT_MODE:
+            return CHAT_DEFAULT_MODE
+        return None
+
+    def _count_tokens(self, kind, text):
+        """Record the LLM prompt or completion size in tokens"""
+        record_tokens(kind, self.packer.counter.count(text))
+
+    def _record_error(self, session_id, error):
+        """Log a pipeline error and record the apology in the chat history"""
+        logging.error(f"Error in QA pipeline: {str(error)}", exc_info=True)
+        error_response = f"I'm sorry, but I encountered an error while processing your question: {str(error)}"
+
+        if session_id:
+            self._remember(session_id, error_response)
+
+        return error_response
+
+    def _start_turn(self, query, session_id=None, document_names=None, mode=None):
+        """
+        Record the message, route it and look up the response cache. Canned
+        and cached answers are recorded as the assistant's reply here.
+
+        Returns:
+        ChatTurn: with ``reply`` set when no retrieval or LLM call is needed.
+        """
+        session_id, conversation = self._open_session(query, session_id)
+        route, mode = self._route(query, mode)
+        turn = ChatTurn(query, document_names, session_id, conversation, route, mode)
+        if route is not None and route.answer is not None:
+            turn.reply = route.answer
+        else:
+            turn.embedding = self._query_embedding(query, mode)
+            cached, cache_status = self._cache_lookup(query, document_names, mode, conversation, turn.embedding)
+            turn.metadata["cache"] = cache_status
+            if cached is not None:
+                turn.reply, turn.sources = cached["message"], cached["sources"]
+
+        if turn.reply is not None:
+            self._remember(session_id, turn.reply)
+        return turn
+
+    def _prepare_prompt(self, turn, records):
+        """Build the LLM prompt of the turn, or record the no-information reply when nothing was retrieved"""
+        turn.prompt, turn.sources, turn.context_metadata = self._build_prompt(turn.query, records,
+                                                                              turn.conversation)
+        if turn.prompt is None:
+            turn.reply = NO_INFORMATION_RESPONSE
+            self._remember(turn.session_id, turn.reply)
+
+    def _reply_response(self, turn):
+        """Response dict for a turn answered without the LLM"""
+        return self._response(turn.session_id, turn.reply, turn.sources, **turn.metadata)
+
+    def _log_prompt(self, turn, streaming=False):
+        """Log the start of the LLM prompt and record its size"""
+        logging.info(f"{'Streaming' if streaming else 'Sending'} prompt to LLM: {turn.prompt[:200]}...")
+        self._count_tokens("prompt", turn.prompt)
+
+    def _finish_turn(self, turn, response, streaming=False):
+        """Record the LLM response in the conversation and response cache and build the response dict"""
+        self._count_tokens("completion", response)
+        logging.info(f"{'Streamed' if streaming else 'Received'} response from LLM: {response[:200]}...")
+        self._remember(turn.session_id, response)
+        self._cache_store(turn.query, turn.document_names, response, turn.sources, turn.mode, turn.conversation,
+                          turn.embedding)
+        return self._response(turn.session_id, response, turn.sources, **turn.metadata, **turn.context_metadata)
+
+    def _retrieve_for_turn(self, turn):
+        """Context records for the turn, retried in the default mode when the routed mode finds nothing"""
+        records = self.retrieve_context_records(turn.query, turn.document_names, mode=turn.mode,
+                                                embedding=turn.embedding)
+        fallback_mode = self._fallback_mode(turn.route, turn.mode)
+        if not records and fallback_mode:
+            records = self.retrieve_context_records(turn.query, turn.document_names, mode=fallback_mode,
+                                                    embedding=turn.embedding)
+        return records
+
+    def _prepare_turn(self, query, session_id, document_names, mode):
+        """Start the turn and, unless it is already answered, retrieve its context and build the prompt"""
+        turn = self._start_turn(query, session_id, document_names, mode)
+        if turn.reply is None:
+            with span("retrieval"):
+                records = self._retrieve_for_turn(turn)
+            self._prepare_prompt(turn, records)
+        return turn
+
+    def get_chat_response(self, query, session_id=None, document_names=None, mode=None):
+        """Get a response to the user query"""
+        turn = None
+        try:
+            turn = self._prepare_turn(query, session_id, document_names, mode)
+            if turn.reply is not None:
+                return self._reply_response(turn)
 
-            records, _, _ = self.neo4j.execute_query(graph_query, params)
+            self._log_prompt(turn)
+            with span("llm"):
+                response = self.llm.generate(turn.prompt, max_tokens=self.max_tokens, temperature=self.temperature)
+            return self._finish_turn(turn, response)
 
-            # Process the results into a context format
-            context_parts = []
+        except Exception as e:
+            session_id = turn.session_id if turn else session_id
+            return self._response(session_id, self._record_error(session_id, e), [])
+
+    def stream_chat_response(self, query, session_id=None, document_names=None, mode=None):
+        """
+        Streaming variant of get_chat_response.
+
+        Yields ("token", text) tuples as the LLM produces them, followed by a
+        single ("done", response) tuple whose response has the same shape as
+        the dict returned by get_chat_response.
+        """
+        turn = None
+        try:
+            turn = self._prepare_turn(query, session_id, document_names, mode)
+            if turn.reply is not None:
+                yield "token", turn.reply
+                yield "done", self._reply_response(turn)
+                return
+
+            self._log_prompt(turn, streaming=True)
+            fragments = []
+            # Includes the time the client takes to read each token
+            with span("llm_stream"):
+                for fragment in self.llm.stream(turn.prompt, max_tokens=self.max_tokens,
+                                                temperature=self.temperature):
+                    fragments.append(fragment)
+                    yield "token", fragment
+            yield "done", self._finish_turn(turn, "".join(fragments), streaming=True)
 
-            for record in records:
-                chunk_text = record["chunk_text"]
-                source = record["source"]
-                entities = record["entities"]
-                relationships = record["relationships"]
+        except Exception as e:
+            session_id = turn.session_id if turn else session_id
+            error_response = self._record_error(session_id, e)
+            yield "token", error_response
+            yield "done", self._response(session_id, error_response, [])
+
+    def close(self):
+        """Close connections"""
+        if self.neo4j:
+            self.neo4j.close()
 
-                context_part = f"Source: {source}\n\nContent: {chunk_text}\n"
 
-                if entities:
-                    context_part += "\nEntities: " + ", ".join(entities)
+class AsyncQAIntegration(QAIntegration):
+    """
+    QA pipeline for async views. Expects an AsyncNeo4jConnection and an LLM
+    provider implementing agenerate, so no worker thread is held while
+    waiting on Neo4j or the LLM.
+    """
 
-                if relationships:
-                    filtered_rels = [r for r in relationships if r is not None]
-                    if filtered_rels:
-                        context_part += "\nRelationships: " + ", ".join(filtered_rels)
+    def __init__(self, neo4j_connection, llm_provider=None, response_cache=None, embedder=None,
+                 mode=CHAT_DEFAULT_MODE, intent_router=None):
+        """Initialize the async QA pipeline"""
+        self.neo4j = neo4j_connection
+        if not self.neo4j.driver:
+            self.neo4j.connect()
 
-                context_parts.append(context_part)
+        self.catalogue = DocumentCatalogue(self.neo4j)
+        # Graph snapshots are built with the sync driver; use get_qa_pipeline() for graphs
+        self.snapshots = None
+        self._setup_generation(llm_provider, response_cache, embedder, mode, intent_router)
 
-            return context_parts
+    async def get_documents(self):
+        """Get list of available documents"""
+        documents = await asyncio.to_thread(self.catalogue.get_cached)
+        if documents is None:
+            documents = await self.neo4j.get_completed_document_metadata()
+            await asyncio.to_thread(self.catalogue.store, documents)
+        return [document["fileName"] for document in documents]
+
+    async def _search_shard(self, search_query, params):
+        """Run one shard of an index lookup, searching it exactly if the index candidates starved it"""
+        records, _, _ = await self.neo4j.execute_read_query(search_query, params)
+        exact = exact_shard_search(search_query, params, records)
+        if exact is not None:
+            records, _, _ = await self.neo4j.execute_read_query(*exact)
+        return records
+
+    async def retrieve_context_records(self, query, document_names=None, limit=None, mode=None, embedding=None):
+        """Retrieve relevant graph context records from Neo4j based on query"""
+        try:
+            mode_config = self._mode_config(mode)
+            if embedding is None and self._needs_embedding(mode_config):
+                embedding = await asyncio.to_thread(self.embedder, query)
+
+            catalogue = await self.get_documents() if document_names else None
+            document_names = document_scope(document_names, catalogue)
+            searches, node_label, top_k = self._plan_searches(query, document_names, mode_config, embedding, limit,
+                                                              len(catalogue or []))
+            results = await asyncio.gather(*(
+                asyncio.gather(*(self._search_shard(search_query, params) for search_query, params in lookup))
+                for lookup in searches
+            ))
+            hits = self._merge_hits(results, top_k)
+            if not hits:
+                return []
+
+            context_query, context_params = self._plan_context(hits, node_label)
+            records, _, _ = await self.neo4j.execute_read_query(context_query, context_params)
+            return [record.data() for record in records]
 
         except Exception as e:
             logging.error(f"Error retrieving graph context: {str(e)}")
             return []
 
-    def get_chat_response(self, query, session_id=None, document_names=None):
+    async def retrieve_graph_context(self, query, document_names=None, limit=None, mode=None):
+        """Retrieve relevant graph context from Neo4j as formatted context parts"""
+        return self._format_graph_records(await self.retrieve_context_records(query, document_names, limit, mode))
+
+    async def _retrieve_for_turn(self, turn):
+        """Context records for the turn, retried in the default mode when the routed mode finds nothing"""
+        records = await self.retrieve_context_records(turn.query, turn.document_names, mode=turn.mode,
+                                                      embedding=turn.embedding)
+        fallback_mode = self._fallback_mode(turn.route, turn.mode)
+        if not records and fallback_mode:
+            records = await self.retrieve_context_records(turn.query, turn.document_names, mode=fallback_mode,
+                                                          embedding=turn.embedding)
+        return records
+
+    async def _prepare_turn(self, query, session_id, document_names, mode):
+        """Start the turn and, unless it is already answered, retrieve its context and build the prompt"""
+        # Cache backends such as Redis and the intent classifier block, so keep them off the event loop
+        turn = await asyncio.to_thread(self._start_turn, query, session_id, document_names, mode)
+        if turn.reply is None:
+            with span("retrieval"):
+                records = await self._retrieve_for_turn(turn)
+            await asyncio.to_thread(self._prepare_prompt, turn, records)
+        return turn
+
+    async def get_chat_response(self, query, session_id=None, document_names=None, mode=None):
         """Get a response to the user query"""
+        turn = None
         try:
-            # Initialize or get chat history
-            if not session_id:
-                session_id = f"session_{datetime.now().timestamp()}"
-
-            if session_id not in self.chat_history:
-                self.chat_history[session_id] = []
-
-            # Add the query to chat history
-            self.chat_history[session_id].append({"role": "user", "content": query})
-
-            # Retrieve relevant chunks
-            # chunks = self.retrieve_chunks(query, document_names)
-            # Retrieve relevant graph context
-            context_parts = self.retrieve_graph_context(query, document_names)
-
-            #if not chunks:
-            if not context_parts:
-                no_info_response = "I couldn't find any relevant information to answer your question."
-                self.chat_history[session_id].append({"role": "assistant", "content": no_info_response})
-                return {
-                    "message": no_info_response,
-                    "sources": [],
-                    "session_id": session_id
-                }
-
-            # Format chunks into context
-            #context = self._format_context_from_chunks(chunks)
-            # Format context for the prompt
-            context = "\n\n---\n\n".join(context_parts)
+            turn = await self._prepare_turn(query, session_id, document_names, mode)
+            if turn.reply is not None:
+                return self._reply_response(turn)
 
-            # Generate the prompt with context
-            prompt = SYSTEM_PROMPT.format(context) + f"\nQuestion: {query}"
-
-            # Get response from LLM
-            logging.info(f"Sending prompt to LLM: {prompt[:200]}...")  # Log first 200 chars
-            response = self.llm.generate(prompt)
-            logging.info(f"Received response from LLM: {response[:200]}...")  # Log first 200 chars
-
-            # Add response to chat history
-            self.chat_history[session_id].append({"role": "assistant", "content": response})
-
-            # Extract sources for attribution
-            # sources = list(set([chunk.get("source", "Unknown") for chunk in chunks]))
-            sources = []
-            for part in context_parts:
-                source_match = re.search(r"Source: (.+?)\n", part)
-                if source_match and source_match.group(1) not in sources:
-                    sources.append(source_match.group(1))
-
-
-            return {
-                "message": response,
-                "sources": sources,
-                "session_id": session_id
-            }
+            self._log_prompt(turn)
+            with span("llm"):
+                response = await self.llm.agenerate(turn.prompt, max_tokens=self.max_tokens,
+                                                    temperature=self.temperature)
+            return await asyncio.to_thread(self._finish_turn, turn, response)
 
         except Exception as e:
-            logging.error(f"Error in QA pipeline: {str(e)}", exc_info=True)
-            error_response = f"I'm sorry, but I encountered an error while processing your question: {str(e)}"
-
-            if session_id in self.chat_history:
-                self.chat_history[session_id].append({"role": "assistant", "content": error_response})
+            session_id = turn.session_id if turn else session_id
+            return self._response(session_id, await asyncio.to_thread(self._record_error, session_id, e), [])
+
+    async def stream_chat_response(self, query, session_id=None, document_names=None, mode=None):
+        """
+        Async streaming variant of get_chat_response, yielding the same
+        ("token", text) and ("done", response) tuples as the sync pipeline.
+        """
+        turn = None
+        try:
+            turn = await self._prepare_turn(query, session_id, document_names, mode)
+            if turn.reply is not None:
+                yield "token", turn.reply
+                yield "done", self._reply_response(turn)
+                return
+
+            self._log_prompt(turn, streaming=True)
+            fragments = []
+            # Includes the time the client takes to read each token
+            with span("llm_stream"):
+                async for fragment in self.llm.astream(turn.prompt, max_tokens=self.max_tokens,
+                                                       temperature=self.temperature):
+                    fragments.append(fragment)
+                    yield "token", fragment
+            yield "done", await asyncio.to_thread(self._finish_turn, turn, "".join(fragments), True)
 
-            return {
-                "message": error_response,
-                "sources": [],
-                "session_id": session_id
-            }
+        except Exception as e:
+            session_id = turn.session_id if turn else session_id
+            error_response = await asyncio.to_thread(self._record_error, session_id, e)
+            yield "token", error_response
+            yield "done", self._response(session_id, error_response, [])
 
-    def close(self):
+    async def close(self):
         """Close connections"""
         if self.neo4j:
-            self.neo4j.close()
\ No newline at end of file
+            await self.neo4j.close()
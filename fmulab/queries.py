@@ -0,0 +1,116 @@
+"""
+Registry of the Cypher statements the pipeline runs against Neo4j.
+
+Every registered statement is a fixed text with all limits and filters passed
+as $parameters, so Neo4j plans each statement once and reuses the cached plan
+for every request. ``warm_up`` EXPLAINs the statements so the plans are cached
+before the first user query.
+"""
+import logging
+import re
+
+from . import config
+from .graph_db import COMPLETED_DOCUMENTS_QUERY
+
+# Leftover str.format() placeholders such as {graph_chunk_limit} or {{
+FORMAT_PLACEHOLDER = re.compile(r"\{\{|\}\}|\{[A-Za-z_][A-Za-z0-9_]*\}")
+
+
+class CypherQuery:
+    """A named Cypher statement and example parameters of the types it is called with"""
+    __slots__ = ("name", "text", "example_params")
+
+    def __init__(self, name, text, example_params=None):
+        self.name = name
+        self.text = text
+        self.example_params = example_params or {}
+
+
+class QueryRegistry:
+    """Named, fully parameterized Cypher statements"""
+
+    def __init__(self):
+        self._queries = {}
+
+    def register(self, name, text, **example_params):
+        """
+        Add a statement. Statements still written as str.format() templates
+        are rejected, since each formatted variant would be planned separately.
+        """
+        if FORMAT_PLACEHOLDER.search(text):
+            raise ValueError(f"Query '{name}' contains format placeholders; use $parameters instead")
+        if name in self._queries:
+            raise ValueError(f"Query '{name}' is already registered")
+        self._queries[name] = CypherQuery(name, text, example_params)
+        return text
+
+    def get(self, name):
+        """The text of a registered statement"""
+        return self._queries[name].text
+
+    def __iter__(self):
+        return iter(self._queries.values())
+
+    def __len__(self):
+        return len(self._queries)
+
+    def warm_up(self, connection):
+        """
+        EXPLAIN every statement so the server plans and caches it without
+        running it. Example parameters are sent along because Neo4j caches a
+        plan per parameter type.
+
+        Returns:
+        tuple: Numbers of statements warmed and failed.
+        """
+        warmed = failed = 0
+        for query in self:
+            try:
+                connection.execute_read_query(f"EXPLAIN {query.text}", query.example_params)
+                warmed += 1
+            except Exception as e:
+                failed += 1
+                logging.warning(f"Could not warm the plan of query '{query.name}': {str(e)}")
+        logging.info(f"Warmed {warmed} query plans ({failed} failed)")
+        return warmed, failed
+
+
+QUERIES = QueryRegistry()
+
+_documents = ["example.pdf"]
+_embedding = [0.0] * config.EMBEDDING_DIMENSIONS
+_hits = [{"element_id": "4:example:0", "score": 1.0}]
+_candidates = {"top_k": config.VECTOR_SEARCH_TOP_K, "candidates": config.VECTOR_SEARCH_TOP_K}
+
+QUERIES.register("completed_documents", COMPLETED_DOCUMENTS_QUERY)
+QUERIES.register("graph", config.GRAPH_QUERY,
+                 document_names=_documents, graph_chunk_limit=config.GRAPH_CHUNK_LIMIT)
+QUERIES.register("graph_chunk_page", config.GRAPH_CHUNK_PAGE_QUERY,
+                 document_names=_documents, cursor="", page_size=config.GRAPH_PAGE_SIZE)
+QUERIES.register("graph_neighbors", config.GRAPH_NEIGHBORS_QUERY,
+                 element_id="4:example:0", cursor="", limit=config.GRAPH_NEIGHBOR_LIMIT)
+QUERIES.register("chunk_text_search", config.CHUNK_TEXT_SEARCH_QUERY,
+                 query_text="example", limit=5)
+QUERIES.register("chunk_text_document_search", config.CHUNK_TEXT_DOCUMENT_SEARCH_QUERY,
+                 query_text="example", limit=5, document_names=_documents)
+QUERIES.register("vector_index_search", config.VECTOR_INDEX_SEARCH_QUERY,
+                 index_name="vector", embedding=_embedding, **_candidates)
+QUERIES.register("vector_index_document_search", config.VECTOR_INDEX_DOCUMENT_SEARCH_QUERY,
+                 index_name="vector", embedding=_embedding, document_names=_documents, **_candidates)
+QUERIES.register("vector_document_exact_search", config.VECTOR_DOCUMENT_EXACT_SEARCH_QUERY,
+                 embedding=_embedding, document_names=_documents, top_k=config.VECTOR_SEARCH_TOP_K)
+QUERIES.register("fulltext_index_search", config.FULLTEXT_INDEX_SEARCH_QUERY,
+                 keyword_index="keyword", query_text="example", **_candidates)
+QUERIES.register("fulltext_index_document_search", config.FULLTEXT_INDEX_DOCUMENT_SEARCH_QUERY,
+                 keyword_index="keyword", query_text="example", document_names=_documents, **_candidates)
+QUERIES.register("chunk_context", config.CHUNK_CONTEXT_QUERY,
+                 hits=_hits, entity_limit=config.VECTOR_GRAPH_SEARCH_ENTITY_LIMIT)
+QUERIES.register("entity_context", config.ENTITY_CONTEXT_QUERY,
+                 hits=_hits, entity_limit=config.VECTOR_GRAPH_SEARCH_ENTITY_LIMIT)
+QUERIES.register("community_context", config.COMMUNITY_CONTEXT_QUERY,
+                 hits=_hits, entity_limit=config.VECTOR_GRAPH_SEARCH_ENTITY_LIMIT)
+
+
+def warm_query_plans(connection):
+    """EXPLAIN every registered statement on the given connection"""
+    return QUERIES.warm_up(connection)
@@ -0,0 +1,136 @@
+"""
+Response cache for the QA pipeline, backed by Django's cache framework so it
+works with the locmem, file based or Redis cache backends.
+"""
+import re
+import json
+import math
+import hashlib
+import logging
+from django.core.cache import caches
+
+from .config import (
+    RESPONSE_CACHE_ALIAS,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    RESPONSE_CACHE_MAX_SIMILAR_ENTRIES,
+)
+
+CACHE_HIT = "hit"
+CACHE_SIMILAR_HIT = "similar_hit"
+CACHE_MISS = "miss"
+CACHE_BYPASS = "bypass"
+
+
+def normalize_query(query):
+    """Lower-case the query, collapse whitespace and drop trailing punctuation"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two equally sized vectors"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    Caches QA responses keyed by normalized query, document set, model,
+    temperature and chat mode. Entries expire after ``timeout`` seconds; eviction beyond
+    that is left to the cache backend (locmem culls least recently used keys).
+
+    When an ``embedder`` callable (text -> vector) is given, a query that
+    misses the exact key can still hit an answer cached for a similar query
+    against the same document set, model, temperature and mode.
+    """
+
+    def __init__(self, cache_alias=RESPONSE_CACHE_ALIAS, timeout=RESPONSE_CACHE_TTL, embedder=None,
+                 similarity_threshold=RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 max_similar_entries=RESPONSE_CACHE_MAX_SIMILAR_ENTRIES):
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.max_similar_entries = max_similar_entries
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _scope(self, document_names, model, temperature, mode=None):
+        return self._digest(sorted(document_names or []), model, temperature, mode)
+
+    def make_key(self, query, document_names, model, temperature, mode=None):
+        """Cache key for an exact (normalized) query"""
+        scope = self._scope(document_names, model, temperature, mode)
+        return f"fmulab:qa:{scope}:{self._digest(normalize_query(query))}"
+
+    def _index_key(self, scope):
+        return f"fmulab:qa-index:{scope}"
+
+    def get(self, query, document_names, model, temperature, mode=None, embedding=None):
+        """
+        Look up a cached response. ``embedding`` is the query embedding when
+        the caller already has one from the same embedder.
+
+        Returns:
+        tuple: (response, status) where status is CACHE_HIT, CACHE_SIMILAR_HIT
+        or CACHE_MISS. The response is None on a miss.
+        """
+        try:
+            key = self.make_key(query, document_names, model, temperature, mode)
+            response = self.cache.get(key)
+            if response is not None:
+                return response, CACHE_HIT
+
+            if self.embedder is None:
+                return None, CACHE_MISS
+
+            scope = self._scope(document_names, model, temperature, mode)
+            index = self.cache.get(self._index_key(scope)) or []
+            if not index:
+                return None, CACHE_MISS
+
+            if embedding is None:
+                embedding = self.embedder(normalize_query(query))
+            best_key, best_score = None, self.similarity_threshold
+            for entry_key, entry_embedding in index:
+                score = cosine_similarity(embedding, entry_embedding)
+                if score >= best_score:
+                    best_key, best_score = entry_key, score
+
+            if best_key is not None:
+                response = self.cache.get(best_key)
+                if response is not None:
+                    logging.info(f"Response cache similar hit (similarity {best_score:.3f})")
+                    return response, CACHE_SIMILAR_HIT
+
+            return None, CACHE_MISS
+
+        except Exception as e:
+            logging.error(f"Error reading response cache: {str(e)}")
+            return None, CACHE_MISS
+
+    def set(self, query, document_names, model, temperature, response, mode=None, embedding=None):
+        """Store a response and, with an embedder, index the query for similarity hits"""
+        try:
+            key = self.make_key(query, document_names, model, temperature, mode)
+            self.cache.set(key, response, self.timeout)
+
+            if self.embedder is None:
+                return
+
+            scope = self._scope(document_names, model, temperature, mode)
+            index_key = self._index_key(scope)
+            index = [entry for entry in (self.cache.get(index_key) or []) if entry[0] != key]
+            if embedding is None:
+                embedding = self.embedder(normalize_query(query))
+            index.append((key, list(embedding)))
+            # Keep only the most recently stored queries
+            self.cache.set(index_key, index[-self.max_similar_entries:], self.timeout)
+
+        except Exception as e:
+            logging.error(f"Error writing response cache: {str(e)}")
+
@@ -0,0 +1,14 @@
+"""
+Signals for keeping FMU Lab caches in step with the graph database
+"""
+from django.dispatch import Signal, receiver
+
+from .document_catalogue import invalidate_document_catalogue
+
+# Sent after documents are ingested, updated or deleted in Neo4j
+documents_changed = Signal()
+
+
+@receiver(documents_changed)
+def refresh_document_catalogue(sender, **kwargs):
+    invalidate_document_catalogue()
@@ -1,3 +1,882 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from . import bert_classifier, llm_integration
+from .apps import serves_requests
+from .batching import MicroBatcher
+from .context_packer import ContextPacker, TokenCounter, context_budget_for_model
+from .benchmark import build_fake_async_pipeline, build_fake_pipeline, percentile, run_load
+from .config import CHAT_VECTOR_MODE, DEFAULT_CONTEXT_TOKEN_BUDGET, GRAPH_QUERY, VECTOR_DOCUMENT_EXACT_SEARCH_QUERY, VECTOR_INDEX_DOCUMENT_SEARCH_QUERY
+from .conversation_memory import ConversationMemory, is_follow_up
+from .fakes import (
+    AsyncFakeNeo4jConnection, FakeEmbedder, FakeLLMServer, FakeNeo4jConnection, FakeNode, FakeRelationship,
+    FakeSummary, cosine_score, seed_graph,
+)
+from .intent_router import IntentRouter
+from .instrumentation import METRICS, RequestTrace, _current_trace, span
+from .llm_integration import LLMRetry, OpenAIProvider, build_http_session, retry_delay
+from .graph_db import COMPLETED_DOCUMENTS_QUERY
+from .graph_extraction import StreamingGraphExtractor
+from .indexes import find_label_scans, plan_operators, required_indexes
+from .graph_snapshots import GraphSnapshotStore
+from .models import ChatMessage, ChatSession
+from .pipeline import set_qa_pipeline
+from .qa_integration import QAIntegration
+from .queries import QUERIES, QueryRegistry
+
+
+class FakeNeo4jRetrievalTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.embedder = FakeEmbedder()
+        self.neo4j = FakeNeo4jConnection(seed_graph(documents=4, chunks_per_document=10, embedder=self.embedder))
+        self.llm = OpenAIProvider(api_key="fake", base_url="http://127.0.0.1:9/v1")
+
+    def test_completed_documents(self):
+        self.assertEqual(self.neo4j.get_completed_documents(),
+                         ["report_00.pdf", "report_01.pdf", "report_02.pdf", "report_03.pdf"])
+
+    def test_fulltext_retrieval_returns_context(self):
+        qa = QAIntegration(self.neo4j, self.llm)
+        records = qa.retrieve_context_records("salmon growth model")
+        self.assertTrue(records)
+        self.assertTrue(all(record["chunk_text"] and record["entities"] for record in records))
+
+    def test_document_filter_limits_sources(self):
+        qa = QAIntegration(self.neo4j, self.llm, embedder=self.embedder, mode=CHAT_VECTOR_MODE)
+        records = qa.retrieve_context_records("dissolved oxygen", document_names=["report_02.pdf"])
+        self.assertTrue(records)
+        self.assertEqual({record["source"] for record in records}, {"report_02.pdf"})
+
+    def test_document_filter_kept_without_embedder(self):
+        qa = QAIntegration(self.neo4j, self.llm, mode=CHAT_VECTOR_MODE)
+        records = qa.retrieve_context_records("dissolved oxygen", document_names=["report_03.pdf"])
+        self.assertTrue(records)
+        self.assertEqual({record["source"] for record in records}, {"report_03.pdf"})
+
+    def _exact_scores(self, neo4j, query, document_names, top_k=5):
+        embedding = self.embedder(query)
+        scores = [cosine_score(embedding, chunk["embedding"]) for chunk in neo4j.graph.chunks.values()
+                  if chunk["document"] in document_names]
+        return sorted(scores, reverse=True)[:top_k]
+
+    def test_narrow_document_selection_is_not_starved(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=40, chunks_per_document=5, embedder=self.embedder))
+        qa = QAIntegration(neo4j, self.llm, embedder=self.embedder, mode=CHAT_VECTOR_MODE)
+        for max_candidates in (1000, 10):
+            with mock.patch("fmulab.qa_integration.RETRIEVAL_MAX_CANDIDATES", max_candidates):
+                records = qa.retrieve_context_records("dissolved oxygen", document_names=["report_07.pdf"])
+            self.assertEqual({record["source"] for record in records}, {"report_07.pdf"})
+            self.assertEqual(sorted((record["score"] for record in records), reverse=True),
+                             self._exact_scores(neo4j, "dissolved oxygen", {"report_07.pdf"}))
+        # Too many candidates for one document out of forty: the shard is searched exactly
+        self.assertEqual(neo4j.query_counts[VECTOR_INDEX_DOCUMENT_SEARCH_QUERY], 1)
+        self.assertEqual(neo4j.query_counts[VECTOR_DOCUMENT_EXACT_SEARCH_QUERY], 1)
+
+    def test_starved_shard_is_searched_exactly(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=40, chunks_per_document=5, embedder=self.embedder))
+        qa = QAIntegration(neo4j, self.llm, embedder=self.embedder, mode=CHAT_VECTOR_MODE)
+        with mock.patch("fmulab.qa_integration.shard_candidates", return_value=5):
+            records = qa.retrieve_context_records("salmon growth", document_names=["report_11.pdf"])
+        self.assertEqual(len(records), 5)
+        self.assertEqual(neo4j.query_counts[VECTOR_DOCUMENT_EXACT_SEARCH_QUERY], 1)
+
+    def test_document_selection_fans_out_over_shards(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=40, chunks_per_document=5, embedder=self.embedder))
+        qa = QAIntegration(neo4j, self.llm, embedder=self.embedder, mode=CHAT_VECTOR_MODE)
+        selected = [f"report_{d:02d}.pdf" for d in range(30)]
+        records = qa.retrieve_context_records("feed conversion", document_names=selected)
+        self.assertEqual(sorted((record["score"] for record in records), reverse=True),
+                         self._exact_scores(neo4j, "feed conversion", set(selected)))
+        self.assertEqual(neo4j.query_counts[VECTOR_INDEX_DOCUMENT_SEARCH_QUERY], 2)
+
+    def test_unknown_query_raises(self):
+        with self.assertRaises(Exception):
+            self.neo4j.execute_query("MATCH (n) RETURN n")
+
+
+class FakeLLMChatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = FakeLLMServer(reply="Salmon grow faster in warmer water.").start()
+        self.addCleanup(self.server.stop)
+        self.qa = build_fake_pipeline(self.server, documents=3, chunks_per_document=10)
+
+    def test_chat_response(self):
+        response = self.qa.get_chat_response("How does water temperature affect salmon?")
+        self.assertEqual(response["message"], "Salmon grow faster in warmer water.")
+        self.assertTrue(response["sources"])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stream_chat_response(self):
+        events = list(self.qa.stream_chat_response("How does water temperature affect salmon?"))
+        tokens = "".join(payload for kind, payload in events if kind == "token")
+        self.assertEqual(tokens, "Salmon grow faster in warmer water.")
+        self.assertEqual(events[-1][0], "done")
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    @unittest.skipUnless(llm_integration.httpx is not None, "httpx is not installed")
+    def test_async_stream(self):
+        llm = OpenAIProvider(api_key="fake", base_url=self.server.base_url)
+
+        async def collect():
+            return [fragment async for fragment in llm.astream("Hello")]
+
+        self.assertEqual("".join(asyncio.run(collect())), "Salmon grow faster in warmer water.")
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    def test_llm_errors_are_reported(self):
+        self.server.status = 503
+        llm = OpenAIProvider(api_key="fake", session=build_http_session(max_retries=0),
+                             base_url=self.server.base_url)
+        self.assertIn("503", llm.generate("Hello"))
+
+    def test_chat_api(self):
+        previous = set_qa_pipeline(self.qa)
+        self.addCleanup(set_qa_pipeline, previous)
+        response = self.client.post(reverse("fmulab:chat_api"), data=json.dumps({"message": "What is a biofilter?"}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "Salmon grow faster in warmer water.")
+
+    def test_routed_mode_without_hits_falls_back_to_default_mode(self):
+        # The fake graph has no communities, so the overview mode finds nothing
+        self.qa.intent_router = IntentRouter()
+        response = self.qa.get_chat_response("Give me an overview of the reports")
+        self.assertEqual(response["metadata"]["routed_mode"], "global_vector")
+        self.assertEqual(response["message"], "Salmon grow faster in warmer water.")
+
+    def test_response_cache_mid_conversation(self):
+        first = self.qa.get_chat_response("What is a biofilter?", session_id="s1")
+        self.assertEqual(first["metadata"]["cache"], "miss")
+        self.qa.get_chat_response("How does temperature affect salmon growth?", session_id="s1")
+        repeated = self.qa.get_chat_response("What is a biofilter?", session_id="s1")
+        self.assertEqual(repeated["metadata"]["cache"], "hit")
+        self.assertEqual(len(self.server.requests), 2)
+
+        follow_up = self.qa.get_chat_response("What about its oxygen demand?", session_id="s1")
+        self.assertEqual(follow_up["metadata"]["cache"], "bypass")
+        self.assertIn("What is a biofilter?", json.dumps(self.server.requests[-1]))
+
+    def test_uncached_question_is_embedded_once(self):
+        embedder = mock.Mock(wraps=self.qa.embedder)
+        self.qa.embedder = self.qa.response_cache.embedder = embedder
+        self.qa.get_chat_response("What is a biofilter?")
+        self.assertEqual(embedder.call_count, 1)
+
+        # With an indexed entry the miss runs a similarity lookup and retrieval on the same embedding
+        embedder.reset_mock()
+        response = self.qa.get_chat_response("How does temperature affect salmon growth?")
+        self.assertEqual(response["metadata"]["cache"], "miss")
+        self.assertTrue(response["sources"])
+        embedder.assert_called_once_with("How does temperature affect salmon growth?")
+
+    def test_fresh_visitors_do_not_share_conversation_memory(self):
+        previous = set_qa_pipeline(self.qa)
+        self.addCleanup(set_qa_pipeline, previous)
+        self.qa.response_cache = None
+        first, second = self.client_class(), self.client_class()
+
+        first.post(reverse("fmulab:chat_api"), data=json.dumps({"message": "Tell me about the Rainbow Trout tank"}),
+                   content_type="application/json")
+        response = second.post(reverse("fmulab:chat_api"), data=json.dumps({"message": "What is a biofilter?"}),
+                               content_type="application/json")
+
+        self.assertNotEqual(response.json()["session_id"], "session_None")
+        self.assertNotIn("Rainbow Trout", json.dumps(self.server.requests[1]))
+
+    def test_intent_router_answers_greetings_without_retrieval(self):
+        self.qa.intent_router = IntentRouter()
+        self.qa.neo4j.query_counts.clear()
+        response = self.qa.get_chat_response("Hello!")
+        self.assertEqual(response["metadata"]["intent"], "greeting")
+        self.assertFalse(self.server.requests)
+        self.assertFalse(self.qa.neo4j.query_counts)
+
+        response = self.qa.get_chat_response("What is the feed conversion ratio of salmon?")
+        self.assertEqual(response["metadata"]["intent"], "factual")
+        self.assertEqual(response["message"], "Salmon grow faster in warmer water.")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_chat_api_server_timing(self):
+        previous = set_qa_pipeline(self.qa)
+        self.addCleanup(set_qa_pipeline, previous)
+        with mock.patch("fmulab.instrumentation.SERVER_TIMING_ENABLED", True):
+            response = self.client.post(reverse("fmulab:chat_api"),
+                                        data=json.dumps({"message": "What is a biofilter?"}),
+                                        content_type="application/json")
+        stages = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        for stage in ("documents", "retrieval", "context", "llm", "persistence", "total"):
+            self.assertIn(stage, stages)
+
+        with mock.patch("fmulab.views.METRICS_ENABLED", False):
+            self.assertEqual(self.client.get(reverse("fmulab:metrics")).status_code, 404)
+        with mock.patch("fmulab.views.METRICS_ENABLED", True):
+            metrics = self.client.get(reverse("fmulab:metrics")).content.decode()
+        self.assertIn('fmulab_stage_seconds_count{stage="llm"}', metrics)
+        self.assertIn('fmulab_llm_tokens_total{kind="completion"}', metrics)
+
+
+class WarmStartTests(SimpleTestCase):
+    def test_only_serving_processes_warm_start(self):
+        self.assertTrue(serves_requests(["gunicorn", "fmututorial.wsgi"], {}))
+        self.assertTrue(serves_requests(["manage.py", "runserver"], {"RUN_MAIN": "true"}))
+        self.assertTrue(serves_requests(["manage.py", "runserver", "--noreload"], {}))
+        # The autoreloader's watcher only restarts the child process
+        self.assertFalse(serves_requests(["manage.py", "runserver"], {}))
+        self.assertFalse(serves_requests(["manage.py", "test"], {}))
+        self.assertFalse(serves_requests(["/usr/bin/django-admin", "migrate"], {}))
+        self.assertFalse(serves_requests(["/venv/lib/django/__main__.py", "test", "fmulab"], {}))
+        self.assertFalse(serves_requests(["pytest", "-q"], {}))
+
+    def test_test_run_does_not_warm_start(self):
+        self.assertFalse(serves_requests())
+
+
+class Neo4jReconnectTests(SimpleTestCase):
+    def test_lost_connection_is_retried_once(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=2, chunks_per_document=2))
+        neo4j.disconnects = 1
+        records, _, _ = neo4j.execute_read_query(COMPLETED_DOCUMENTS_QUERY)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(neo4j.pool_metrics()["reconnects_total"], 1)
+
+        neo4j.disconnects = 2
+        with self.assertRaises(Exception):
+            neo4j.execute_read_query(COMPLETED_DOCUMENTS_QUERY)
+
+    def test_async_lost_connection_is_retried_once(self):
+        neo4j = AsyncFakeNeo4jConnection(seed_graph(documents=2, chunks_per_document=2))
+        neo4j.disconnects = 1
+        records, _, _ = asyncio.run(neo4j.execute_read_query(COMPLETED_DOCUMENTS_QUERY))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(neo4j.pool_metrics()["reconnects_total"], 1)
+
+        neo4j.disconnects = 2
+        with self.assertRaises(Exception):
+            asyncio.run(neo4j.execute_read_query(COMPLETED_DOCUMENTS_QUERY))
+        self.assertTrue(asyncio.run(neo4j.verify_connectivity()))
+
+
+class StreamingGraphExtractorTests(SimpleTestCase):
+    def test_records_are_deduplicated_and_merged(self):
+        chunk = FakeNode("4:c", ["Chunk"], {"id": "c", "text": "long text", "embedding": [0.1]})
+        entity = FakeNode("4:e", ["__Entity__", "Species"], {"id": "salmon"})
+        other = FakeNode("4:o", ["__Entity__"], {"id": "trout"})
+        mention = FakeRelationship("HAS_ENTITY", chunk, entity)
+        related = FakeRelationship("RELATED_TO", entity, other)
+
+        extractor = StreamingGraphExtractor().consume([
+            {"nodes": [chunk, entity], "rels": [mention]},
+            {"nodes": [entity, other, None], "rels": [mention, related, None]},
+        ])
+        graph = extractor.to_dict()
+
+        self.assertEqual([node["element_id"] for node in graph["nodes"]], ["4:c", "4:e", "4:o"])
+        self.assertEqual(graph["nodes"][0]["properties"], {"id": "c"})
+        self.assertEqual(graph["nodes"][1]["labels"], ["Species"])
+        self.assertEqual(graph["nodes"][2]["labels"], ["*"])
+        self.assertEqual(graph["relationships"], [
+            {"element_id": mention.element_id, "type": "HAS_ENTITY",
+             "start_node_element_id": "4:c", "end_node_element_id": "4:e"},
+            {"element_id": related.element_id, "type": "RELATED_TO",
+             "start_node_element_id": "4:e", "end_node_element_id": "4:o"},
+        ])
+
+    def test_relationship_without_both_nodes_is_skipped(self):
+        node = FakeNode("4:n", ["Chunk"], {})
+        dangling = FakeRelationship("NEXT_CHUNK", node, node)
+        dangling.end_node = None
+        extractor = StreamingGraphExtractor(nodes_key="n", relationships_key="r").consume([{"n": [node], "r": [dangling]}])
+        self.assertEqual(len(extractor.nodes), 1)
+        self.assertEqual(extractor.relationships, [])
+
+
+class GraphPaginationTests(SimpleTestCase):
+    def setUp(self):
+        self.neo4j = FakeNeo4jConnection(seed_graph(documents=2, chunks_per_document=8))
+
+    def test_graph_pages_cover_the_document_once(self):
+        chunk_ids = set()
+        page_sizes = []
+        cursor = None
+        while True:
+            page = self.neo4j.get_graph_page("report_00.pdf", cursor=cursor, page_size=3)
+            chunks = [node for node in page["nodes"] if node["labels"] == ["Chunk"]]
+            page_sizes.append(len(chunks))
+            new_ids = {chunk["properties"]["id"] for chunk in chunks}
+            self.assertFalse(chunk_ids & new_ids)
+            chunk_ids |= new_ids
+            if page["next_cursor"] is None:
+                break
+            self.assertEqual(page["next_cursor"], max(new_ids))
+            cursor = page["next_cursor"]
+
+        self.assertEqual(page_sizes, [3, 3, 2])
+        expected = {chunk["id"] for chunk in self.neo4j.graph.chunks.values() if chunk["document"] == "report_00.pdf"}
+        self.assertEqual(chunk_ids, expected)
+
+    def test_full_last_page_is_followed_by_an_empty_page(self):
+        page = self.neo4j.get_graph_page(["report_01.pdf"], page_size=8)
+        self.assertIsNotNone(page["next_cursor"])
+        last = self.neo4j.get_graph_page(["report_01.pdf"], cursor=page["next_cursor"], page_size=8)
+        self.assertEqual(last, {"nodes": [], "relationships": [], "next_cursor": None})
+
+    def test_neighbors_are_paged_by_relationship(self):
+        chunk = self.neo4j._document_chunks("report_00.pdf")[3]
+        expected = {relationship.element_id for relationship in self.neo4j._relationships_of(chunk["element_id"])}
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = self.neo4j.get_node_neighbors(chunk["element_id"], cursor=cursor, limit=2)
+            pages += 1
+            seen += [relationship["element_id"] for relationship in page["relationships"]]
+            if page["next_cursor"] is None:
+                break
+            cursor = page["next_cursor"]
+
+        # PART_OF, two NEXT_CHUNK and four HAS_ENTITY relationships
+        self.assertEqual(len(expected), 7)
+        self.assertEqual(seen, sorted(expected))
+        self.assertEqual(pages, 4)
+
+    def test_unknown_node_has_no_neighbors(self):
+        page = self.neo4j.get_node_neighbors("4:fake:missing")
+        self.assertEqual(page, {"nodes": [], "relationships": [], "next_cursor": None})
+
+
+class QueryRegistryTests(SimpleTestCase):
+    def test_format_placeholders_are_rejected(self):
+        registry = QueryRegistry()
+        for text in ("MATCH (c:Chunk) RETURN c LIMIT {limit}", "RETURN {{id: $id}}"):
+            with self.assertRaises(ValueError):
+                registry.register("templated", text)
+        self.assertEqual(len(registry), 0)
+
+        # Map literals and projections are not placeholders
+        text = "MATCH (c:Chunk) RETURN c {.id, score: $score} LIMIT $limit"
+        self.assertEqual(registry.register("parameterized", text, score=1.0, limit=5), text)
+        self.assertEqual(registry.get("parameterized"), text)
+        with self.assertRaises(ValueError):
+            registry.register("parameterized", text)
+
+    def test_warm_up_explains_every_statement(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=1, chunks_per_document=1))
+        self.assertEqual(QUERIES.warm_up(neo4j), (len(QUERIES), 0))
+        for query in QUERIES:
+            self.assertEqual(neo4j.query_counts[f"EXPLAIN {query.text}"], 1, query.name)
+            self.assertEqual(neo4j.query_counts[query.text], 0, query.name)
+
+    def test_warm_up_counts_failures(self):
+        registry = QueryRegistry()
+        registry.register("first", "RETURN $value", value=1)
+        registry.register("second", "RETURN $value + 1", value=1)
+        connection = mock.Mock()
+        connection.execute_read_query.side_effect = [([], None, []), Exception("unavailable")]
+        self.assertEqual(registry.warm_up(connection), (1, 1))
+        connection.execute_read_query.assert_any_call("EXPLAIN RETURN $value", {"value": 1})
+
+
+class IndexTests(SimpleTestCase):
+    def test_indexes_follow_the_chat_modes(self):
+        definitions = required_indexes(dimensions=8)
+        self.assertEqual([(definition.name, definition.kind, definition.label) for definition in definitions], [
+            ("vector", "VECTOR", "Chunk"),
+            ("keyword", "FULLTEXT", "Chunk"),
+            ("entity_vector", "VECTOR", "__Entity__"),
+            ("community_vector", "VECTOR", "__Community__"),
+            ("community_keyword", "FULLTEXT", "__Community__"),
+            ("document_file_name", "RANGE", "Document"),
+            ("document_status", "RANGE", "Document"),
+            ("chunk_id", "UNIQUENESS", "Chunk"),
+        ])
+        self.assertIn("`vector.dimensions`: 8", definitions[0].statement)
+        self.assertEqual(definitions[4].properties, ["summary"])
+
+    def test_modes_without_a_label_add_no_index(self):
+        modes = {
+            "vector": {"node_label": "Chunk", "index_name": "vector", "embedding_node_property": "vec"},
+            "graph": {"index_name": "unused"},
+        }
+        with mock.patch("fmulab.indexes.CHAT_MODE_CONFIG_MAP", modes):
+            names = [definition.name for definition in required_indexes()]
+        self.assertEqual(names, ["vector", "document_file_name", "document_status", "chunk_id"])
+
+    def test_label_scans_are_reported_per_query(self):
+        scan = {"operatorType": "ProduceResults@neo4j",
+                "children": [{"operatorType": "NodeByLabelScan@neo4j", "children": []}]}
+        seek = {"operatorType": "ProduceResults@neo4j",
+                "children": [{"operatorType": "NodeIndexSeek@neo4j", "children": []}]}
+        self.assertEqual(plan_operators(scan), ["ProduceResults", "NodeByLabelScan"])
+
+        def explain(query, params=None):
+            if query == f"EXPLAIN {QUERIES.get('chunk_context')}":
+                raise Exception("unavailable")
+            summary = FakeSummary(query)
+            summary.plan = scan if query == f"EXPLAIN {QUERIES.get('graph')}" else seek
+            return [], summary, []
+
+        connection = mock.Mock()
+        connection.execute_read_query.side_effect = explain
+        self.assertEqual(find_label_scans(connection), {"graph": ["NodeByLabelScan"]})
+        self.assertEqual(connection.execute_read_query.call_count, len(QUERIES))
+
+    def test_fake_plans_have_no_scans(self):
+        neo4j = FakeNeo4jConnection(seed_graph(documents=1, chunks_per_document=1))
+        self.assertEqual(find_label_scans(neo4j), {})
+
+
+class GraphSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.neo4j = FakeNeo4jConnection(seed_graph(documents=3, chunks_per_document=4))
+        self.store = GraphSnapshotStore(self.neo4j, directory=directory.name, chunk_limit=2)
+
+    def test_version_changes_with_updated_at(self):
+        version = self.store.selection_version(["report_00.pdf"])
+        self.neo4j.graph.documents["report_00.pdf"]["updatedAt"] = "2024-02-01T00:00:00Z"
+        self.assertNotEqual(self.store.selection_version(["report_00.pdf"]), version)
+        self.assertIsNone(self.store.selection_version(["missing.pdf"]))
+
+    def test_graph_is_built_once_then_loaded(self):
+        names = ["report_01.pdf", "report_00.pdf"]
+        graph = self.store.get_graph(names)
+        self.assertEqual(self.neo4j.query_counts[GRAPH_QUERY], 1)
+        self.assertEqual(self.store.get_graph(list(reversed(names))), graph)
+        self.assertEqual(self.neo4j.query_counts[GRAPH_QUERY], 1)
+
+        # Re-ingesting one of the documents makes the stored selection outdated
+        self.neo4j.graph.documents["report_01.pdf"]["updatedAt"] = "2024-02-01T00:00:00Z"
+        self.store.get_graph(names)
+        self.assertEqual(self.neo4j.query_counts[GRAPH_QUERY], 2)
+        self.assertEqual(len(os.listdir(self.store.directory)), 2)
+
+    def test_selection_keeps_cross_document_relationships(self):
+        graph = self.neo4j.graph
+        first = graph.chunks[self.neo4j._document_chunks("report_00.pdf")[0]["element_id"]]
+        second = graph.chunks[self.neo4j._document_chunks("report_01.pdf")[0]["element_id"]]
+        first["entities"], second["entities"] = ["salmon"], ["biofilter"]
+        graph.entities["salmon"]["related"].add("biofilter")
+        graph.entities["biofilter"]["related"].add("salmon")
+
+        store = GraphSnapshotStore(self.neo4j, directory=self.store.directory, chunk_limit=1)
+        live = self.neo4j.fetch_graph_for_documents(["report_00.pdf", "report_01.pdf"], 1)
+        self.assertIn("RELATED_TO", [relationship["type"] for relationship in live["relationships"]])
+        self.assertEqual(store.get_graph(["report_00.pdf", "report_01.pdf"]), live)
+
+    def test_rebuild_prunes_removed_documents(self):
+        self.store.get_graph(["report_00.pdf", "report_02.pdf"])
+        self.assertEqual(self.store.rebuild(), (3, 0, 0))
+        self.assertEqual(self.store.rebuild(), (0, 3, 0))
+
+        self.neo4j.graph.documents["report_02.pdf"]["status"] = "Failed"
+        self.assertEqual(self.store.rebuild(), (0, 2, 2))
+        self.assertIsNotNone(self.store.load_raw(["report_00.pdf"]))
+        self.assertIsNone(self.store.load_raw(["report_00.pdf", "report_02.pdf"]))
+        self.assertEqual(len([name for name in os.listdir(self.store.directory)
+                              if name.endswith(".json.z")]), 2)
+
+
+@unittest.skipUnless(llm_integration.httpx is not None, "httpx is not installed")
+class AsyncPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = FakeLLMServer(reply="Salmon grow faster in warmer water.").start()
+        self.addCleanup(self.server.stop)
+        self.qa = build_fake_async_pipeline(self.server, documents=3, chunks_per_document=10)
+
+    def test_chat_response(self):
+        response = asyncio.run(self.qa.get_chat_response("How does water temperature affect salmon?"))
+        self.assertEqual(response["message"], "Salmon grow faster in warmer water.")
+        self.assertTrue(response["sources"])
+        self.assertEqual(response["metadata"]["cache"], "miss")
+
+    def test_stream_chat_response(self):
+        async def collect():
+            return [event async for event in self.qa.stream_chat_response("What does the biofilter do?")]
+
+        events = asyncio.run(collect())
+        tokens = "".join(payload for kind, payload in events if kind == "token")
+        self.assertEqual(tokens, "Salmon grow faster in warmer water.")
+        self.assertEqual(events[-1][0], "done")
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    def test_document_filter_limits_sources(self):
+        self.qa.mode = CHAT_VECTOR_MODE
+        records = asyncio.run(self.qa.retrieve_context_records("dissolved oxygen", document_names=["report_02.pdf"]))
+        self.assertTrue(records)
+        self.assertEqual({record["source"] for record in records}, {"report_02.pdf"})
+
+    def test_async_chat_api_persists_messages(self):
+        with mock.patch("fmulab.views.get_async_qa_pipeline", return_value=self.qa):
+            response = self.client.post(reverse("fmulab:async_chat_api"),
+                                        data=json.dumps({"message": "What is a biofilter?"}),
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        session_id = response.json()["session_id"]
+        self.assertEqual(response.json()["message"], "Salmon grow faster in warmer water.")
+        session = ChatSession.objects.get(session_id=session_id)
+        self.assertEqual([(message.role, message.content) for message in session.messages.all()],
+                         [("user", "What is a biofilter?"), ("assistant", "Salmon grow faster in warmer water.")])
+
+
+class ConversationMemoryTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_new_session_has_no_prompt_section(self):
+        self.assertEqual(ConversationMemory().format_for_prompt("fresh"), "")
+
+    def test_old_turns_are_folded_into_the_summary(self):
+        memory = ConversationMemory(max_messages=2)
+        for i in range(4):
+            memory.append("s1", "user", f"Question {i}. With detail.")
+        self.assertEqual([m["content"] for m in memory.history("s1")],
+                         ["Question 2. With detail.", "Question 3. With detail."])
+        prompt = memory.format_for_prompt("s1")
+        self.assertIn("User: Question 0.", prompt)
+        self.assertNotIn("Question 0. With detail.", prompt)
+
+    def test_sessions_are_isolated(self):
+        memory = ConversationMemory()
+        memory.append("a", "user", "tank A")
+        self.assertFalse(memory.has_history("b"))
+        memory.clear("a")
+        self.assertFalse(memory.has_history("a"))
+
+    def test_follow_up_detection(self):
+        self.assertFalse(is_follow_up("What is a biofilter?"))
+        self.assertFalse(is_follow_up("How does temperature affect salmon growth and feed intake?"))
+        self.assertTrue(is_follow_up("What about its oxygen demand?"))
+        self.assertTrue(is_follow_up("why?"))
+        self.assertTrue(is_follow_up("And the nitrate levels?"))
+
+
+class RetryDelayTests(SimpleTestCase):
+    def test_retry_after_is_capped(self):
+        self.assertEqual(retry_delay(0, "5"), 5.0)
+        self.assertEqual(retry_delay(0, "100000"), llm_integration.LLM_BACKOFF_MAX)
+        self.assertEqual(retry_delay(0, "Wed, 21 Oct 2099 07:28:00 GMT"), llm_integration.LLM_BACKOFF_MAX)
+        self.assertEqual(LLMRetry().parse_retry_after("100000"), llm_integration.LLM_BACKOFF_MAX)
+
+    def test_invalid_retry_after_falls_back_to_backoff(self):
+        for header in ("soon", "Wed, 21 Oct 2015 07:28:00 -0000"):
+            delay = retry_delay(1, header)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, llm_integration.LLM_BACKOFF_MAX)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_results_are_returned_in_order(self):
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items])
+        self.assertEqual(batcher.submit_many([1, 2, 3]), [2, 4, 6])
+
+    def test_result_count_mismatch_fails_every_item(self):
+        batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=50)
+        futures = [batcher.submit_async(item) for item in (1, 2, 3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+
+    def test_submit_times_out_by_default(self):
+        batcher = MicroBatcher(lambda items: time.sleep(1) or items, timeout=0.1)
+        with self.assertRaises(TimeoutError):
+            batcher.submit(1)
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def test_spans_are_collected_per_request(self):
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        try:
+            with span("retrieval"):
+                pass
+            with span("retrieval"):
+                pass
+        finally:
+            _current_trace.reset(token)
+        self.assertEqual(list(trace.durations()), ["retrieval"])
+        self.assertEqual(len(trace.spans), 2)
+
+    def test_render_prometheus_text(self):
+        METRICS.increment("fmulab_response_cache_total", {"status": "hit"})
+        METRICS.observe("fmulab_stage_seconds", 0.02, {"stage": "llm"})
+        text = METRICS.render()
+        self.assertIn("# TYPE fmulab_stage_seconds histogram", text)
+        self.assertIn('fmulab_response_cache_total{status="hit"} 1', text)
+        self.assertIn('fmulab_stage_seconds_bucket{stage="llm",le="0.01"} 0', text)
+        self.assertIn('fmulab_stage_seconds_bucket{stage="llm",le="0.025"} 1', text)
+
+
+class StubIntentClassifier:
+    def __init__(self, logits):
+        self.rows = logits
+
+    def logits(self, sentences):
+        return [self.rows for _ in sentences]
+
+
+class IntentRouterTests(SimpleTestCase):
+    def test_rules(self):
+        router = IntentRouter()
+        self.assertEqual(router.route("hey there").intent, "greeting")
+        self.assertIsNotNone(router.route("Thank you!").answer)
+        self.assertEqual(router.route("Give me an overview of the reports").mode, "global_vector")
+        self.assertEqual(router.route("biofilter").intent, "keyword")
+        # A greeting in front of a real question does not short-circuit it
+        route = router.route("Hello, how does stocking density affect dissolved oxygen?")
+        self.assertEqual(route.intent, "factual")
+        self.assertIsNone(route.answer)
+
+    def test_relational_routing_is_narrow(self):
+        router = IntentRouter()
+        self.assertEqual(router.route("How does water temperature affect salmon growth?").intent, "factual")
+        self.assertEqual(router.route("What is the relationship between feeding and ammonia?").intent,
+                         "relational")
+        self.assertEqual(router.route("How are the growth and flow FMUs connected?").intent, "relational")
+
+    def test_questions_after_a_greeting_are_not_short_circuited(self):
+        router = IntentRouter()
+        for message in ("Hello, how does the biofilter work?", "hi, what is nitrification?",
+                        "Help me understand nitrification", "Thanks, and what about ammonia?"):
+            route = router.route(message)
+            self.assertIsNone(route.answer, message)
+            self.assertNotIn(route.intent, ("greeting", "thanks", "help"), message)
+
+    def test_confident_classifier_overrides_rules(self):
+        labels = ["greeting", "off_topic", "factual"]
+        router = IntentRouter(StubIntentClassifier([0.0, 5.0, 0.0]), labels=labels)
+        route = router.route("What is the weather in Oslo?")
+        self.assertEqual((route.intent, route.source), ("off_topic", "classifier"))
+        self.assertIsNotNone(route.answer)
+
+    def test_unsure_classifier_falls_back_to_rules(self):
+        labels = ["greeting", "off_topic", "factual"]
+        router = IntentRouter(StubIntentClassifier([0.1, 0.2, 0.0]), labels=labels)
+        route = router.route("What is the weather in Oslo?")
+        self.assertEqual((route.intent, route.source), ("factual", "rules"))
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 99), 99.01)
+        self.assertIsNone(percentile([], 50))
+
+    def test_run_load_counts_errors(self):
+        result = run_load(lambda i: 500 if i % 4 == 0 else 200, requests=20, concurrency=4)
+        self.assertEqual(result["requests"], 20)
+        self.assertEqual(result["errors"], 5)
+        self.assertGreater(result["rps"], 0)
+
+
+class WordCounter:
+    """Token counter where every whitespace-separated word is one token"""
+
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max(max_tokens, 0)])
+
+
+def context_record(source, words, score, entities=(), relationships=()):
+    return {"source": source, "chunk_text": " ".join(f"{source}{i}" for i in range(words)), "score": score,
+            "entities": list(entities), "relationships": list(relationships)}
+
+
+class ContextPackerTests(SimpleTestCase):
+    def setUp(self):
+        # Without tiktoken the counter never loads an encoding
+        patcher = mock.patch("fmulab.context_packer.tiktoken", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def packer(self, token_budget):
+        packer = ContextPacker(token_budget=token_budget)
+        packer.counter = WordCounter()
+        return packer
+
+    def test_last_chunk_is_truncated_within_budget(self):
+        records = [context_record("a", 50, 0.9), context_record("b", 100, 0.5), context_record("c", 50, 0.7)]
+        # Chunk "a" costs 53 tokens, "c" 54 with the separator, leaving 80 for "b"
+        packed = self.packer(187).pack(records)
+
+        self.assertEqual(packed.sources, ["a", "c", "b"])
+        self.assertLessEqual(packed.tokens_used, 187)
+        self.assertIn("b75", packed.parts[2])
+        self.assertNotIn("b76", packed.parts[2])
+
+    def test_chunk_skipped_when_too_little_budget_is_left(self):
+        records = [context_record("a", 50, 0.9), context_record("b", 100, 0.5)]
+        packed = self.packer(100).pack(records)
+        self.assertEqual(packed.sources, ["a"])
+        self.assertEqual(packed.metadata()["context_records_retrieved"], 2)
+
+    def test_chunks_then_entities_then_relationships(self):
+        records = [
+            context_record("a", 5, 0.9, ["salmon", "trout"], ["RELATED_TO: ammonia", "RELATED_TO: biomass"]),
+            context_record("b", 5, 0.5, ["biofilter", "mortality"], ["RELATED_TO: salmon"]),
+        ]
+        # Chunks cost 8 + 9, entities 6 + 2 per record and the first relationship 7
+        packed = self.packer(40).pack(records)
+
+        self.assertIn("Entities: salmon, trout", packed.parts[0])
+        self.assertIn("Entities: biofilter, mortality", packed.parts[1])
+        self.assertIn("Relationships: RELATED_TO: ammonia", packed.parts[0])
+        self.assertNotIn("biomass", packed.parts[0])
+        self.assertNotIn("Relationships", packed.parts[1])
+        self.assertLessEqual(packed.tokens_used, 40)
+
+    def test_budget_matches_longest_model_prefix(self):
+        self.assertEqual(context_budget_for_model("gpt-4-0613"), 5000)
+        self.assertEqual(context_budget_for_model("gpt-4-32k-0314"), 24000)
+        self.assertEqual(context_budget_for_model("gpt-3.5-turbo-16k-0613"), 10000)
+        self.assertEqual(context_budget_for_model("llama-3"), DEFAULT_CONTEXT_TOKEN_BUDGET)
+        self.assertEqual(context_budget_for_model(None), DEFAULT_CONTEXT_TOKEN_BUDGET)
+        self.assertEqual(ContextPacker("gpt-4o-mini").token_budget, 24000)
+
+    def test_counter_falls_back_to_characters(self):
+        counter = TokenCounter("gpt-4o")
+        self.assertIsNone(counter.encoding)
+        self.assertEqual(counter.count(""), 0)
+        self.assertEqual(counter.count("a" * 40), 11)
+        self.assertEqual(counter.truncate("a" * 40, 3), "a" * 12)
+        self.assertEqual(counter.truncate("a" * 40, 0), "")
+
+
+class LengthBucketTests(SimpleTestCase):
+    def test_buckets_are_sorted_and_bounded(self):
+        lengths = [5, 40, 6, 100, 7, 41, 30]
+        buckets = bert_classifier.length_buckets(lengths, max_batch_size=2, width=16)
+        self.assertEqual(buckets, [[0, 2], [4], [6, 1], [5], [3]])
+
+    def test_every_position_is_bucketed_once(self):
+        lengths = [12, 3, 3, 80, 45, 12, 9, 64]
+        buckets = bert_classifier.length_buckets(lengths, max_batch_size=32, width=8)
+        self.assertEqual(sorted(i for bucket in buckets for i in bucket), list(range(len(lengths))))
+        for bucket in buckets:
+            self.assertLessEqual(max(lengths[i] for i in bucket) - min(lengths[i] for i in bucket), 8)
+
+
+def save_tiny_bert_checkpoint(directory, num_labels=5):
+    """A randomly initialised two-layer BERT classifier and its tokenizer, saved to ``directory``"""
+    words = ["salmon", "growth", "water", "temperature", "oxygen", "hello", "thanks", "model", "feed", "the"]
+    vocab_file = os.path.join(directory, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+    bert_classifier.BertTokenizerFast(vocab_file=vocab_file).save_pretrained(directory)
+    config = bert_classifier.BertConfig(vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2,
+                                        num_attention_heads=2, intermediate_size=64, num_labels=num_labels)
+    bert_classifier.torch.manual_seed(0)
+    bert_classifier.BertForSequenceClassification(config).save_pretrained(directory)
+    return directory
+
+
+SAMPLE_SENTENCES = ["hello", "salmon growth", "the water temperature model", "thanks",
+                    "oxygen and feed for salmon growth in the model", "the the the"]
+
+
+@unittest.skipUnless(bert_classifier.torch is not None and bert_classifier.BertConfig is not None,
+                     "torch and transformers are not installed")
+class BertClassifierTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.checkpoint = tempfile.TemporaryDirectory()
+        save_tiny_bert_checkpoint(cls.checkpoint.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.checkpoint.cleanup()
+        super().tearDownClass()
+
+    def classifier(self):
+        return bert_classifier.BertClassifier(self.checkpoint.name, tokenizer_name=self.checkpoint.name)
+
+    def test_batched_logits_match_single_sentences(self):
+        classifier = self.classifier()
+        batched = classifier.logits(SAMPLE_SENTENCES)
+        for sentence, row in zip(SAMPLE_SENTENCES, batched):
+            single = classifier._logits_batch([sentence])[0]
+            for a, b in zip(row, single):
+                self.assertAlmostEqual(a, b, places=4)
+
+    def test_bulk_logits_match_full_padding(self):
+        classifier = self.classifier()
+        encoded = classifier.tokenizer(SAMPLE_SENTENCES, padding=True, return_tensors="pt")
+        with bert_classifier.torch.inference_mode():
+            padded = classifier.runtime(**encoded).logits.tolist()
+        for row, reference in zip(classifier.logits_bulk(SAMPLE_SENTENCES, batch_size=2), padded):
+            for a, b in zip(row, reference):
+                self.assertAlmostEqual(a, b, places=4)
+
+    def test_concurrent_predictions(self):
+        classifier = self.classifier()
+        expected = classifier.predict_many(SAMPLE_SENTENCES)
+        with ThreadPoolExecutor(max_workers=len(SAMPLE_SENTENCES)) as executor:
+            predicted = list(executor.map(classifier.predict, SAMPLE_SENTENCES))
+        self.assertEqual(predicted, expected)
+        self.assertTrue(all(0 <= label < 5 for label in predicted))
+
+
+@unittest.skipUnless(bert_classifier.torch is not None and bert_classifier.BertConfig is not None,
+                     "torch and transformers are not installed")
+class BertBackendParityTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.checkpoint = tempfile.TemporaryDirectory()
+        save_tiny_bert_checkpoint(cls.checkpoint.name)
+        cls.reference = cls.classifier("torch").logits(SAMPLE_SENTENCES)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.checkpoint.cleanup()
+        super().tearDownClass()
+
+    @classmethod
+    def classifier(cls, backend):
+        return bert_classifier.BertClassifier(cls.checkpoint.name, tokenizer_name=cls.checkpoint.name,
+                                              backend=backend)
+
+    def assertLogitsClose(self, logits, delta):
+        for row, reference in zip(logits, self.reference):
+            for a, b in zip(row, reference):
+                self.assertAlmostEqual(a, b, delta=delta)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            self.classifier("tensorrt")
+
+    def test_torch_int8(self):
+        self.assertLogitsClose(self.classifier("torch_int8").logits(SAMPLE_SENTENCES), delta=0.05)
+
+    @unittest.skipUnless(bert_classifier.onnxruntime is not None, "onnxruntime is not installed")
+    def test_onnx(self):
+        classifier = self.classifier("onnx")
+        self.assertLogitsClose(classifier.logits(SAMPLE_SENTENCES), delta=1e-4)
+        self.assertTrue(os.path.exists(os.path.join(self.checkpoint.name, "model.onnx")))
+
+        # With the export in place the PyTorch checkpoint is never loaded again
+        with mock.patch.object(bert_classifier.BertClassifier, "_load_torch_model", side_effect=AssertionError):
+            self.assertLogitsClose(self.classifier("onnx").logits(SAMPLE_SENTENCES), delta=1e-4)
+
+    @unittest.skipUnless(bert_classifier.onnxruntime is not None, "onnxruntime is not installed")
+    def test_onnx_int8(self):
+        self.assertLogitsClose(self.classifier("onnx_int8").logits(SAMPLE_SENTENCES), delta=0.05)
@@ -9,5 +9,12 @@ urlpatterns = [
     path('home/', views.home, name='home'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/stream/', views.chat_stream_api, name='chat_stream_api'),
+    path('api/chat/async/', views.async_chat_api, name='async_chat_api'),
+    path('api/graph/', views.graph_api, name='graph_api'),
+    path('api/graph/documents/', views.document_graph_api, name='document_graph_api'),
+    path('api/graph/neighbors/', views.graph_neighbors_api, name='graph_neighbors_api'),
     path('clear-chat/', views.clear_chat, name='clear_chat'),
+    path('health/', views.health, name='health'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
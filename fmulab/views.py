@@ -4,56 +4,58 @@ Updated views for FMU simulation with Graph LLM integration
 import os
 import json
 import logging
+import uuid
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template import loader
+from django.utils.cache import patch_vary_headers
 from django.views import generic
 from django.shortcuts import get_object_or_404, render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 
-from models.models import Experiment
+from models.context_processors import experiment_nav_list
 from .models import FMUForm, ChatSession, ChatMessage
-from .graph_db import Neo4jConnection
-from .llm_integration import get_llm_provider
-from .qa_integration import QAIntegration
-from .config import CHAT_MODE_CONFIG_MAP, CHAT_DEFAULT_MODE
-
-# Initialize the QA pipeline
-qa_pipeline = None
-
-
-def get_qa_pipeline():
-    """Get or initialize the QA pipeline"""
-    global qa_pipeline
-    if qa_pipeline is None:
-        from django.conf import settings
-
-        neo4j_conn = Neo4jConnection(
-            uri=settings.NEO4J_URI,
-            username=settings.NEO4J_USERNAME,
-            password=settings.NEO4J_PASSWORD,
-            database=settings.NEO4J_DATABASE
-        )
-        neo4j_conn.connect()
-        llm_provider = get_llm_provider(
-            provider=os.environ.get("LLM_PROVIDER", "openai"),
-            model=os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
-        )
-        qa_pipeline = QAIntegration(neo4j_conn, llm_provider)
-    return qa_pipeline
+from .conversation_memory import ConversationMemory
+from .graph_db import normalize_document_names
+from .pipeline import get_qa_pipeline, get_async_qa_pipeline, get_health
+from .compression import compressed_json_response, accepted_encodings
+from .instrumentation import METRICS, server_timing, span
+from .config import (
+    CHAT_MODE_CONFIG_MAP, CHAT_DEFAULT_MODE, METRICS_ENABLED,
+    GRAPH_PAGE_SIZE, GRAPH_MAX_PAGE_SIZE, GRAPH_NEIGHBOR_LIMIT, GRAPH_MAX_NEIGHBOR_LIMIT,
+)
+
+
+# Ids handed out before chat ids were random; every new visitor shared this one
+SHARED_CHAT_SESSION_ID = "session_None"
+
+
+def _get_chat_session_id(request):
+    """
+    Get or create the chat session id stored in the user's session. The id is
+    random, since the Django session key is None until the session is first saved.
+    """
+    session_id = request.session.get('chat_session_id')
+    if not session_id or session_id == SHARED_CHAT_SESSION_ID:
+        session_id = f"session_{uuid.uuid4().hex}"
+        request.session['chat_session_id'] = session_id
+    return session_id
 
 
+@server_timing
 def index(request):
     """Main FMU Lab index page with chat interface"""
     template = loader.get_template('fmulab/index.html')
 
     # Get experiments for the sidebar
-    exp_list = Experiment.objects.order_by('exp_num')[:]
+    exp_list = experiment_nav_list()
 
     # Get available documents for search
     qa = get_qa_pipeline()
-    all_documents = qa.get_documents()
+    with span("documents"):
+        all_documents = qa.get_documents()
 
     # Create document choices for the form
     document_choices = [(doc, doc) for doc in all_documents]
@@ -63,10 +65,7 @@ def index(request):
     # form.fields['document_selector'].choices = document_choices
 
     # Get or create session for this user
-    session_id = request.session.get('chat_session_id')
-    if not session_id:
-        session_id = f"session_{request.session.session_key}"
-        request.session['chat_session_id'] = session_id
+    session_id = _get_chat_session_id(request)
 
     # Get chat history
     try:
@@ -93,6 +92,7 @@ def home(request):
     return HttpResponse(template.render({}, request))
 
 
+@server_timing
 def dashboard(request):
     """Process form submission and get LLM response"""
     if request.method == "POST":
@@ -106,26 +106,25 @@ def dashboard(request):
             # chat_mode = form.cleaned_data.get('chat_mode', CHAT_DEFAULT_MODE)
 
             # Get or create session for this user
-            session_id = request.session.get('chat_session_id')
-            if not session_id:
-                session_id = f"session_{request.session.session_key}"
-                request.session['chat_session_id'] = session_id
+            session_id = _get_chat_session_id(request)
 
             try:
-                # Get the session from DB
-                chat_session, created = ChatSession.objects.get_or_create(session_id=session_id)
+                with span("persistence"):
+                    # Get the session from DB
+                    chat_session, created = ChatSession.objects.get_or_create(session_id=session_id)
 
-                # Save the user message
-                user_message = ChatMessage.objects.create(
-                    session=chat_session,
-                    role='user',
-                    content=question
-                )
+                    # Save the user message
+                    user_message = ChatMessage.objects.create(
+                        session=chat_session,
+                        role='user',
+                        content=question
+                    )
 
                 # Get response from QA pipeline
                 qa = get_qa_pipeline()
                 # Get all available documents
-                all_documents = qa.get_documents()
+                with span("documents"):
+                    all_documents = qa.get_documents()
                 response = qa.get_chat_response(
                     query=question,
                     session_id=session_id,
@@ -133,12 +132,13 @@ def dashboard(request):
                 )
 
                 # Save the assistant message
-                assistant_message = ChatMessage.objects.create(
-                    session=chat_session,
-                    role='assistant',
-                    content=response['message'],
-                    #sources=json.dumps(response.get('sources', [])) # No need to store sources if we don't want to display them
-                )
+                with span("persistence"):
+                    assistant_message = ChatMessage.objects.create(
+                        session=chat_session,
+                        role='assistant',
+                        content=response['message'],
+                        #sources=json.dumps(response.get('sources', [])) # No need to store sources if we don't want to display them
+                    )
 
                 # Redirect back to the chat interface
                 return redirect('fmulab:index')
@@ -156,6 +156,7 @@ def dashboard(request):
 
 
 @csrf_exempt
+@server_timing
 def chat_api(request):
     """API endpoint for AJAX chat functionality"""
     if request.method == "POST":
@@ -167,15 +168,13 @@ def chat_api(request):
             # chat_mode = data.get('mode', CHAT_DEFAULT_MODE)
 
             # Get or create session for this user
-            session_id = request.session.get('chat_session_id')
-            if not session_id:
-                session_id = f"session_{request.session.session_key}"
-                request.session['chat_session_id'] = session_id
+            session_id = _get_chat_session_id(request)
 
             # Get response from QA pipeline
             qa = get_qa_pipeline()
             # Get all available documents
-            all_documents = qa.get_documents()
+            with span("documents"):
+                all_documents = qa.get_documents()
             response = qa.get_chat_response(
                 query=question,
                 session_id=session_id,
@@ -183,29 +182,31 @@ def chat_api(request):
                 # document_names=selected_documents if selected_documents else None
             )
 
-            # Get or create the chat session
-            chat_session, created = ChatSession.objects.get_or_create(session_id=session_id)
+            with span("persistence"):
+                # Get or create the chat session
+                chat_session, created = ChatSession.objects.get_or_create(session_id=session_id)
 
-            # Save the user message
-            user_message = ChatMessage.objects.create(
-                session=chat_session,
-                role='user',
-                content=question
-            )
+                # Save the user message
+                user_message = ChatMessage.objects.create(
+                    session=chat_session,
+                    role='user',
+                    content=question
+                )
 
-            # Save the assistant message
-            assistant_message = ChatMessage.objects.create(
-                session=chat_session,
-                role='assistant',
-                content=response['message'],
-                # sources=json.dumps(response.get('sources', []))
-            )
+                # Save the assistant message
+                assistant_message = ChatMessage.objects.create(
+                    session=chat_session,
+                    role='assistant',
+                    content=response['message'],
+                    # sources=json.dumps(response.get('sources', []))
+                )
 
             # Return the response
             return JsonResponse({
                 'message': response['message'],
                 # 'sources': response.get('sources', []),
-                'session_id': session_id
+                'session_id': session_id,
+                'metadata': response.get('metadata', {})
             })
 
         except Exception as e:
@@ -217,6 +218,262 @@ def chat_api(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+@server_timing
+async def async_chat_api(request):
+    """
+    Async variant of chat_api for ASGI deployments. Neo4j, the LLM request and
+    the ORM writes are awaited, so a slow completion does not hold a worker thread.
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        question = data.get('message', '')
+
+        # Session backends may hit the database, so keep them off the event loop
+        session_id = await sync_to_async(_get_chat_session_id)(request)
+
+        qa = get_async_qa_pipeline()
+        with span("documents"):
+            all_documents = await qa.get_documents()
+        response = await qa.get_chat_response(
+            query=question,
+            session_id=session_id,
+            document_names=all_documents
+        )
+
+        with span("persistence"):
+            chat_session, created = await ChatSession.objects.aget_or_create(session_id=session_id)
+            await ChatMessage.objects.acreate(
+                session=chat_session,
+                role='user',
+                content=question
+            )
+            await ChatMessage.objects.acreate(
+                session=chat_session,
+                role='assistant',
+                content=response['message'],
+            )
+
+        return JsonResponse({
+            'message': response['message'],
+            'session_id': session_id,
+            'metadata': response.get('metadata', {})
+        })
+
+    except Exception as e:
+        logging.error(f"Error in async chat API: {str(e)}")
+        return JsonResponse({
+            'error': str(e)
+        }, status=500)
+
+
+# csrf_exempt wraps views in a sync function on Django < 5.0, so mark the
+# coroutine directly to keep Django dispatching it as an async view.
+async_chat_api.csrf_exempt = True
+
+
+def _sse_event(event, data):
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+@server_timing
+def chat_stream_api(request):
+    """
+    Streaming variant of chat_api that emits the answer as Server-Sent Events.
+
+    Each LLM fragment is sent as a ``token`` event; a final ``done`` event
+    carries the complete message once it has been saved to the chat history.
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        question = data.get('message', '')
+    except Exception as e:
+        logging.error(f"Error in chat stream API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=400)
+
+    session_id = _get_chat_session_id(request)
+
+    def event_stream():
+        try:
+            qa = get_qa_pipeline()
+            # Get all available documents
+            with span("documents"):
+                all_documents = qa.get_documents()
+
+            for kind, payload in qa.stream_chat_response(
+                query=question,
+                session_id=session_id,
+                document_names=all_documents
+            ):
+                if kind == "token":
+                    yield _sse_event("token", {'content': payload})
+                    continue
+
+                # Persist the exchange only once the full answer is known
+                with span("persistence"):
+                    chat_session, created = ChatSession.objects.get_or_create(session_id=session_id)
+                    ChatMessage.objects.create(
+                        session=chat_session,
+                        role='user',
+                        content=question
+                    )
+                    ChatMessage.objects.create(
+                        session=chat_session,
+                        role='assistant',
+                        content=payload['message'],
+                    )
+                yield _sse_event("done", {
+                    'message': payload['message'],
+                    'session_id': session_id,
+                    'metadata': payload.get('metadata', {})
+                })
+
+        except Exception as e:
+            logging.error(f"Error in chat stream API: {str(e)}")
+            yield _sse_event("error", {'error': str(e)})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _bounded_int(value, default, maximum):
+    """Parse a positive integer query parameter, clamped to ``maximum``"""
+    if value in (None, ""):
+        return default
+    value = int(value)
+    if value < 1:
+        raise ValueError("must be a positive integer")
+    return min(value, maximum)
+
+
+def graph_api(request):
+    """
+    One page of the knowledge graph for the selected documents, as compact,
+    compressed JSON. Pass the returned ``next_cursor`` back as ``cursor`` to
+    load the next page; it is null once every chunk has been sent.
+
+    Documents are given as repeated ``documents`` parameters (or a JSON list);
+    all completed documents are used when none are given.
+    """
+    if request.method != "GET":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        page_size = _bounded_int(request.GET.get('page_size'), GRAPH_PAGE_SIZE, GRAPH_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'page_size must be a positive integer'}, status=400)
+
+    try:
+        qa = get_qa_pipeline()
+        document_names = request.GET.getlist('documents')
+        if len(document_names) == 1:
+            document_names = document_names[0]
+        if not document_names:
+            document_names = qa.get_documents()
+
+        page = qa.neo4j.get_graph_page(
+            document_names,
+            cursor=request.GET.get('cursor') or None,
+            page_size=page_size
+        )
+        return compressed_json_response(request, page)
+
+    except Exception as e:
+        logging.error(f"Error in graph API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def document_graph_api(request):
+    """
+    The complete graph of the selected documents (up to GRAPH_CHUNK_LIMIT chunks
+    each), served from precomputed snapshots. A selection whose snapshot is
+    current is sent as the stored bytes to clients that accept deflate.
+    """
+    if request.method != "GET":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    document_names = request.GET.getlist('documents')
+    if not document_names:
+        return JsonResponse({'error': 'documents is required'}, status=400)
+
+    try:
+        qa = get_qa_pipeline()
+        if len(document_names) == 1:
+            document_names = normalize_document_names(document_names[0])
+
+        if (qa.snapshots is not None
+                and 'deflate' in accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))):
+            snapshot = qa.snapshots.load_raw(document_names)
+            if snapshot is not None:
+                response = HttpResponse(snapshot, content_type='application/json')
+                response['Content-Encoding'] = 'deflate'
+                patch_vary_headers(response, ('Accept-Encoding',))
+                return response
+
+        return compressed_json_response(request, qa.get_document_graph(document_names))
+
+    except Exception as e:
+        logging.error(f"Error in document graph API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def graph_neighbors_api(request):
+    """
+    Expand one node of the graph on demand. ``element_id`` names the node;
+    ``cursor`` and ``limit`` page through its relationships.
+    """
+    if request.method != "GET":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    element_id = request.GET.get('element_id')
+    if not element_id:
+        return JsonResponse({'error': 'element_id is required'}, status=400)
+    try:
+        limit = _bounded_int(request.GET.get('limit'), GRAPH_NEIGHBOR_LIMIT, GRAPH_MAX_NEIGHBOR_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a positive integer'}, status=400)
+
+    try:
+        qa = get_qa_pipeline()
+        neighbors = qa.neo4j.get_node_neighbors(
+            element_id,
+            cursor=request.GET.get('cursor') or None,
+            limit=limit
+        )
+        return compressed_json_response(request, neighbors)
+
+    except Exception as e:
+        logging.error(f"Error in graph neighbors API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def health(request):
+    """Health of the QA pipeline, as last verified by the background check"""
+    status = get_health()
+    return JsonResponse(status, status=200 if status["status"] != "error" else 503)
+
+
+def metrics(request):
+    """
+    Stage latency, LLM token and cache metrics in the Prometheus text format.
+    The counts are kept per process, so each server worker reports only the
+    requests it served itself; scrape every worker or sum them in Prometheus.
+    """
+    if not METRICS_ENABLED:
+        raise Http404("Metrics are disabled")
+    return HttpResponse(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def clear_chat(request):
     """Clear the chat history"""
     session_id = request.session.get('chat_session_id')
@@ -227,6 +484,7 @@ def clear_chat(request):
 
             # Delete all messages
             chat_session.messages.all().delete()
+            ConversationMemory().clear(session_id)
 
             messages.success(request, "Chat history cleared.")
         except Exception as e:
@@ -5,9 +5,9 @@ import os
 from django.conf import settings
 from django.http import HttpResponse
 from django.template import loader
+from models.context_processors import experiment_nav
 from django.views import generic
 from django.shortcuts import get_object_or_404, render
-from models.models import Experiment
 
 def main_page(request):
     return render(request, 'home.html')
@@ -23,9 +23,8 @@ def simulate(request):
 
 def downloads(request):
     template = loader.get_template('downloads.html')
-    exp_list = Experiment.objects.order_by('exp_num')[:]
     context = {
-        'exp_list': exp_list,
+        **experiment_nav(request),
     }
     return HttpResponse(template.render(context, request))
 
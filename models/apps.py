@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ModelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'models'
+
+    def ready(self):
+        # Register signal receivers
+        from . import signals  # noqa: F401
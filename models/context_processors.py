@@ -0,0 +1,28 @@
+"""
+Template context shared by the pages with the experiment navigation bar
+"""
+from django.core.cache import cache
+
+from .models import Experiment
+
+EXPERIMENT_NAV_CACHE_KEY = "models:experiment_nav"
+# Saves and deletes invalidate the list; the timeout covers bulk updates, which send no signals
+EXPERIMENT_NAV_CACHE_TTL = 3600
+
+
+def experiment_nav_list():
+    """Number, title and id of every experiment, in exp_num order"""
+    exp_list = cache.get(EXPERIMENT_NAV_CACHE_KEY)
+    if exp_list is None:
+        exp_list = list(Experiment.objects.order_by('exp_num').values('id', 'exp_num', 'exp_title'))
+        cache.set(EXPERIMENT_NAV_CACHE_KEY, exp_list, EXPERIMENT_NAV_CACHE_TTL)
+    return exp_list
+
+
+def invalidate_experiment_nav():
+    cache.delete(EXPERIMENT_NAV_CACHE_KEY)
+
+
+def experiment_nav(request):
+    """Context processor providing the experiment navigation list as ``exp_list``"""
+    return {'exp_list': experiment_nav_list()}
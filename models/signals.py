@@ -0,0 +1,14 @@
+"""
+Signals for keeping the cached experiment navigation in step with the database
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .context_processors import invalidate_experiment_nav
+from .models import Experiment
+
+
+@receiver(post_save, sender=Experiment)
+@receiver(post_delete, sender=Experiment)
+def refresh_experiment_nav(sender, **kwargs):
+    invalidate_experiment_nav()
@@ -1,3 +1,53 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .context_processors import experiment_nav_list
+from .models import (
+    Experiment, Download, ExpDownload, XML, ExpXML, PDF, ExpPDF, Video, ExpVideo,
+)
+
+
+class DetailQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.experiment = Experiment.objects.create(exp_num=1, exp_title="Growth", exp_desc="Growth model")
+        Experiment.objects.create(exp_num=2, exp_title="Water treatment", exp_desc="RAS model")
+        for i in range(5):
+            download = Download.objects.create(download_num=i, download_title=f"Download {i}",
+                                               download_link=f"/d/{i}", download_desc="")
+            ExpDownload.objects.create(experiment=cls.experiment, download=download, exp_dload=f"d{i}")
+            xml = XML.objects.create(xml_num=i, xml_title=f"XML {i}", xml_link=f"/x/{i}", xml_desc="")
+            ExpXML.objects.create(experiment=cls.experiment, xml=xml, exp_xml=f"x{i}")
+            pdf = PDF.objects.create(pdf_num=i, pdf_title=f"PDF {i}", pdf_link=f"/p/{i}", pdf_desc="")
+            ExpPDF.objects.create(experiment=cls.experiment, pdf=pdf, exp_pdf=f"p{i}")
+            video = Video.objects.create(video_num=i, video_title=f"Video {i}", video_link=f"/v/{i}.mp4",
+                                         video_desc="")
+            ExpVideo.objects.create(experiment=cls.experiment, video=video, exp_video=f"v{i}")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_query_count_does_not_grow_with_related_items(self):
+        url = reverse("models:detail", args=[self.experiment.id])
+        # Experiment, its four relations and the experiment nav list
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Download 4")
+        self.assertContains(response, "PDF 4")
+
+        # The nav list is served from the cache afterwards
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_nav_cache_is_invalidated_on_save_and_delete(self):
+        self.assertEqual([exp["exp_title"] for exp in experiment_nav_list()], ["Growth", "Water treatment"])
+        Experiment.objects.create(exp_num=0, exp_title="Behaviour", exp_desc="")
+        self.assertEqual(experiment_nav_list()[0]["exp_title"], "Behaviour")
+        Experiment.objects.get(exp_num=0).delete()
+        self.assertEqual(len(experiment_nav_list()), 2)
+
+    def test_unknown_experiment_is_404(self):
+        response = self.client.get(reverse("models:detail", args=[9999]))
+        self.assertEqual(response.status_code, 404)
@@ -1,18 +1,19 @@
 from django.shortcuts import render
 
 # Create your views here.
+from django.db.models import Prefetch
 from django.http import HttpResponse
 from django.template import loader
-from .models import Experiment, XML
+from .context_processors import experiment_nav
+from .models import Experiment, XML, ExpDownload, ExpXML, ExpVideo, ExpPDF
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 
 
 def index(request):
     template = loader.get_template('models.html')
-    exp_list = Experiment.objects.order_by('exp_num')[:]
     context = {
-        'exp_list': exp_list,
+        **experiment_nav(request),
     }
     return HttpResponse(template.render(context, request))
 
@@ -32,18 +33,22 @@ def detail(request, exp_num):
 
 def detail(request, exp_num):
     template = loader.get_template('models/detail.html')
-    exp_list = Experiment.objects.order_by('exp_num')[:]
-    # Retrieve the experiment object using the exp_num
-    experiment = Experiment.objects.get(id=exp_num)
-    # Retrieve the related downloads for the experiment
+    # Retrieve the experiment object using the exp_num, with its downloads, xmls,
+    # videos and pdfs each fetched together with the linked item in a single query
+    experiment = get_object_or_404(Experiment.objects.prefetch_related(
+        Prefetch('expdownload_set', queryset=ExpDownload.objects.select_related('download')),
+        Prefetch('expxml_set', queryset=ExpXML.objects.select_related('xml')),
+        Prefetch('expvideo_set', queryset=ExpVideo.objects.select_related('video')),
+        Prefetch('exppdf_set', queryset=ExpPDF.objects.select_related('pdf')),
+    ), id=exp_num)
     downloads = experiment.expdownload_set.all()
-    # Retrieve the related xml for the experiment
     xmls = experiment.expxml_set.all()
     videos = experiment.expvideo_set.all()
     pdfs = experiment.exppdf_set.all()
     # return render(request, 'models/detail.html', {'experiment': experiment, 'downloads': downloads})
+    # The nav list is merged explicitly so the page does not depend on TEMPLATES' context_processors
     context = {
-        'exp_list': exp_list,
+        **experiment_nav(request),
         'experiment': experiment,
         'downloads': downloads,
         'xmls': xmls,